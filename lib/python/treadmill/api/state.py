@@ -3,66 +3,35 @@ from __future__ import absolute_import
 
 import logging
 
-import fnmatch
-import yaml
-
+from .. import cellcache
 from .. import context
 from .. import schema
-from .. import exc
-from .. import zknamespace as z
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _instance_state(name, host, running):
+    """Returns state of the instance."""
+    if host is None:
+        return 'pending'
+    if name in running:
+        return 'running'
+    return 'scheduled'
+
+
 class API(object):
     """Treadmill State REST api."""
 
     def __init__(self):
 
-        zkclient = context.GLOBAL.zk.conn
-
-        cell_state = {
-            'running': [],
-            'placement': {}
-        }
-
-        @exc.exit_on_unhandled
-        @zkclient.ChildrenWatch(z.path.running())
-        def _watch_running(running):
-            """Watch /running nodes."""
-            cell_state['running'] = set(running)
-            for name, item in cell_state.get('placement', {}).iteritems():
-                state = item['state'] = (
-                    'running' if name in cell_state['running'] else 'scheduled'
-                )
-                if item['host'] is not None:
-                    item['state'] = state
-            return True
-
-        @exc.exit_on_unhandled
-        @zkclient.DataWatch(z.path.placement())
-        def _watch_placement(placement, _stat, event):
-            """Watch /placement data."""
-            if placement is None or event == 'DELETED':
-                cell_state['placement'] = []
-                return True
-
-            updated_placement = {}
-            for row in yaml.load(placement):
-                instance, _before, after = tuple(row)
-                if after is None:
-                    state = 'pending'
-                else:
-                    state = 'scheduled'
-                    if instance in cell_state.get('running', set()):
-                        state = 'running'
-                updated_placement[instance] = {
-                    'state': state,
-                    'host': after,
-                }
-            cell_state['placement'] = updated_placement
-            return True
+        def _cache():
+            """Returns the cell cache, connects on first request.
+
+            Zookeeper connection must not be established before the server
+            processes are forked.
+            """
+            return cellcache.get_cache(context.GLOBAL.zk.conn)
 
         def _list(match):
             """List instances state."""
@@ -70,20 +39,29 @@ class API(object):
                 match = '*'
             if match.find('#') == -1:
                 match += '#*'
+            cache = _cache()
+            running = cache.get('running')
+            instances = cache.snapshot('placement', match)
             filtered = [
-                {'name': name, 'state': item['state'], 'host': item['host']}
-                for name, item in cell_state.get('placement', {}).iteritems()
-                if fnmatch.fnmatch(name, match)
+                {'name': name,
+                 'state': _instance_state(name, host, running),
+                 'host': host}
+                for name, host in instances.iteritems()
             ]
             return sorted(filtered, key=lambda item: item['name'])
 
         @schema.schema({'$ref': 'instance.json#/resource_id'})
         def get(rsrc_id):
             """Get instance state."""
-            data = cell_state['placement'].get(rsrc_id)
-            if data:
-                data.update({'name': rsrc_id})
-            return data
+            cache = _cache()
+            running = cache.get('running')
+            placement = cache.get('placement')
+            if rsrc_id not in placement:
+                return None
+            host = placement.get(rsrc_id)
+            return {'name': rsrc_id,
+                    'state': _instance_state(rsrc_id, host, running),
+                    'host': host}
 
         self.list = _list
         self.get = get
@@ -22,19 +22,27 @@ Upon change, appcfgmgr will do the following:
  - for each app that is not in the scheduled list, remove the symlink
  - trigger svscanctl -an, which will stop all apps that are no longer scheduled
    to run and will start all the new apps.
+
+Configured containers record the fingerprint of the instance (manifest hash
+and container unique name) in apps/<app_uniqueid>/fingerprint, full sync only
+configures the instances with missing or different fingerprint.
 """
 from __future__ import absolute_import
 
 import errno
 import glob
+import hashlib
 import logging
+import multiprocessing.pool
 import os
 import time
 
 from . import appmgr
+from . import exc
 from . import fs
 from . import idirwatch
 from . import subproc
+from . import supervisor
 
 from .appmgr import configure as app_cfg
 from .appmgr import abort as app_abort
@@ -45,18 +53,31 @@ _LOGGER = logging.getLogger(__name__)
 _HEARTBEAT_SEC = 30
 _WATCHDOG_TIMEOUT_SEC = _HEARTBEAT_SEC * 4
 
+_FINGERPRINT_FILE = 'fingerprint'
+
+# Time given to the supervisor to pick up the new instances.
+_SUPERVISOR_TIMEOUT_SEC = 5
+
+# Number of instances configured concurrently.
+DEFAULT_WORKERS = 4
+
+# Max number of cache events processed (and configured) at once.
+_EVENTS_BATCH = 50
+
 
 class AppCfgMgr(object):
     """Configure apps from the cache onto the node."""
 
     __slots__ = (
         'tm_env',
+        'workers',
         '_is_active',
     )
 
-    def __init__(self, root):
-        _LOGGER.info('init appcfgmgr: %s', root)
+    def __init__(self, root, workers=DEFAULT_WORKERS):
+        _LOGGER.info('init appcfgmgr: %s, workers: %d', root, workers)
         self.tm_env = appmgr.AppEnvironment(root=root)
+        self.workers = workers
         self._is_active = False
 
     @property
@@ -88,7 +109,18 @@ class AppCfgMgr(object):
 
         while True:
             if watch.wait_for_events(timeout=_HEARTBEAT_SEC):
-                watch.process_events(max_events=5)
+                results = watch.process_events(max_events=_EVENTS_BATCH)
+                # New instances are configured together, see _on_created.
+                created = [
+                    instance_name
+                    for event, _src, instance_name in results
+                    if (event is idirwatch.DirWatcherEvent.CREATED and
+                        instance_name is not None)
+                ]
+                if created and self._is_active:
+                    self._refresh_supervisor(
+                        instance_names=self._configure_instances(created)
+                    )
             else:
                 if self._is_active is True:
                     cached_files = glob.glob(
@@ -146,10 +178,14 @@ class AppCfgMgr(object):
     def _on_created(self, event_file):
         """Handle a new cached manifest event: configure an instance.
 
+        The instances of the processed events are configured all at once.
+
         :param event_file:
             Full path to an event file
         :type event_file:
             ``str``
+        :returns:
+            Name of the instance to configure or ``None``.
         """
         instance_name = os.path.basename(event_file)
 
@@ -173,8 +209,7 @@ class AppCfgMgr(object):
             return
 
         else:
-            self._configure(instance_name)
-            self._refresh_supervisor(instance_names=[instance_name])
+            return instance_name
 
     def _on_deleted(self, event_file):
         """Handle removal event of a cached manifest: terminate an instance.
@@ -226,7 +261,9 @@ class AppCfgMgr(object):
           - The cached entry and the running link must be for the same
             container (equal unique name). Otherwise, terminate it.
 
+        Running instances with unchanged fingerprint are not configured again.
         """
+        start_time = time.time()
         cached_files = glob.glob(os.path.join(self.tm_env.cache_dir, '*'))
         running_links = glob.glob(os.path.join(self.tm_env.running_dir, '*'))
 
@@ -248,6 +285,9 @@ class AppCfgMgr(object):
         }
         removed_instances = set()
         added_instances = set()
+        unchanged_instances = set()
+        # Container directories of the valid running links
+        running_containers = {}
 
         _LOGGER.info('running %r', running_instances)
         # If instance is extra, remove the symlink and force svscan to
@@ -281,16 +321,24 @@ class AppCfgMgr(object):
                 if container_name not in cached_containers:
                     self._terminate(instance_name)
                     removed_instances.add(instance_name)
+                else:
+                    running_containers[instance_name] = container_dir
 
-        # For all new apps, read the manifest and configure the app. When all
-        # apps are configured, force rescan again.
+        # For all new or changed apps, read the manifest and configure the
+        # app. When all apps are configured, force rescan again.
         for instance_name in cached_instances:
-            instance_link = os.path.join(
-                self.tm_env.running_dir,
-                instance_name
-            )
-            self._configure(instance_name)
-            added_instances.add(instance_name)
+            container_dir = running_containers.get(instance_name)
+            if (container_dir is not None and
+                    self._is_configured(instance_name, container_dir)):
+                unchanged_instances.add(instance_name)
+            else:
+                added_instances.add(instance_name)
+
+        configured_instances = self._configure_instances(added_instances)
+        if len(configured_instances) != len(added_instances):
+            # Failed instances are aborted, they are no longer running.
+            running_instances -= added_instances - configured_instances
+        added_instances = configured_instances
 
         _LOGGER.debug('End resuld: %r / %r - %r + %r',
                       cached_containers,
@@ -303,15 +351,69 @@ class AppCfgMgr(object):
         _LOGGER.info('running post cleanup: %r', running_instances)
         self._refresh_supervisor(instance_names=running_instances)
 
+        _LOGGER.info('Synchronized in %.3fs: %d configured, %d unchanged, '
+                     '%d terminated',
+                     time.time() - start_time,
+                     len(added_instances),
+                     len(unchanged_instances),
+                     len(removed_instances))
+
+    def _is_configured(self, instance_name, container_dir):
+        """Check if the container is configured with the cached manifest."""
+        event_file = os.path.join(self.tm_env.cache_dir, instance_name)
+        try:
+            with open(os.path.join(container_dir, _FINGERPRINT_FILE)) as f:
+                configured = f.read()
+            current = _fingerprint(event_file,
+                                   os.path.basename(container_dir))
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                return False
+            raise
+
+        return configured == current
+
+    def _configure_instances(self, instance_names):
+        """Configures the instances, up to self.workers concurrently.
+
+        :returns:
+            ``set`` of successfully configured instances.
+        """
+        instance_names = list(instance_names)
+        workers = min(self.workers, len(instance_names))
+        if workers <= 1:
+            results = [
+                self._configure(instance_name)
+                for instance_name in instance_names
+            ]
+        else:
+            pool = multiprocessing.pool.ThreadPool(workers)
+            try:
+                results = pool.map(self._configure, instance_names)
+            finally:
+                pool.close()
+                pool.join()
+
+        return set(
+            instance_name
+            for instance_name, configured in zip(instance_names, results)
+            if configured
+        )
+
     def _configure(self, instance_name):
         """Configures and starts the instance based on instance cached event.
 
         - Runs app_configure --approot <rootdir> cache/<instance>
 
+        Failures are handled (the instance is aborted), so that instances can
+        be configured concurrently.
+
         :param instance_name:
             Name of the instance to configure
         :type instance_name:
             ``str``
+        :returns:
+            ``True`` if the instance was configured and scheduled.
         """
         event_file = os.path.join(
             self.tm_env.cache_dir,
@@ -320,17 +422,36 @@ class AppCfgMgr(object):
 
         try:
             _LOGGER.info('Configuring: %r', instance_name)
+            start_time = time.time()
             container_dir = app_cfg.configure(self.tm_env, event_file)
+            if container_dir is None:
+                # Event file is gone, nothing to schedule.
+                return False
+
+            configured_time = time.time()
             app_cfg.schedule(
                 container_dir,
                 os.path.join(self.tm_env.running_dir, instance_name)
             )
+            with open(os.path.join(container_dir, _FINGERPRINT_FILE),
+                      'w') as f:
+                f.write(_fingerprint(event_file,
+                                     os.path.basename(container_dir)))
+
+            _LOGGER.info('Configured %r in %.3fs: configure %.3fs, '
+                         'schedule %.3fs',
+                         instance_name,
+                         time.time() - start_time,
+                         configured_time - start_time,
+                         time.time() - configured_time)
+            return True
 
         except Exception as err:  # pylint: disable=W0703
             _LOGGER.exception('Error configuring %r (%r)',
                               instance_name, event_file)
             app_abort.abort(self.tm_env, event_file, err)
             fs.rm_safe(event_file)
+            return False
 
     def _terminate(self, instance_name):
         """Removes application from the supervised running list.
@@ -386,33 +507,22 @@ class AppCfgMgr(object):
                 self.tm_env.running_dir
             ]
         )
-        for instance_name in instance_names:
-            _LOGGER.info('Starting %r', instance_name)
-            instance_run_link = os.path.join(
-                self.tm_env.running_dir,
-                instance_name
-            )
-            # Wait for the supervisor to pick up the new instance.
-            for _ in range(10):
-                res = subproc.call(
-                    [
-                        's6-svok',
-                        instance_run_link,
-                    ]
+        _LOGGER.info('Starting %r', instance_names)
+        # Bring the instances up, once the supervisor picks them up.
+        not_started = supervisor.control_services(
+            [
+                os.path.join(self.tm_env.running_dir, instance_name)
+                for instance_name in instance_names
+            ],
+            'uO',
+            timeout=_SUPERVISOR_TIMEOUT_SEC
+        )
+        if not_started:
+            raise exc.NodeSetupError(
+                'Supervisor has not picked up %r' % sorted(
+                    os.path.basename(instance_run_link)
+                    for instance_run_link in not_started
                 )
-                if res == 0:
-                    break
-                else:
-                    _LOGGER.warn('Supervisor has not picked up %r yet',
-                                 instance_name)
-                    time.sleep(0.5)
-            # Bring the instance up.
-            subproc.check_call(
-                [
-                    's6-svc',
-                    '-uO',
-                    instance_run_link,
-                ]
             )
 
     @staticmethod
@@ -431,3 +541,13 @@ class AppCfgMgr(object):
                 raise
 
         return container_dir
+
+
+def _fingerprint(event_file, container_name):
+    """Fingerprint of the instance: manifest hash and container unique name.
+    """
+    digest = hashlib.sha1(container_name)
+    with open(event_file) as f:
+        digest.update(f.read())
+
+    return '%s %s\n' % (container_name, digest.hexdigest())
@@ -8,6 +8,7 @@ import logging
 import os
 import shutil
 import tempfile
+import time
 
 import yaml
 
@@ -48,6 +49,7 @@ def configure(tm_env, event):
     # R0915: Need to refactor long function into smaller pieces.
     #
     # pylint: disable=R0915
+    start_time = time.time()
 
     # Load the app from the event
     try:
@@ -109,6 +111,8 @@ def configure(tm_env, event):
     with open(app_yml, 'w') as f:
         yaml.dump(manifest_data, stream=f)
 
+    manifest_time = time.time()
+
     # Generate resources requests
 
     # Cgroup
@@ -139,6 +143,8 @@ def configure(tm_env, event):
         else:
             network_client.update(uniq_name, network_req)
 
+    resources_time = time.time()
+
     # Mark the container as defaulting to down state
     utils.touch(os.path.join(container_dir, 'down'))
 
@@ -167,6 +173,13 @@ def configure(tm_env, event):
                         service=app.name, proid=None,
                         cmds=[finish_cmd])
 
+    _LOGGER.info('Configured %r: manifest %.3fs, resources %.3fs, '
+                 'scripts %.3fs',
+                 uniq_name,
+                 manifest_time - start_time,
+                 resources_time - manifest_time,
+                 time.time() - resources_time)
+
     return container_dir
 
 
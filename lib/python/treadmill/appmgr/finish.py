@@ -2,6 +2,8 @@
 
 from __future__ import absolute_import
 
+import collections
+import contextlib
 import errno
 import glob
 import importlib
@@ -11,6 +13,7 @@ import shutil
 import signal
 import socket
 import subprocess
+import time
 
 import yaml
 import kazoo
@@ -65,6 +68,7 @@ def finish(tm_env, zkclient, container_dir):
     watchdog = tm_env.watchdogs.create(watchdog_name, '5m',
                                        'Cleanup of %r stalled' % container_dir)
 
+    start_time = time.time()
     try:
         subproc.check_call(['s6-svc', '-d', container_dir])
         subproc.check_call(['s6-svwait', '-d', container_dir])
@@ -79,6 +83,9 @@ def finish(tm_env, zkclient, container_dir):
         else:
             raise
 
+    _LOGGER.info('Stopped %r: svwait %.3fs',
+                 container_dir, time.time() - start_time)
+
     app = None
     has_state = False
 
@@ -164,7 +171,8 @@ def finish(tm_env, zkclient, container_dir):
         appevents.post(tm_env.app_events_dir,
                        app.name, event, eventmsg, exitinfo)
 
-    _LOGGER.info('Finished cleanup: %s', app.name)
+    _LOGGER.info('Finished cleanup: %s, %.3fs',
+                 app.name, time.time() - start_time)
 
 
 def _cleanup(tm_env, zkclient, container_dir, app):
@@ -188,79 +196,99 @@ def _cleanup(tm_env, zkclient, container_dir, app):
     # FIXME(boysson): Should we use `kill_apps_in_cgroup` instead?
     _kill_apps_by_root(rootdir)
 
-    # Setup the archive filename that will hold this container's data
-    filetime = utils.datetime_utcnow().strftime('%Y%m%d_%H%M%S%f')
-    archive_filename = os.path.join(
-        container_dir,
-        '{instance_name}_{hostname}_{timestamp}.tar'.format(
-            instance_name=appmgr.appname_task_id(app.name),
-            hostname=sysinfo.hostname(),
-            timestamp=filetime
+    timings = collections.defaultdict(float)
+
+    with _timer(timings, 'archive'):
+        # Setup the archive filename that will hold this container's data
+        filetime = utils.datetime_utcnow().strftime('%Y%m%d_%H%M%S%f')
+        archive_filename = os.path.join(
+            container_dir,
+            '{instance_name}_{hostname}_{timestamp}.tar'.format(
+                instance_name=appmgr.appname_task_id(app.name),
+                hostname=sysinfo.hostname(),
+                timestamp=filetime
+            )
         )
-    )
 
-    # Tar up container root filesystem if archive list is in manifest
-    if getattr(app, 'archive', []):
+        # Tar up container root filesystem if archive list is in manifest
+        if getattr(app, 'archive', []):
+            try:
+                localdisk = localdisk_client.get(unique_name)
+                fs.archive_filesystem(
+                    localdisk['block_dev'],
+                    rootdir,
+                    archive_filename,
+                    app.archive
+                )
+            except services.ResourceServiceError:
+                _LOGGER.warning('localdisk never allocated')
+            except subprocess.CalledProcessError:
+                _LOGGER.exception('Unable to archive root device of %r',
+                                  unique_name)
+            except:  # pylint: disable=W0702
+                _LOGGER.exception('Unknow exception while archiving %r',
+                                  unique_name)
+
+    with _timer(timings, 'release'):
+        # Destroy the volume
         try:
-            localdisk = localdisk_client.get(unique_name)
-            fs.archive_filesystem(
-                localdisk['block_dev'],
-                rootdir,
-                archive_filename,
-                app.archive
+            localdisk = localdisk_client.delete(unique_name)
+        except (IOError, OSError) as err:
+            if err.errno == errno.ENOENT:
+                pass
+            else:
+                raise
+
+        if not app.shared_network:
+            _cleanup_network(tm_env, app, network_client)
+
+    with _timer(timings, 'archive'):
+        # Add metrics to archive
+        rrd_file = os.path.join(
+            tm_env.metrics_dir,
+            'apps',
+            '{name}-{instanceid}-{uniqueid}.rrd'.format(
+                name=app.app,
+                instanceid=app.task,
+                uniqueid=app.uniqueid,
             )
-        except services.ResourceServiceError:
-            _LOGGER.warning('localdisk never allocated')
-        except subprocess.CalledProcessError:
-            _LOGGER.exception('Unable to archive root device of %r',
-                              unique_name)
-        except:  # pylint: disable=W0702
-            _LOGGER.exception('Unknow exception while archiving %r',
-                              unique_name)
+        )
+        rrdutils.flush_noexc(rrd_file)
+        _copy_metrics(rrd_file, container_dir)
 
-    # Destroy the volume
-    try:
-        localdisk = localdisk_client.delete(unique_name)
-    except (IOError, OSError) as err:
-        if err.errno == errno.ENOENT:
-            pass
-        else:
-            raise
+    with _timer(timings, 'release'):
+        # Cleanup our cgroup resources
+        try:
+            cgroup_client.delete(unique_name)
+        except (IOError, OSError) as err:
+            if err.errno == errno.ENOENT:
+                pass
+            else:
+                raise
 
-    if not app.shared_network:
-        _cleanup_network(tm_env, app, network_client)
-
-    # Add metrics to archive
-    rrd_file = os.path.join(
-        tm_env.metrics_dir,
-        'apps',
-        '{name}-{instanceid}-{uniqueid}.rrd'.format(
-            name=app.app,
-            instanceid=app.task,
-            uniqueid=app.uniqueid,
-        )
-    )
-    rrdutils.flush_noexc(rrd_file)
-    _copy_metrics(rrd_file, container_dir)
+    with _timer(timings, 'archive'):
+        # Append or create the tarball with folders outside of container
+        # Compress and send the tarball to HCP
+        try:
+            archive_filename = fs.tar(sources=container_dir,
+                                      target=archive_filename,
+                                      compression='gzip').name
+            _send_container_archive(zkclient, app, archive_filename)
+        except:  # pylint: disable=W0702
+            _LOGGER.exception("Failed to update archive")
+
+    _LOGGER.info('Cleaned up %r: archive %.3fs, release %.3fs',
+                 unique_name, timings['archive'], timings['release'])
 
-    # Cleanup our cgroup resources
-    try:
-        cgroup_client.delete(unique_name)
-    except (IOError, OSError) as err:
-        if err.errno == errno.ENOENT:
-            pass
-        else:
-            raise
 
-    # Append or create the tarball with folders outside of container
-    # Compress and send the tarball to HCP
+@contextlib.contextmanager
+def _timer(timings, phase):
+    """Add the time spent in the block to the timing of the phase."""
+    start_time = time.time()
     try:
-        archive_filename = fs.tar(sources=container_dir,
-                                  target=archive_filename,
-                                  compression='gzip').name
-        _send_container_archive(zkclient, app, archive_filename)
-    except:  # pylint: disable=W0702
-        _LOGGER.exception("Failed to update archive")
+        yield
+    finally:
+        timings[phase] += time.time() - start_time
 
 
 def _cleanup_network(tm_env, app, network_client):
@@ -0,0 +1,308 @@
+"""Process wide, watch driven cache of the cell state.
+
+The cache keeps the following collections, each a dict of name to value:
+
+    configured, scheduled, running - app instance -> None
+    placement                      - app instance -> server (None if pending)
+    endpoints                      - <proid>.<instance>:<endpoint> -> hostport
+
+Each collection is loaded on first use and kept up to date by a single
+Zookeeper watch per path, regardless of the number of clients. Clients
+subscribe with a pattern and are notified with the changes matching the
+pattern only.
+
+Every change of the collection gets a sequence number. Recent changes are
+kept in a bounded change log, so clients which reconnect can resume from the
+last sequence number they have seen, within the same cache epoch.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import threading
+import time
+
+from . import exc
+from . import nameindex
+from . import placement as placement_shards
+from . import zknamespace as z
+from . import zkutils
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Collections mirroring children of a Zookeeper node.
+_CHILDREN_PATHS = {
+    'configured': zkutils.CONFIG,
+    'scheduled': z.SCHEDULED,
+    'running': z.RUNNING,
+}
+
+COLLECTIONS = frozenset(list(_CHILDREN_PATHS) + ['placement', 'endpoints'])
+
+# Number of changes of the collection kept for resuming clients.
+CHANGELOG_SIZE = 1000
+
+_CACHES = dict()
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(zkclient):
+    """Returns cell cache of the Zookeeper client, creates if needed."""
+    with _CACHES_LOCK:
+        if zkclient not in _CACHES:
+            _CACHES[zkclient] = CellCache(zkclient)
+        return _CACHES[zkclient]
+
+
+def _match(changed, removed, pattern):
+    """Returns (changed, removed) filtered by the pattern."""
+    if pattern is None:
+        return changed, removed
+    return (
+        dict((name, changed[name])
+             for name in nameindex.filter_names(changed, pattern)),
+        nameindex.filter_names(removed, pattern)
+    )
+
+
+class CellCache(object):
+    """Cell state shared by all clients of the process.
+
+    Subscriber callbacks are invoked with (seq, changed, removed), seq is the
+    sequence number of the change, changed is dict of name to value and
+    removed is list of names.
+    """
+    __slots__ = (
+        'zkclient',
+        'epoch',
+        'collections',
+        'indexes',
+        'seqs',
+        'changelogs',
+        'subscribers',
+        'lock',
+        '_placement_watch',
+    )
+
+    def __init__(self, zkclient):
+        self.zkclient = zkclient
+        # Sequence numbers are valid only within the epoch of the cache.
+        self.epoch = int(time.time() * 1000)
+        # Cached collections, collection -> {name: value}.
+        self.collections = dict()
+        # Sorted names of the collections, collection -> NameIndex.
+        self.indexes = dict()
+        # Sequence number of the last change, collection -> seq.
+        self.seqs = dict()
+        # Recent changes, collection -> deque of (seq, changed, removed).
+        self.changelogs = dict()
+        # Subscribers, collection -> {id: (pattern, callback)}.
+        self.subscribers = dict()
+        self.lock = threading.RLock()
+        self._placement_watch = None
+
+    def get(self, collection):
+        """Returns the collection, loads it on first use.
+
+        The returned dict is updated in place and must not be modified.
+        """
+        with self.lock:
+            if collection not in self.collections:
+                self._start(collection)
+            return self.collections[collection]
+
+    def snapshot(self, collection, pattern=None):
+        """Returns copy of the collection items matching the pattern."""
+        with self.lock:
+            current = self.get(collection)
+            if pattern is None:
+                return dict(current)
+            return dict((name, current[name])
+                        for name in self.indexes[collection].match(pattern))
+
+    def subscribe(self, collection, callback, pattern=None):
+        """Subscribe to the collection changes matching the pattern.
+
+        Returns (subscription, seq, snapshot), snapshot is the current
+        content of the collection matching the pattern as of change seq,
+        subsequent changes are passed to the callback.
+        """
+        with self.lock:
+            snapshot = self.snapshot(collection, pattern)
+            subscription = (collection, object())
+            self.subscribers.setdefault(collection, {})[subscription[1]] = (
+                pattern, callback
+            )
+            return subscription, self.seqs[collection], snapshot
+
+    def changes(self, collection, since, pattern=None):
+        """Returns changes matching the pattern which follow change since.
+
+        Returns list of (seq, changed, removed), None if the changes are no
+        longer in the change log.
+        """
+        with self.lock:
+            self.get(collection)
+            changelog = self.changelogs[collection]
+            if since > self.seqs[collection]:
+                return None
+            if since < self.seqs[collection] - len(changelog):
+                return None
+
+            result = []
+            for seq, changed, removed in changelog:
+                if seq <= since:
+                    continue
+                matched_changed, matched_removed = _match(changed, removed,
+                                                          pattern)
+                if matched_changed or matched_removed:
+                    result.append((seq, matched_changed, matched_removed))
+            return result
+
+    def unsubscribe(self, subscription):
+        """Remove the subscription."""
+        collection, key = subscription
+        with self.lock:
+            self.subscribers.get(collection, {}).pop(key, None)
+
+    def _start(self, collection):
+        """Load the collection and start watching it."""
+        _LOGGER.info('Starting cell cache collection: %s', collection)
+        self.collections[collection] = dict()
+        self.indexes[collection] = nameindex.NameIndex()
+        self.seqs[collection] = 0
+        self.changelogs[collection] = collections.deque(maxlen=CHANGELOG_SIZE)
+        if collection in _CHILDREN_PATHS:
+            self._watch_children(collection, _CHILDREN_PATHS[collection])
+        elif collection == 'placement':
+            self._placement_watch = placement_shards.PlacementWatch(
+                self.zkclient,
+                on_change=lambda changed, removed: self.update(
+                    'placement', changed, removed)
+            )
+            self._placement_watch.start()
+        elif collection == 'endpoints':
+            self._watch_endpoints()
+        else:
+            del self.collections[collection]
+            del self.indexes[collection]
+            del self.seqs[collection]
+            del self.changelogs[collection]
+            raise KeyError('Unknown cell cache collection: %s' % collection)
+
+    def _watch_children(self, collection, path):
+        """Mirror children of the path in the collection."""
+        @exc.exit_on_unhandled
+        @self.zkclient.ChildrenWatch(path)
+        def _watch(children):
+            """Apply children changes."""
+            with self.lock:
+                current = self.collections[collection]
+                target = set(children)
+                self.update(
+                    collection,
+                    dict((name, None) for name in target
+                         if name not in current),
+                    [name for name in current if name not in target]
+                )
+            return True
+
+    def _watch_endpoints(self):
+        """Mirror endpoints of all proids."""
+        proids = set()
+
+        @exc.exit_on_unhandled
+        @self.zkclient.ChildrenWatch(z.ENDPOINTS)
+        def _watch_proids(children):
+            """Watch endpoints of new proids."""
+            # Watch of the deleted proid node is stopped by kazoo without
+            # notification, endpoints of the proid are removed here.
+            for proid in proids - set(children):
+                proids.discard(proid)
+                prefix = proid + '.'
+                with self.lock:
+                    self.update(
+                        'endpoints', {},
+                        [name for name in self.collections['endpoints']
+                         if name.startswith(prefix)]
+                    )
+
+            for proid in set(children) - proids:
+                proids.add(proid)
+                self._watch_proid_endpoints(proid)
+            return True
+
+    def _watch_proid_endpoints(self, proid):
+        """Mirror endpoints of the proid."""
+        proid_path = z.join_zookeeper_path(z.ENDPOINTS, proid)
+        prefix = proid + '.'
+        # Endpoints of the proid in the collection, name -> node mzxid.
+        versions = dict()
+
+        def _path(name):
+            """Returns path of the endpoint node."""
+            return z.join_zookeeper_path(proid_path, name[len(prefix):])
+
+        @exc.exit_on_unhandled
+        @self.zkclient.ChildrenWatch(proid_path)
+        def _watch(children):
+            """Apply endpoint changes, fetch new and modified endpoints."""
+            target = set(prefix + child for child in children)
+            removed = [name for name in versions if name not in target]
+            for name in removed:
+                del versions[name]
+
+            # Endpoints recreated or modified since they were fetched are
+            # fetched again.
+            fetch = [name for name in target if name not in versions]
+            paths = dict((_path(name), name) for name in versions)
+            for path, metadata in zkutils.exists_many(self.zkclient,
+                                                      paths.keys()):
+                if metadata is None:
+                    removed.append(paths[path])
+                    del versions[paths[path]]
+                elif metadata.mzxid != versions[paths[path]]:
+                    fetch.append(paths[path])
+
+            # New endpoints are fetched with pipelined requests.
+            paths = dict((_path(name), name) for name in fetch)
+            changed = dict()
+            for path, hostport, metadata in zkutils.get_many_stat(
+                    self.zkclient, paths.keys()):
+                changed[paths[path]] = hostport
+                versions[paths[path]] = metadata.mzxid
+
+            for name in fetch:
+                if name in versions and name not in changed:
+                    removed.append(name)
+                    del versions[name]
+
+            self.update('endpoints', changed, removed)
+            return True
+
+    def update(self, collection, changed, removed):
+        """Apply changes to the collection and notify subscribers."""
+        if not changed and not removed:
+            return
+
+        with self.lock:
+            current = self.collections[collection]
+            for name in removed:
+                current.pop(name, None)
+            current.update(changed)
+            self.indexes[collection].update(changed, removed)
+
+            seq = self.seqs[collection] + 1
+            self.seqs[collection] = seq
+            self.changelogs[collection].append((seq, changed, removed))
+
+            for pattern, callback in self.subscribers.get(collection,
+                                                          {}).values():
+                matched_changed, matched_removed = _match(changed, removed,
+                                                          pattern)
+                if matched_changed or matched_removed:
+                    try:
+                        callback(seq, matched_changed, matched_removed)
+                    except Exception:  # pylint: disable=W0703
+                        _LOGGER.exception('Error notifying subscriber.')
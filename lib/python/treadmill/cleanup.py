@@ -0,0 +1,149 @@
+"""Finishes the containers linked in the cleanup directory.
+
+Containers are finished by a pool of long lived worker threads, all sharing
+the Zookeeper session of the service, so that a burst of terminated
+containers is cleaned up concurrently.
+
+A failed cleanup stops the service once the in-flight cleanups are done, the
+cleanup link is left in place and retried when the service is restarted.
+"""
+from __future__ import absolute_import
+
+import glob
+import logging
+import multiprocessing.pool
+import os
+import threading
+import time
+
+from . import appmgr
+from . import exc
+from . import idirwatch
+
+from .appmgr import finish as app_finish
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# FIXME(boysson): This extremely high timeout value comes from the fact that we
+#                 have a very high watchdog value in appmgr.finish.
+_WATCHDOG_HEARTBEAT_SEC = 5 * 60
+
+# Wait for events while cleanups are in flight, so that failures are noticed
+# early.
+_BUSY_WAIT_SEC = 1
+
+# Maximum number of cleanup request to dispatch per cycle. Requests are
+# finished by the workers, the main loop only queues them.
+_MAX_REQUEST_PER_CYCLE = 50
+
+# Number of containers finished concurrently.
+DEFAULT_WORKERS = 4
+
+
+class Cleanup(object):
+    """Finish the containers linked in the cleanup directory."""
+
+    __slots__ = (
+        'tm_env',
+        'zkclient',
+        'pool',
+        'pending',
+        'failed',
+        '_lock',
+    )
+
+    def __init__(self, root, zkclient, workers=DEFAULT_WORKERS):
+        _LOGGER.info('init cleanup: %s, workers: %d', root, workers)
+        self.tm_env = appmgr.AppEnvironment(root=root)
+        self.zkclient = zkclient
+        self.pool = multiprocessing.pool.ThreadPool(workers)
+        # Cleanup links queued or being finished.
+        self.pending = set()
+        # Cleanup links which failed to finish.
+        self.failed = set()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        """Name of the Cleanup service.
+        """
+        return self.__class__.__name__
+
+    def run(self):
+        """Dispatch cleanup links to the workers until a cleanup fails."""
+        watchdog_lease = self.tm_env.watchdogs.create(
+            name='svc:{svc_name}'.format(svc_name=self.name),
+            timeout='{hb:d}s'.format(hb=_WATCHDOG_HEARTBEAT_SEC),
+            content='Service {svc_name!r} failed'.format(
+                svc_name=self.name),
+        )
+
+        watcher = idirwatch.DirWatcher(self.tm_env.cleanup_dir)
+        watcher.on_created = self._on_created
+
+        # Before starting, capture all already pending cleanups
+        leftover = glob.glob(os.path.join(self.tm_env.cleanup_dir, '*'))
+        # and "fake" a created event on all of them
+        for pending_cleanup in leftover:
+            self._on_created(pending_cleanup)
+
+        while not self.failed:
+            if self.pending:
+                loop_timeout = _BUSY_WAIT_SEC
+            else:
+                loop_timeout = _WATCHDOG_HEARTBEAT_SEC / 2
+
+            if watcher.wait_for_events(timeout=loop_timeout):
+                watcher.process_events(max_events=_MAX_REQUEST_PER_CYCLE)
+
+            # Heartbeat
+            watchdog_lease.heartbeat()
+
+        _LOGGER.critical('Cleanup failed: %r, in-flight: %d',
+                         sorted(self.failed), len(self.pending))
+        self.pool.close()
+        self.pool.join()
+
+        raise exc.TreadmillError('Cleanup failed: %r' % sorted(self.failed))
+
+    def _on_created(self, path):
+        """Queue the cleanup of the new cleanup link."""
+        fullpath = os.path.join(self.tm_env.cleanup_dir, path)
+        if not os.path.islink(fullpath):
+            _LOGGER.info('Ignore - not a link: %s', fullpath)
+            return
+
+        with self._lock:
+            if self.failed or fullpath in self.pending:
+                return
+            self.pending.add(fullpath)
+            backlog = len(self.pending)
+
+        container_dir = os.readlink(fullpath)
+        _LOGGER.info('Cleanup: %s => %s, backlog: %d',
+                     path, container_dir, backlog)
+        self.pool.apply_async(self._finish, (fullpath, container_dir))
+
+    def _finish(self, fullpath, container_dir):
+        """Finish the container, invoked on the worker threads."""
+        start_time = time.time()
+        try:
+            if os.path.exists(container_dir):
+                app_finish.finish(self.tm_env, self.zkclient, container_dir)
+            else:
+                _LOGGER.info('Container dir does not exist: %r',
+                             container_dir)
+
+            os.unlink(fullpath)
+            _LOGGER.info('Cleanup done: %s, %.3fs',
+                         container_dir, time.time() - start_time)
+
+        except Exception:  # pylint: disable=W0703
+            _LOGGER.exception('Fatal error finishing %r.', container_dir)
+            with self._lock:
+                self.failed.add(fullpath)
+
+        finally:
+            with self._lock:
+                self.pending.discard(fullpath)
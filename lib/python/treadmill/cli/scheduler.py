@@ -27,6 +27,7 @@ def view_group(parent):
     ])
 
     do_reschedule = set()
+    use_snapshot = set()
 
     def _print_frame(output):
         """Prints dataframe."""
@@ -42,13 +43,14 @@ def view_group(parent):
         treadmill_sched.DIMENSION_COUNT = 3
         cell_master = master.Master(context.GLOBAL.zk.conn,
                                     context.GLOBAL.cell)
-        cell_master.load_buckets()
-        cell_master.load_cell()
-        cell_master.load_servers(readonly=True)
-        cell_master.load_allocations()
-        cell_master.load_strategies()
-        cell_master.load_apps(readonly=True)
-        cell_master.load_identity_groups(restore=True)
+        if not (use_snapshot and cell_master.load_snapshot()):
+            cell_master.load_buckets()
+            cell_master.load_cell()
+            cell_master.load_servers(readonly=True)
+            cell_master.load_allocations()
+            cell_master.load_strategies()
+            cell_master.load_apps(readonly=True)
+            cell_master.load_identity_groups(restore=True)
 
         if do_reschedule:
             cell_master.cell.schedule()
@@ -57,11 +59,15 @@ def view_group(parent):
 
     @parent.group()
     @click.option('--reschedule', is_flag=True, default=False)
+    @click.option('--snapshot', is_flag=True, default=False,
+                  help='Load scheduler snapshot instead of cell data.')
     @on_exceptions
-    def view(reschedule):
+    def view(reschedule, snapshot):
         """Examine scheduler state."""
         if reschedule:
             do_reschedule.add(1)
+        if snapshot:
+            use_snapshot.add(1)
 
     @view.command()
     @click.option('--features/--no-features', is_flag=True, default=False)
@@ -76,6 +82,14 @@ def view_group(parent):
         else:
             _print_frame(output)
 
+    @view.command()
+    @on_exceptions
+    def buckets():
+        """View buckets capacity report."""
+        cell_master = _load()
+        output = reports.buckets(cell_master.cell)
+        _print_frame(output)
+
     @view.command()
     @on_exceptions
     def apps():
@@ -105,6 +119,7 @@ def view_group(parent):
 
     del apps
     del servers
+    del buckets
     del allocs
     del queue
 
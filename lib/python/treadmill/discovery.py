@@ -5,11 +5,14 @@ from __future__ import absolute_import
 import os
 
 import Queue
-import fnmatch
 import logging
 
 import kazoo
 
+from . import nameindex
+from . import zkutils
+
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -28,6 +31,8 @@ class Discovery(object):
 
         self.state = set()
         self.zkclient = zkclient
+        # Resolved endpoints, endpoint -> (hostport, node mzxid).
+        self.hostports = dict()
 
     def iteritems(self, block=True, timeout=None):
         """List matching endpoints. """
@@ -60,13 +65,15 @@ class Discovery(object):
         created = match - set(self.state)
         deleted = set(self.state) - match
 
+        hostports = self.resolve_endpoints(created)
         for endpoint in created:
             _LOGGER.debug('added endpoint: %s', endpoint)
-            hostport = self.resolve_endpoint(endpoint)
-            self.queue.put(('.'.join([self.prefix, endpoint]), hostport))
+            self.queue.put(('.'.join([self.prefix, endpoint]),
+                            hostports[endpoint]))
 
         for endpoint in deleted:
             _LOGGER.debug('deleted endpoint: %s', endpoint)
+            self.hostports.pop(endpoint, None)
             self.queue.put(('.'.join([self.prefix, endpoint]), None))
 
         self.state = match
@@ -82,9 +89,8 @@ class Discovery(object):
     def get_endpoints(self):
         """Returns the current list of endpoints in host:port format"""
         endpoints = self.get_endpoints_zk()
-        hostports = [self.resolve_endpoint(endpoint)
-                     for endpoint in endpoints]
-        return hostports
+        hostports = self.resolve_endpoints(endpoints, validate=True)
+        return [hostports[endpoint] for endpoint in endpoints]
 
     def get_endpoints_zk(self, watch_cb=None):
         """Returns the current list of endpoints."""
@@ -95,8 +101,7 @@ class Discovery(object):
                 endpoints_path, watch=watch_cb
             )
 
-            match = set([endpoint for endpoint in endpoints
-                         if fnmatch.fnmatch(endpoint, full_pattern)])
+            match = set(nameindex.filter_names(endpoints, full_pattern))
         except kazoo.exceptions.NoNodeError:
             self.zkclient.exists(endpoints_path, watch=watch_cb)
             match = set()
@@ -113,6 +118,38 @@ class Discovery(object):
 
         return hostport
 
+    def resolve_endpoints(self, endpoints, validate=False):
+        """Resolves endpoints to hostports, returns dict endpoint -> hostport.
+
+        Hostports are fetched with pipelined requests and cached. Cached
+        hostports are used as is, unless validate is set, then only the
+        endpoints which node version changed are fetched again. Endpoints
+        which do not exist resolve to None.
+        """
+        paths = dict((os.path.join('/endpoints', self.prefix, endpoint),
+                      endpoint)
+                     for endpoint in endpoints)
+
+        fetch = [path for path, endpoint in paths.iteritems()
+                 if endpoint not in self.hostports]
+        if validate:
+            cached = [path for path, endpoint in paths.iteritems()
+                      if endpoint in self.hostports]
+            for path, metadata in zkutils.exists_many(self.zkclient, cached):
+                endpoint = paths[path]
+                if metadata is None:
+                    del self.hostports[endpoint]
+                elif metadata.mzxid != self.hostports[endpoint][1]:
+                    del self.hostports[endpoint]
+                    fetch.append(path)
+
+        for path, hostport, metadata in zkutils.get_many_stat(self.zkclient,
+                                                              fetch):
+            self.hostports[paths[path]] = (hostport, metadata.mzxid)
+
+        return dict((endpoint, self.hostports.get(endpoint, (None,))[0])
+                    for endpoint in endpoints)
+
 
 def iterator(zkclient, pattern, endpoint, watch):
     """Returns app discovery iterator based on native zk discovery."""
@@ -4,17 +4,14 @@ A WebSocket handler for Treadmill's discovery
 
 from __future__ import absolute_import
 
-import os
-
 import json
 import logging
 import traceback
 
+from treadmill import cellcache
 from treadmill import exc
-from treadmill import discovery
 from treadmill import utils
 from treadmill import websocket
-from treadmill import zkutils
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -35,8 +32,13 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
         self.cell = None
         self.pattern = None
         self.endpoint = None
-        # internal attributes
+        self.since = None
+        self.epoch = None
+        # internal attributes, endpoints matching the pattern, kept by cell
+        # cache
         self.endpoints = None
+        self.seq = None
+        self.subscription = None
 
     def on_message(self, jmessage):
         """This method is called per client, for every message received.
@@ -52,122 +54,132 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
                     - endpoint: the name of a specific endpoint
                     - deltas: option to only send deltas, not a full image
                       of the state, i.e. only applications that have been added
+                    - epoch, since: epoch and seq of the last message
+                      received, resume sending deltas after since, instead
+                      of sending SOW; only with deltas
 
             Example return objects:
 
             SOW: {"endpoints": [{"name": "treadmlp.discovery#0000076619:ws",
             "hostport": "zzz.xxx.com:60755"}, {"name":
             "treadmlp.discovery#0000077140:http", "hostport":
-            "zzz.xxx.com:56107"}], "sow": true}
+            "zzz.xxx.com:56107"}], "sow": true, "seq": 41, "epoch":
+            1476654321000}
 
-            Deltas: {"deleted": ["test1/user1.foo#0000002936"], "state":
-            "running", "sow": false}
+            Deltas: {"deleted": [{"name": "treadmlp.discovery#0000076619:ws",
+            "hostport": "zzz.xxx.com:60755"}], "created": [], "sow": false,
+            "seq": 42, "epoch": 1476654321000}
         """
         try:
             message = json.loads(jmessage)
             _LOGGER.debug('message: %s', message)
 
             self.set_attributes(message)
-
-            _LOGGER.info('Sending endpoints SOW for %s/%s back to the client',
-                         self.cell, self.pattern)
-            self.send_current_endpoints(True)
-
-            path = self.get_node_path()
-
-            _LOGGER.info('Watching children under path: %s', path)
-            self.zkclient.get_children(path, self.endpoint_watcher)
+            self.subscribe()
 
         except:  # pylint: disable=W0702
             err = traceback.format_exc().splitlines()
             self.send_error_msg('Unexpected error processing message: %s' %
                                 err[-1])
 
-    def get_node_path(self):
-        """Return the node path for endpoints"""
-        return os.path.join(zkutils.ENDPOINTS, self.pattern.split('.', 1)[0])
+    def get_full_pattern(self):
+        """Return the pattern of endpoint names, <proid>.<app>:<endpoint>"""
+        prefix, pattern = self.pattern.split('.', 1)
+        if pattern.find('#') == -1:
+            pattern = pattern + '#*'
+        return '.'.join([prefix, ':'.join([pattern, self.endpoint])])
 
-    def endpoint_watcher(self, event):
-        """Watches changes to event.path
+    def subscribe(self):
+        """Get SOW, send to client then subscribe to the endpoint changes
 
-        When we get in here, get the current 'endpoints' for all children,
-        then return the full state back to the client, unless they want deltas
-        only, then calculate the dealtas and provide the action that was
-        taken with the differences.
+        Client which asks for deltas and supplies the epoch and seq of the
+        last message received is sent the changes which follow instead, if
+        they are still in the cell cache change log.
         """
-        try:
-            _LOGGER.debug('event: %r', event)
-
-            previous_endpoints = self.endpoints or {}
-            _LOGGER.debug('previous_endpoints: %s', previous_endpoints)
-
-            current_endpoints = self.get_current_endpoints(False)
-            _LOGGER.debug('current_endpoints: %r', current_endpoints)
+        self.unsubscribe()
+
+        cache = cellcache.get_cache(self.zkclient)
+        with cache.lock:
+            changes = None
+            if self.deltas and self.epoch == cache.epoch:
+                changes = cache.changes('endpoints', self.since,
+                                        self.get_full_pattern())
+
+            self.subscription, self.seq, self.endpoints = cache.subscribe(
+                'endpoints', self.zk.callback(self.on_endpoints_change),
+                self.get_full_pattern())
+            self.epoch = cache.epoch
+
+            if changes is None:
+                _LOGGER.info('Sending endpoints SOW for %s/%s back to the'
+                             ' client', self.cell, self.pattern)
+                self.send_current_endpoints(True)
+                return
+
+            _LOGGER.info('Resuming endpoints %s/%s from seq %d, %d changes',
+                         self.cell, self.pattern, self.since, len(changes))
+            for seq, changed, removed in changes:
+                # Endpoints deleted before reconnect are no longer known.
+                self.send_deltas(seq, changed,
+                                 dict((name, None) for name in removed))
+
+    def unsubscribe(self):
+        """Stop receiving endpoint changes"""
+        if self.subscription is not None:
+            cellcache.get_cache(self.zkclient).unsubscribe(self.subscription)
+            self.subscription = None
+
+    def on_close(self):
+        """Unsubscribe from the endpoint changes when connection is closed."""
+        self.unsubscribe()
+        websocket.WebSocketHandlerBase.on_close(self)
+
+    def on_endpoints_change(self, seq, changed, removed):
+        """Cell cache callback invoked with the matching endpoint changes.
+
+        Return the full state back to the client, unless they want deltas
+        only, then provide the action that was taken with the differences.
+
+        Invoked on the IOLoop, changes queued before the subscription was
+        renewed or closed are ignored.
+        """
+        if self.subscription is None or seq <= self.seq:
+            return
 
-            _LOGGER.info('Overriding previous state info to the current one')
-            self.endpoints = current_endpoints
+        try:
+            deleted = dict((name, self.endpoints.pop(name, None))
+                           for name in removed)
+            self.endpoints.update(changed)
+            self.seq = seq
 
             # We short-circuit if we don't want deltas
             if not self.deltas:
                 _LOGGER.info('Deltas is not set, returning current state...')
-                current_endpoints['sow'] = True
-                self.write_message(json.dumps(current_endpoints))
-            else:
-                _LOGGER.info('Client is only interested in the deltas,'
-                             ' returning the difference between current'
-                             ' state and previous state')
-
-                self.send_deltas(previous_endpoints,
-                                 current_endpoints)
-
-            _LOGGER.info('Sit watching children under path: %s', event.path)
-            self.zkclient.get_children(event.path, self.endpoint_watcher)
+                self.send_current_endpoints(True)
+                return
+
+            self.send_deltas(seq, changed, deleted)
         except:  # pylint: disable=W0702
             err = traceback.format_exc().splitlines()
-            self.send_error_msg('Unexpected error while watching path %s: %s' %
-                                (event.path, err[-1]))
-
-    def send_deltas(self, previous, current):
-        """Get deltas between current and previous endpoints"""
-
-        previous_apps = self.get_instance_set(previous)
-        current_apps = self.get_instance_set(current)
-
-        response = {'sow': False}
-
-        deleted = self.get_endpoints_by_instances(
-            previous, list(previous_apps - current_apps))
-        response[websocket.DeltaActions.DELETED.value] = deleted
-
-        created = self.get_endpoints_by_instances(
-            current, list(current_apps - previous_apps))
-        response[websocket.DeltaActions.CREATED.value] = created
-
+            self.send_error_msg('Unexpected error while processing endpoint'
+                                ' changes: %s' % err[-1])
+
+    def send_deltas(self, seq, created, deleted):
+        """Send the endpoints created and deleted by the change seq"""
+        response = {'sow': False, 'seq': seq, 'epoch': self.epoch}
+        response[websocket.DeltaActions.DELETED.value] = (
+            self.make_endpoints(deleted))
+        response[websocket.DeltaActions.CREATED.value] = (
+            self.make_endpoints(created))
         _LOGGER.debug('response: %r', response)
 
-        if (response[websocket.DeltaActions.DELETED.value] or
-                response[websocket.DeltaActions.CREATED.value]):
-            _LOGGER.info('Sending deltas back to the client')
-            self.write_message(json.dumps(response))
-        else:
-            _LOGGER.info('No differences found, thus not sending'
-                         ' anything back.')
-
-    def get_instance_set(self, endpoints):
-        """Get instance names as a set from an array of dict's"""
-        if endpoints is None or not endpoints.get('endpoints'):
-            return set([])
-
-        instances = set([ep['name'] for ep in endpoints['endpoints']])
-        _LOGGER.debug('instances: %r', instances)
-
-        return instances
-
-    def get_endpoints_by_instances(self, endpoints, instances):
-        """Get endpoints by the instance names"""
-        _LOGGER.debug('endpoints: %r', endpoints)
+        _LOGGER.info('Sending deltas back to the client')
+        self.write_message(json.dumps(response))
 
-        return [ep for ep in endpoints['endpoints'] if ep['name'] in instances]
+    def make_endpoints(self, endpoints):
+        """Returns endpoints as sorted list of name/hostport dict's"""
+        return [{'name': name, 'hostport': hostport}
+                for name, hostport in sorted(endpoints.iteritems())]
 
     def set_attributes(self, message):
         """Helper function to set all this objects attributes from message"""
@@ -176,6 +188,8 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
             ('pattern', True, unicode),
             ('endpoint', False, unicode),
             ('deltas', False, bool),
+            ('epoch', False, int),
+            ('since', False, int),
         ]
         try:
             utils.validate(message, schema)
@@ -208,6 +222,10 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
         self.deltas = message.get('deltas', False)
         _LOGGER.debug('deltas: %r', self.deltas)
 
+        self.epoch = message.get('epoch')
+        self.since = message.get('since')
+        _LOGGER.debug('epoch: %r, since: %r', self.epoch, self.since)
+
     def get_current_endpoints(self, is_sow=False):
         """This method will get the current endpoints.
 
@@ -218,21 +236,10 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
                 Whether this state is "SOW" (i.e. State Of the World) or not;
                 default is False
         """
-
-        _LOGGER.info('Discovering endpoints in %r with pattern %s',
-                     self.cell, self.pattern)
-
-        app_discovery = discovery.Discovery(self.zkclient, self.pattern,
-                                            self.endpoint)
-
-        endpoint_nodes = app_discovery.get_endpoints_zk()
-        _LOGGER.debug('endpoint_nodes: %r', endpoint_nodes)
-
-        endpoints = [{'name': '.'.join([app_discovery.prefix, endpoint]),
-                      'hostport': app_discovery.resolve_endpoint(endpoint)}
-                     for endpoint in endpoint_nodes]
-
-        discovered = {'sow': is_sow, 'endpoints': endpoints}
+        discovered = {'sow': is_sow,
+                      'seq': self.seq,
+                      'epoch': self.epoch,
+                      'endpoints': self.make_endpoints(self.endpoints)}
 
         return discovered
 
@@ -244,8 +251,6 @@ class DiscoveryWebSocketHandler(websocket.WebSocketHandlerBase):
         discovered = self.get_current_endpoints(is_sow)
         _LOGGER.debug('discovered: %r', discovered)
 
-        self.endpoints = discovered
-
         _LOGGER.info('Sending current endpoints back to client...')
         self.write_message(json.dumps(discovered))
         _LOGGER.info('Finished sending current endpoints back to client')
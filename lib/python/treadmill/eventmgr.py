@@ -9,9 +9,14 @@ server.
 
 Applications that are scheduled to run on the server are mirrored in the
 'cache' directory.
+
+Manifests of the missing apps are fetched with pipelined requests. Written
+manifests are remembered with the versions of their Zookeeper nodes, so that
+unchanged manifests are not fetched again.
 """
 from __future__ import absolute_import
 
+import collections
 import os
 import time
 
@@ -47,6 +52,7 @@ class EventMgr(object):
     __slots__ = (
         'tm_env',
         '_hostname',
+        '_cached',
     )
 
     def __init__(self, root):
@@ -54,6 +60,8 @@ class EventMgr(object):
         self.tm_env = appmgr.AppEnvironment(root=root)
 
         self._hostname = sysinfo.hostname()
+        # Written manifests, app -> (node versions, manifest).
+        self._cached = dict()
 
     @property
     def name(self):
@@ -147,35 +155,105 @@ class EventMgr(object):
             manifest = os.path.join(self.tm_env.cache_dir, app)
             os.unlink(manifest)
 
+        for app in set(self._cached) - expected_set:
+            del self._cached[app]
+
         # If app is missing, fetch its manifest in the cache
-        for app in missing:
-            self._cache(zkclient, app)
+        if missing:
+            self._cache(zkclient, missing)
+
+    def _node_paths(self, app):
+        """Returns manifest and placement node paths of the app."""
+        return z.path.scheduled(app), z.path.placement(self._hostname, app)
 
-    def _cache(self, zkclient, app):
-        """Reads the manifest from Zk and stores it as YAML in <cache>/<app>.
+    def _cache(self, zkclient, apps):
+        """Reads the manifests from Zk, stores them as YAML in <cache>/<app>.
+
+        Reads of all apps are pipelined, the manifest is stored as soon as
+        both manifest and placement of the app are read.
         """
-        appnode = z.path.scheduled(app)
-        placement_node = z.path.placement(self._hostname, app)
-        manifest_file = None
-        try:
-            manifest = zkutils.get(zkclient, appnode)
+        start = time.time()
+        apps = sorted(apps)
+        reused = self._cache_unchanged(
+            zkclient, [app for app in apps if app in self._cached]
+        )
+
+        fetched = 0
+        pending = collections.deque()
+        to_fetch = iter([app for app in apps if app not in reused])
+        while True:
+            for app in to_fetch:
+                pending.append(
+                    (app,) + tuple(zkclient.get_async(path)
+                                   for path in self._node_paths(app))
+                )
+                # Two requests per app.
+                if len(pending) * 2 >= zkutils.MAX_IN_FLIGHT:
+                    break
+
+            if not pending:
+                break
+
+            app, manifest_result, placement_result = pending.popleft()
+            try:
+                manifest_data, manifest_stat = manifest_result.get()
+                placement_data, placement_stat = placement_result.get()
+            except kazoo.exceptions.NoNodeError:
+                _LOGGER.warning('App %r not found', app)
+                continue
+
+            manifest = yaml.load(manifest_data)
             # TODO: need a function to parse instance id from name.
             manifest['task'] = app[app.index('#') + 1:]
 
-            placement_info = zkutils.get(zkclient, placement_node)
-            if placement_info is not None:
-                manifest.update(placement_info)
+            if placement_data is not None:
+                placement_info = yaml.load(placement_data)
+                if placement_info is not None:
+                    manifest.update(placement_info)
+
+            self._write_manifest(app, manifest)
+            self._cached[app] = (
+                (manifest_stat.mzxid, placement_stat.mzxid), manifest
+            )
+            fetched += 1
+
+        _LOGGER.info('Cached %d manifests, fetched: %d, unchanged: %d, '
+                     'in %.3fs',
+                     fetched + len(reused), fetched, len(reused),
+                     time.time() - start)
 
-            manifest_file = os.path.join(self.tm_env.cache_dir, app)
-            with tempfile.NamedTemporaryFile(dir=self.tm_env.cache_dir,
-                                             prefix='.%s-' % app,
-                                             delete=False) as temp_manifest:
-                yaml.dump(manifest, stream=temp_manifest)
-            os.rename(temp_manifest.name, manifest_file)
-            _LOGGER.info('Created cache manifest: %s', manifest_file)
+    def _cache_unchanged(self, zkclient, apps):
+        """Stores previously written manifests which did not change.
+
+        Only versions of the nodes are read. Returns set of stored apps.
+        """
+        paths = [path for app in apps for path in self._node_paths(app)]
+        versions = dict(
+            (path, metadata.mzxid if metadata is not None else None)
+            for path, metadata in zkutils.exists_many(zkclient, paths)
+        )
 
-        except kazoo.exceptions.NoNodeError:
-            _LOGGER.warning('App %r not found', app)
+        unchanged = set()
+        for app in apps:
+            node_versions, manifest = self._cached[app]
+            if tuple(versions[path]
+                     for path in self._node_paths(app)) != node_versions:
+                continue
+
+            self._write_manifest(app, manifest)
+            unchanged.add(app)
+
+        return unchanged
+
+    def _write_manifest(self, app, manifest):
+        """Atomically write the app manifest into the cache."""
+        manifest_file = os.path.join(self.tm_env.cache_dir, app)
+        with tempfile.NamedTemporaryFile(dir=self.tm_env.cache_dir,
+                                         prefix='.%s-' % app,
+                                         delete=False) as temp_manifest:
+            yaml.dump(manifest, stream=temp_manifest)
+        os.rename(temp_manifest.name, manifest_file)
+        _LOGGER.info('Created cache manifest: %s', manifest_file)
 
     def _cache_notify(self, is_seen):
         """Sent a cache status notification event.
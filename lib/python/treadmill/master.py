@@ -20,6 +20,7 @@ from . import sysinfo
 from . import utils
 from . import zkutils
 from . import exc
+from . import placement as placement_shards
 from . import zknamespace as z
 from . import scheduler
 
@@ -46,6 +47,12 @@ def resources(data):
     return [parsers[k](data.get(k, 0)) for k in ['memory', 'cpu', 'disk']]
 
 
+def _alloc_apps_count(alloc):
+    """Returns number of apps assigned to the allocation and its children."""
+    return len(alloc.apps) + sum(_alloc_apps_count(child)
+                                 for child in alloc.sub_allocations.values())
+
+
 def get_data_retention(data):
     """Returns data retention timeout in seconds."""
     if 'data_retention_timeout' in data:
@@ -74,22 +81,208 @@ _SERVERS_ACL_DEL = zkutils.make_role_acl('servers', 'd')
 # Timer interval to reevaluate time events (seconds).
 # TIMER_INTERVAL = 60
 
-# Time interval between running the scheduler (seconds).
+# Minimal time interval between running the scheduler (seconds).
 SCHEDULER_INTERVAL = 2
 
-# Interval to sleep before checking if there is new event in the queue.
-CHECK_EVENT_INTERVAL = 0.5
-
 # Check integrity of the scheduler every 5 minutes.
 INTEGRITY_INTERVAL = 5 * 60
 
-# Max number of events to process before checking if scheduler is due.
-EVENT_BATCH_COUNT = 20
+# Reschedule is incremental, with full reschedule every 5 minutes.
+FULL_SCHEDULER_INTERVAL = 5 * 60
+
+# Interval of reporting event queue metrics (seconds).
+METRICS_INTERVAL = 60
+
+# Order of processing watch events, admin events have their own priority.
+_PATH_PRIORITY = {
+    z.SERVER_PRESENCE: 0,
+    z.EVENTS: 1,
+    z.SCHEDULED: 2,
+}
+
+# Number of placement changes written in single Zookeeper transaction.
+PLACEMENT_BATCH_SIZE = 100
+
+# Scheduler snapshot is not stored if larger than Zookeeper node size limit.
+MAX_SNAPSHOT_SIZE = 1024 * 1024 - 1024
+
+# Max number of assignment patterns compiled in single regular expression,
+# python 2 re supports at most 100 groups.
+ASSIGNMENT_CHUNK_SIZE = 99
+
+# Instance suffix of the app name, '#' and a 10 digit number.
+_INSTANCE_RE = re.compile(r'^(.*)#[0-9]{10}$')
 
 # Delay between re-establishing collection watch (seconds).
 # COLLECTION_EVENT_DELAY = 0.5
 
 
+class EventQueue(object):
+    """Queue of watch events, coalesced by path.
+
+    Watch passes complete list of children, so only the latest event of the
+    path needs to be processed.
+    """
+    __slots__ = (
+        'condition',
+        'pending',
+        'received',
+        'coalesced',
+        'processed',
+        'max_depth',
+        'latency',
+    )
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # Pending events, path -> (children, time of the oldest event).
+        self.pending = dict()
+        self.received = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.max_depth = 0
+        self.latency = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, path, children):
+        """Add event, replacing pending event of the same path."""
+        with self.condition:
+            self.received += 1
+            if path in self.pending:
+                self.coalesced += 1
+                since = self.pending[path][1]
+            else:
+                since = time.time()
+
+            self.pending[path] = (children, since)
+            self.max_depth = max(self.max_depth, self.depth())
+            self.condition.notify()
+
+    def get(self):
+        """Remove highest priority event, raises IndexError if empty."""
+        with self.condition:
+            if not self.pending:
+                raise IndexError('Event queue is empty.')
+
+            path = min(self.pending, key=_PATH_PRIORITY.get)
+            children, since = self.pending.pop(path)
+            return path, children, since
+
+    def done(self, since):
+        """Record processing of the event received at since."""
+        with self.condition:
+            self.processed += 1
+            self.latency.append(time.time() - since)
+
+    def wait(self, timeout):
+        """Wait for event up to timeout seconds."""
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+
+    def depth(self):
+        """Number of pending events, counting admin events individually."""
+        depth = 0
+        for path, (children, _since) in self.pending.iteritems():
+            depth += len(children) if path == z.EVENTS else 1
+        return depth
+
+    def metrics(self):
+        """Returns queue metrics, resets max depth and latency."""
+        with self.condition:
+            latency = self.latency or [0]
+            result = {
+                'depth': self.depth(),
+                'max_depth': self.max_depth,
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'processed': self.processed,
+                'latency_avg': sum(latency) / len(latency),
+                'latency_max': max(latency),
+            }
+            self.max_depth = self.depth()
+            self.latency = []
+            return result
+
+
+def _translate(pattern):
+    """Translate shell pattern into regex which can be combined."""
+    regex = fnmatch.translate(pattern)
+    # Python 2 appends global flags, which are passed to re.compile instead.
+    if regex.endswith('(?ms)'):
+        regex = regex[:-len('(?ms)')]
+    return regex
+
+
+class AssignmentMatcher(object):
+    """Matches app names against assignment patterns.
+
+    Patterns of the assignment are compiled into combined regular
+    expressions, tried in the same order as the patterns are checked one by
+    one. The instance suffix is fixed length, so the result depends only on
+    the app base name and it is memoized.
+    """
+    __slots__ = (
+        'assignments',
+        'compiled',
+        'matched',
+    )
+
+    def __init__(self, assignments):
+        self.assignments = assignments
+        # Compiled patterns, assignment -> [(regex, [(prio, alloc)])].
+        self.compiled = dict()
+        # Memoized results, (assignment, base name) -> (prio, alloc) or None.
+        self.matched = dict()
+
+    def _compile(self, pattern_maj):
+        """Compile patterns of the assignment in order of precedence."""
+        ordered = list(reversed(sorted(
+            self.assignments[pattern_maj].iteritems())))
+        compiled = []
+        for idx in xrange(0, len(ordered), ASSIGNMENT_CHUNK_SIZE):
+            chunk = ordered[idx:idx + ASSIGNMENT_CHUNK_SIZE]
+            regex = re.compile(
+                '|'.join('(%s)' % _translate(pattern)
+                         for pattern, _assignment in chunk),
+                re.M | re.S
+            )
+            compiled.append((regex, [assignment
+                                     for _pattern, assignment in chunk]))
+        return compiled
+
+    def match(self, pattern_maj, pattern_min):
+        """Returns (priority, allocation) of the first matching pattern.
+
+        Returns None if assignment does not exist or no pattern matches.
+        """
+        if pattern_maj not in self.assignments:
+            return None
+
+        instance = _INSTANCE_RE.match(pattern_min)
+        if instance:
+            key = (pattern_maj, instance.group(1))
+            if key in self.matched:
+                return self.matched[key]
+
+        if pattern_maj not in self.compiled:
+            self.compiled[pattern_maj] = self._compile(pattern_maj)
+
+        result = None
+        for regex, assignments in self.compiled[pattern_maj]:
+            match = regex.match(pattern_min)
+            if match:
+                # Alternatives are tried in order, the first match wins.
+                result = assignments[match.lastindex - 1]
+                break
+
+        if instance:
+            self.matched[key] = result
+        return result
+
+
 class Master(object):
     """Treadmill master scheduler."""
 
@@ -101,13 +294,27 @@ class Master(object):
         self.buckets = dict()
         self.servers = dict()
         self.allocations = dict()
-        self.assignments = dict()
+        self.assignment_matcher = AssignmentMatcher(dict())
+        # Assignment attributes of the app manifests, app -> manifest subset.
+        self.app_assignments = dict()
+
+        self.publisher = placement_shards.PlacementPublisher(zkclient)
 
-        self.queue = collections.deque()
+        self.queue = EventQueue()
         self.up_to_date = False
         self.exit = False
-        # Signals that processing of a given event.
-        self.process_complete = dict()
+        # Processed admin events, until they disappear from the watch.
+        self.processed_events = set()
+
+    @property
+    def assignments(self):
+        """Assignments map, assignment -> pattern -> (priority, allocation)."""
+        return self.assignment_matcher.assignments
+
+    @assignments.setter
+    def assignments(self, assignments):
+        """Set assignments map, dropping memoized assignments."""
+        self.assignment_matcher = AssignmentMatcher(assignments)
 
     def create_rootns(self):
         """Create root nodes and set appropriate acls."""
@@ -120,6 +327,7 @@ class Master(object):
             z.CELL: None,
             z.IDENTITY_GROUPS: None,
             z.PLACEMENT: None,
+            z.PLACEMENT_SHARDS: None,
             z.SCHEDULED: [_SERVERS_ACL_DEL],
             z.SCHEDULER: None,
             z.SERVERS: None,
@@ -139,6 +347,53 @@ class Master(object):
         for path, acl in root_ns.iteritems():
             zkutils.ensure_exists(self.zkclient, path, acl)
 
+    def load_snapshot(self):
+        """Warm start cell from the scheduler snapshot.
+
+        Loaded state is reconciled with Zookeeper by the regular load_*
+        methods. Returns True if snapshot was loaded.
+        """
+        try:
+            data, _metadata = self.zkclient.get(z.SCHEDULER)
+        except kazoo.client.NoNodeError:
+            return False
+
+        if not data:
+            return False
+
+        try:
+            cell = scheduler.loads(data)
+        except ValueError as err:
+            _LOGGER.warn('Unable to load scheduler snapshot: %s', err)
+            return False
+
+        if cell.name != self.cell.name:
+            _LOGGER.warn('Scheduler snapshot cell mismatch: %s', cell.name)
+            return False
+
+        self.cell = cell
+        self.buckets = dict()
+        stack = cell.children.values()
+        while stack:
+            node = stack.pop()
+            if isinstance(node, scheduler.Bucket):
+                self.buckets[node.name] = node
+                stack.extend(node.children.values())
+        self.servers = dict(cell.members())
+
+        _LOGGER.info('Loaded scheduler snapshot: %d servers, %d apps',
+                     len(self.servers), len(cell.apps))
+        return True
+
+    def save_snapshot(self):
+        """Store scheduler snapshot."""
+        data = scheduler.dumps(self.cell)
+        if len(data) > MAX_SNAPSHOT_SIZE:
+            _LOGGER.warn('Scheduler snapshot too large: %d', len(data))
+            return
+
+        zkutils.put(self.zkclient, z.SCHEDULER, data)
+
     def load_cell(self):
         """Construct cell from top level buckets."""
         buckets = self.zkclient.get_children(z.CELL)
@@ -177,47 +432,79 @@ class Master(object):
 
     def load_servers(self, readonly=False):
         """Load server topology."""
+        start = time.time()
         servers = self.zkclient.get_children(z.SERVERS)
-        for servername in servers:
-            self.load_server(servername, readonly)
+        presence = set(self.zkclient.get_children(z.SERVER_PRESENCE))
+        servers_data = self._get_many(z.path.server, servers)
+        states = self._get_many(z.path.placement, servers)
 
-    def load_server(self, servername, readonly=False):
-        """Load individual server."""
-        try:
-            data = zkutils.get(self.zkclient, z.path.server(servername))
-            if not data:
-                # The server is configured, but never reported it's capacity.
-                _LOGGER.info('No capacity detected: %s',
-                             z.path.server(servername))
-                return
+        for servername in servers:
+            if servername not in servers_data:
+                self.remove_server(servername)
+                _LOGGER.warn('Server node not found: %s', servername)
+                continue
 
-            assert 'parent' in data
-            parentname = data['parent']
+            data = servers_data[servername]
+            if servername in self.servers:
+                self._reload_server(servername, data, readonly)
+            else:
+                self._load_server(servername, data, readonly,
+                                  servername in states)
 
-            server = scheduler.Server(servername,
-                                      resources(data),
-                                      valid_until=data.get('valid_until', 0),
-                                      features=data.get('features', None))
+            self._adjust_server_state(servername,
+                                      servername in presence,
+                                      states.get(servername),
+                                      readonly)
 
-            parent = self.buckets.get(parentname)
-            if not parent:
-                _LOGGER.warn('Server parent does not exist: %s/%s',
-                             servername, parentname)
-                return
+        for servername in set(self.servers) - set(servers):
+            self.remove_server(servername)
 
-            self.buckets[parentname].add_node(server)
-            self.servers[servername] = server
-            assert server.parent == self.buckets[parentname]
+        self._load_timing('servers', len(servers), start)
 
-            if not readonly:
-                zkutils.ensure_exists(self.zkclient,
-                                      z.path.placement(servername),
-                                      acl=[_SERVERS_ACL])
+    def load_server(self, servername, readonly=False):
+        """Load individual server."""
+        try:
+            data = zkutils.get(self.zkclient, z.path.server(servername))
+        except kazoo.client.NoNodeError:
+            _LOGGER.warn('Server node not found: %s', servername)
+            return
 
+        if self._load_server(servername, data, readonly):
             self.adjust_server_state(servername, readonly)
 
-        except kazoo.client.NoNodeError:
-            _LOGGER.warn('Server node not found: %s', servername)
+    def _load_server(self, servername, data, readonly=False,
+                     placement_exists=False):
+        """Add server to the parent bucket, returns True if server added."""
+        if not data:
+            # The server is configured, but never reported it's capacity.
+            _LOGGER.info('No capacity detected: %s',
+                         z.path.server(servername))
+            return False
+
+        assert 'parent' in data
+        parentname = data['parent']
+
+        server = scheduler.Server(servername,
+                                  resources(data),
+                                  valid_until=data.get('valid_until', 0),
+                                  features=data.get('features', None))
+
+        parent = self.buckets.get(parentname)
+        if not parent:
+            _LOGGER.warn('Server parent does not exist: %s/%s',
+                         servername, parentname)
+            return False
+
+        self.buckets[parentname].add_node(server)
+        self.servers[servername] = server
+        assert server.parent == self.buckets[parentname]
+
+        if not readonly and not placement_exists:
+            zkutils.ensure_exists(self.zkclient,
+                                  z.path.placement(servername),
+                                  acl=[_SERVERS_ACL])
+
+        return True
 
     def remove_server(self, servername):
         """Remove server from scheduler."""
@@ -243,55 +530,60 @@ class Master(object):
             self.load_server(servername)
             return
 
-        current_server = self.servers[servername]
-        # Check if server is same
         try:
             data = zkutils.get(self.zkclient, z.path.server(servername))
-            if not data:
-                # The server is configured, but never reported it's capacity.
-                self.remove_server(servername)
-                return
-
-            # TODO: need better error handling.
-            assert 'parent' in data
-            assert data['parent'] in self.buckets
-
-            server = scheduler.Server(servername,
-                                      resources(data),
-                                      valid_until=data.get('valid_until', 0),
-                                      features=data.get('features', None))
-
-            parent = self.buckets[data['parent']]
-            # TODO: assume that bucket topology is constant, e.g.
-            #                rack can never change buiding. If this does not
-            #                hold, comparing parents is not enough, need to
-            #                compare recursively all the way up.
-            if (current_server.is_same(server)
-                    and current_server.parent == parent):
-                # Nothing changed, no need to update anything.
-                _LOGGER.info('server is same, keeping old.')
-                current_server.valid_until = server.valid_until
-            else:
-                # Something changed - clear everything and re-register server
-                # as new.
-                _LOGGER.info('server modified, replacing.')
-                self.remove_server(servername)
-                self.load_server(servername)
-
         except kazoo.client.NoNodeError:
             self.remove_server(servername)
             _LOGGER.warn('Server node not found: %s', servername)
+            return
+
+        if self._reload_server(servername, data):
+            self.adjust_server_state(servername)
+
+    def _reload_server(self, servername, data, readonly=False):
+        """Reload server from data, returns True if server was replaced."""
+        current_server = self.servers[servername]
+        # Check if server is same
+        if not data:
+            # The server is configured, but never reported it's capacity.
+            self.remove_server(servername)
+            return False
+
+        # TODO: need better error handling.
+        assert 'parent' in data
+        assert data['parent'] in self.buckets
+
+        server = scheduler.Server(servername,
+                                  resources(data),
+                                  valid_until=data.get('valid_until', 0),
+                                  features=data.get('features', None))
+
+        parent = self.buckets[data['parent']]
+        # TODO: assume that bucket topology is constant, e.g.
+        #                rack can never change buiding. If this does not
+        #                hold, comparing parents is not enough, need to
+        #                compare recursively all the way up.
+        if (current_server.is_same(server)
+                and current_server.parent == parent):
+            # Nothing changed, no need to update anything.
+            _LOGGER.info('server is same, keeping old.')
+            current_server.valid_until = server.valid_until
+            return False
+
+        # Something changed - clear everything and re-register server
+        # as new.
+        _LOGGER.info('server modified, replacing.')
+        self.remove_server(servername)
+        return self._load_server(servername, data, readonly,
+                                 placement_exists=True)
 
     def adjust_server_state(self, servername, readonly=False):
         """Set server state."""
-        server = self.servers.get(servername)
-        if not server:
+        if servername not in self.servers:
             return
 
         is_up = self.zkclient.exists(z.path.server_presence(servername))
 
-        placement_node = z.path.placement(servername)
-
         # Restore state as it was stored in server placement node.
         #
         # zkutils.get_default return tuple if need_metadata is True, default it
@@ -299,7 +591,17 @@ class Master(object):
         # and it should be fixed in zkutils.
         #
         # pylint: disable=R0204
-        state_since = zkutils.get_default(self.zkclient, placement_node)
+        state_since = zkutils.get_default(self.zkclient,
+                                          z.path.placement(servername))
+        self._adjust_server_state(servername, is_up, state_since, readonly)
+
+    def _adjust_server_state(self, servername, is_up, state_since,
+                             readonly=False):
+        """Set server state from presence and stored placement state."""
+        server = self.servers.get(servername)
+        if not server:
+            return
+
         if not state_since:
             state_since = {'state': 'down', 'since': time.time()}
 
@@ -317,9 +619,21 @@ class Master(object):
         # Record server state:
         state, since = server.get_state()
         if not readonly:
-            zkutils.put(self.zkclient, placement_node,
+            zkutils.put(self.zkclient, z.path.placement(servername),
                         {'state': state.value, 'since': since})
 
+    def _get_many(self, path_f, names):
+        """Bulk load nodes, returns dict name -> content."""
+        paths = dict((path_f(name), name) for name in names)
+        return dict((paths[path], data) for path, data in zkutils.get_many(
+            self.zkclient, paths.keys()).iteritems())
+
+    @staticmethod
+    def _load_timing(collection, count, start):
+        """Report load time of the collection."""
+        _LOGGER.info('Loaded %s: %d nodes in %.3f sec',
+                     collection, count, time.time() - start)
+
     def load_allocations(self):
         """Load allocations and assignments map."""
         root_alloc = scheduler.Allocation()
@@ -372,6 +686,94 @@ class Master(object):
             parent.add_sub_alloc(name, child)
             self.load_alloc_data(child, assignments_acc, alloc_data)
 
+    def reload_allocations(self):
+        """Apply allocation changes to the allocation tree in place.
+
+        Only apps which are assigned to a different allocation or priority
+        are rebound, placements are kept.
+        """
+        start = time.time()
+        data = zkutils.get_default(self.zkclient, z.ALLOCATIONS, default={})
+
+        assignments = dict()
+        removed = self.update_alloc_data(self.cell.allocation, assignments,
+                                         data)
+        self.assignments = assignments
+
+        for appname in set(self.app_assignments) - set(self.cell.apps):
+            del self.app_assignments[appname]
+
+        rebound = 0
+        for appname, app in self.cell.apps.items():
+            priority, allocation = self._app_assignment(
+                appname, self.app_assignments.get(appname, {}))
+            if app.allocation is allocation and app.priority == priority:
+                continue
+            _LOGGER.info('Rebind app: %s => %s, %s',
+                         appname, allocation.name, priority)
+            app.priority = priority
+            self.cell.add_app(allocation, app)
+            rebound += 1
+
+        # Removed allocations are dropped once no app is assigned to them.
+        for parent, name in removed:
+            if not _alloc_apps_count(parent.sub_allocations[name]):
+                parent.remove_sub_alloc(name)
+
+        _LOGGER.info('Reloaded allocations, rebound %d apps: %.3f',
+                     rebound, time.time() - start)
+
+    def update_alloc_data(self, parent, assignments_acc, data):
+        """Updates allocations of parent alloc to match data.
+
+        Returns list of (parent, name) of sub allocations not present in data.
+        """
+        if not data:
+            data = {}
+
+        removed = [(parent, name) for name in parent.sub_allocations
+                   if name not in data]
+
+        for name, alloc_data in data.iteritems():
+            if name == '-alloc':
+                continue
+            name = str(name)
+            attrs = alloc_data.get('-alloc', {})
+            reserved = resources(attrs.get('reserved') or {})
+            rank = attrs.get('rank', None)
+            max_utilization = attrs.get('max_utilization', None)
+            features = attrs.get('features', None)
+
+            alloc = scheduler.Allocation(reserved, rank=rank,
+                                         features=features,
+                                         max_utilization=max_utilization)
+            child = parent.sub_allocations.get(name)
+            if child is None:
+                child = alloc
+                parent.add_sub_alloc(name, child)
+            else:
+                if (list(child.reserved) != list(alloc.reserved) or
+                        child.rank != alloc.rank or
+                        child.max_utilization != alloc.max_utilization):
+                    _LOGGER.info('Update allocation: %s', child.name)
+                    child.update(reserved, rank,
+                                 max_utilization=max_utilization)
+                if child.features != alloc.features:
+                    child.set_features(features)
+
+            for assignment, patterns in attrs.get('assignments',
+                                                  {}).iteritems():
+                for pattern, prio in patterns.iteritems():
+                    fixed_pattern = pattern.replace('%', '*')
+                    fixed_pattern += '[#]' + ('[0-9]' * 10)
+                    assignments_acc.setdefault(
+                        assignment, dict())[fixed_pattern] = (prio, child)
+
+            removed.extend(
+                self.update_alloc_data(child, assignments_acc, alloc_data))
+
+        return removed
+
     def find_assignment(self, name, manifest):
         """Find allocation by matching app assignment."""
         pattern_maj = manifest.get('allocation')
@@ -379,16 +781,11 @@ class Master(object):
 
         _LOGGER.debug('Find assignment: %s.%s', pattern_maj, pattern_min)
 
-        if pattern_maj not in self.assignments:
+        assignment = self.assignment_matcher.match(pattern_maj, pattern_min)
+        if assignment is None:
             return self.find_default_assignment(name)
 
-        assignments = reversed(sorted(
-            self.assignments[pattern_maj].iteritems()))
-        for pattern, assignment in assignments:
-            if fnmatch.fnmatch(pattern_min, pattern):
-                return assignment
-
-        return self.find_default_assignment(name)
+        return assignment
 
     def find_default_assignment(self, name):
         """Finds (creates) default assignment."""
@@ -398,24 +795,42 @@ class Master(object):
 
     def load_apps(self, readonly=False):
         """Load application data."""
+        start = time.time()
         apps = self.zkclient.get_children(z.SCHEDULED)
+        manifests = self._get_many(z.path.scheduled, apps)
         for appname in apps:
-            self.load_app(appname, readonly)
+            self._load_app(appname, manifests.get(appname))
+
+        for appname in set(self.cell.apps) - set(apps):
+            self.cell.remove_app(appname)
+            self.app_assignments.pop(appname, None)
+
+        if not readonly:
+            self._create_tasks(self.cell.apps.keys())
 
         self.restore_placements()
+        self._load_timing('apps', len(apps), start)
 
     def load_app(self, appname, readonly=False):
         """Load single application data."""
         # TODO: need to check if app is blacklisted.
         manifest = zkutils.get_default(self.zkclient,
                                        z.path.scheduled(appname))
+        if self._load_app(appname, manifest) and not readonly:
+            self._create_task(appname)
+
+    def _load_app(self, appname, manifest):
+        """Add/update application from manifest, returns True if added."""
         if not manifest:
             self.cell.remove_app(appname)
-            return
+            self.app_assignments.pop(appname, None)
+            return False
 
-        priority, allocation = self.find_assignment(appname, manifest)
-        if 'priority' in manifest and int(manifest['priority']) != -1:
-            priority = int(manifest['priority'])
+        self.app_assignments[appname] = dict(
+            (key, manifest[key]) for key in ('allocation', 'priority')
+            if key in manifest
+        )
+        priority, allocation = self._app_assignment(appname, manifest)
 
         # TODO: From scheduler perspective it is theoretically
         #                possible to update data retention timeout.
@@ -423,9 +838,6 @@ class Master(object):
         duration = get_duration(manifest)
 
         app = self.cell.apps.get(appname, None)
-        if not readonly:
-            self._create_task(appname)
-
         if app:
             app.priority = priority
             app.data_retention_timeout = data_retention
@@ -444,22 +856,58 @@ class Master(object):
                                         duration=duration)
 
         self.cell.add_app(allocation, app)
+        return True
+
+    def _app_assignment(self, appname, manifest):
+        """Returns (priority, allocation) of the app."""
+        priority, allocation = self.find_assignment(appname, manifest)
+        if 'priority' in manifest and int(manifest['priority']) != -1:
+            priority = int(manifest['priority'])
+        return priority, allocation
 
     def load_strategies(self):
-        """Load affinity strategies for buckets."""
-        pass
+        """Load affinity strategies for buckets.
+
+        Each node under /strategies is named after the bucket (or the cell)
+        and maps affinity to strategy name, '*' sets the bucket default.
+        """
+        for bucketname in self.zkclient.get_children(z.STRATEGIES):
+            if bucketname == self.cell.name:
+                bucket = self.cell
+            else:
+                bucket = self.buckets.get(bucketname)
+            if bucket is None:
+                _LOGGER.warn('Strategy bucket does not exist: %s', bucketname)
+                continue
+
+            data = zkutils.get_default(self.zkclient,
+                                       z.path.strategy(bucketname),
+                                       default={})
+            for affinity, strategy in data.iteritems():
+                if strategy not in scheduler.STRATEGIES:
+                    _LOGGER.warn('Unknown strategy: %s - %s, %s',
+                                 bucketname, affinity, strategy)
+                    continue
+
+                _LOGGER.info('Setting strategy: %s - %s, %s',
+                             bucketname, affinity, strategy)
+                if affinity == '*':
+                    bucket.set_default_strategy(strategy)
+                else:
+                    bucket.set_affinity_strategy(affinity, strategy)
 
     def load_identity_groups(self, restore=False):
         """Load identity groups."""
+        start = time.time()
         names = set(self.zkclient.get_children(z.IDENTITY_GROUPS))
         extra = set(self.cell.identity_groups.keys()) - names
         _LOGGER.info('Removing identities: %r', extra)
         for name in extra:
             self.cell.remove_identity_group(name)
 
+        idents = self._get_many(z.path.identity_group, names)
         for name in names:
-            ident = zkutils.get_default(self.zkclient,
-                                        z.path.identity_group(name))
+            ident = idents.get(name)
             if ident:
                 count = ident.get('count', 0)
                 _LOGGER.info('Configuring identity: %s, %s', name, count)
@@ -468,6 +916,8 @@ class Master(object):
         if restore:
             self.restore_identities()
 
+        self._load_timing('identity groups', len(names), start)
+
     def restore_placements(self):
         """Restore placements after reload."""
         integrity = collections.defaultdict(list)
@@ -494,6 +944,14 @@ class Master(object):
                     app = self.cell.apps[appname]
                     integrity[appname].append(server)
 
+                    if app.server == server:
+                        # Already restored from the snapshot.
+                        continue
+
+                    if app.server and len(integrity[appname]) == 1:
+                        # Snapshot placement is stale.
+                        self._unplace(app)
+
                     if self.servers[server].put(app):
                         _LOGGER.info('Restore placement: %s => %s',
                                      appname, server)
@@ -510,6 +968,12 @@ class Master(object):
                                                    z.path.scheduled(appname))
                             self.cell.remove_app(appname)
 
+        for appname, app in self.cell.apps.iteritems():
+            if app.server and appname not in integrity:
+                _LOGGER.info('Removing stale snapshot placement: %s => %s',
+                             appname, app.server)
+                self._unplace(app)
+
         for appname, servers in integrity.iteritems():
             if len(servers) > 1:
                 _LOGGER.warn('Integrity error: %s placed on %r',
@@ -519,18 +983,22 @@ class Master(object):
                                            z.path.placement(server, appname))
                     self.servers[server].remove(appname)
 
+    def _unplace(self, app):
+        """Remove app from the server, keeping the evicted flag."""
+        evicted = app.evicted
+        self.servers[app.server].remove(app.name)
+        app.evicted = evicted
+
     def restore_identities(self):
         """Restore app identities."""
-        for appname, app in self.cell.apps.iteritems():
-            if not app.identity_group:
-                continue
-
-            if app.server:
-                placement_data = zkutils.get_default(
-                    self.zkclient, z.path.placement(app.server, appname))
+        apps = dict((z.path.placement(app.server, appname), app)
+                    for appname, app in self.cell.apps.iteritems()
+                    if app.identity_group and app.server)
 
-                if placement_data is not None:
-                    app.force_set_identity(placement_data['identity'])
+        placements = zkutils.get_many(self.zkclient, apps.keys())
+        for path, placement_data in placements.iteritems():
+            if placement_data is not None:
+                apps[path].force_set_identity(placement_data['identity'])
 
     def adjust_presence(self, servers):
         """Given current presence set, adjust status."""
@@ -570,13 +1038,21 @@ class Master(object):
         assert path in callbacks
 
         callbacks[path](children)
-
-        _LOGGER.info('waiting for completion.')
-        self.process_complete[path].set()
         self.up_to_date = False
 
         _LOGGER.info('done processing events.')
 
+    def process_pending(self):
+        """Process all pending events in order of priority."""
+        while True:
+            try:
+                path, children, since = self.queue.get()
+            except IndexError:
+                return
+
+            self.process((path, children))
+            self.queue.done(since)
+
     def process_scheduled(self, scheduled):
         """Callback invoked when on scheduling changes."""
         current = set(self.cell.apps.keys())
@@ -602,40 +1078,55 @@ class Master(object):
         """Callback invoked on state change/admin event."""
         # Events are sequential nodes in the form <prio>-<event>-<seq #>
         #
-        # They are processed in order of (prio, seq_num, event)
+        # They are processed in order of (prio, seq_num, event), events of
+        # the same resource are coalesced and processed once, in the order
+        # of the first event.
+        self.processed_events &= set(events)
         ordered = sorted([tuple([event.split('-')[i] for i in [0, 2, 1]])
                           for event in events
-                          if re.match(r'\d+\-\w+\-\d+$', event)])
+                          if re.match(r'\d+\-\w+\-\d+$', event) and
+                          event not in self.processed_events])
 
+        resources = collections.OrderedDict()
         for prio, seq, resource in ordered:
             _LOGGER.info('event: %s %s %s', prio, seq, resource)
             node_name = '-'.join([prio, resource, seq])
+            resources.setdefault(resource, []).append(node_name)
+
+        for resource, node_names in resources.iteritems():
             if resource == 'allocations':
-                # TODO: changing allocations has potential of complete
-                #                reshuffle, so while ineffecient, reload
-                #                all apps as well.
-                self.load_allocations()
-                self.load_apps()
+                # Apps are rebound to the changed allocations in memory,
+                # manifests and placements are not reloaded.
+                self.reload_allocations()
             elif resource == 'apps':
                 # The event node contains list of apps to be re-evaluated.
-                apps = zkutils.get_default(
-                    self.zkclient,
-                    z.path.event(node_name),
-                    default=[])
-                for app in apps:
-                    self.load_app(app)
+                apps = set()
+                for node_name in node_names:
+                    for app in zkutils.get_default(self.zkclient,
+                                                   z.path.event(node_name),
+                                                   default=[]):
+                        if app not in apps:
+                            apps.add(app)
+                            self.load_app(app)
             elif resource == 'cell':
                 self.load_cell()
             elif resource == 'servers':
-                servers = zkutils.get_default(
-                    self.zkclient,
-                    z.path.event(node_name),
-                    default=[])
-                if not servers:
+                servers = set()
+                reload_all = False
+                for node_name in node_names:
+                    event_servers = zkutils.get_default(
+                        self.zkclient,
+                        z.path.event(node_name),
+                        default=[])
+                    if event_servers:
+                        servers.update(event_servers)
+                    else:
+                        reload_all = True
+                if reload_all:
                     # If not specified, reload all. Use union of servers in
                     # the model and in zookeeper.
-                    servers = (set(self.servers.keys()) ^
-                               set(self.zkclient.get_children(z.SERVERS)))
+                    servers.update(set(self.servers.keys()) ^
+                                   set(self.zkclient.get_children(z.SERVERS)))
                 self.reload_servers(servers)
             elif resource == 'identity_groups':
                 self.load_identity_groups()
@@ -643,8 +1134,11 @@ class Master(object):
                 _LOGGER.warn('Unsupported event resource: %s', resource)
 
         for node in events:
+            if node in self.processed_events:
+                continue
             _LOGGER.info('Deleting event: %s', z.path.event(node))
             zkutils.ensure_deleted(self.zkclient, z.path.event(node))
+            self.processed_events.add(node)
 
     def watch(self, path):
         """Constructs a watch on a given path."""
@@ -653,30 +1147,17 @@ class Master(object):
         @self.zkclient.ChildrenWatch(path)
         def _watch(children):
             """Watch children events."""
-            _LOGGER.debug('watcher begin: %s', path)
-            # On first invocation, we create event and do not wait on it,
-            # as the event loop not started yet.
-            #
-            # On subsequent calls, wait for processing to complete before
-            # renewing the watch, to avoid busy loops.
-            if path in self.process_complete:
-                self.process_complete[path].clear()
-
-            self.queue.append((path, children))
-
-            if path in self.process_complete:
-                _LOGGER.debug('watcher waiting for completion: %s', path)
-                self.process_complete[path].wait()
-            else:
-                self.process_complete[path] = threading.Event()
-
-            _LOGGER.debug('watcher finished: %s', path)
+            _LOGGER.debug('watcher event: %s', path)
+            # Events of the same path are coalesced in the queue, so there is
+            # no need to wait for the processing.
+            self.queue.put(path, children)
             return True
 
     @exc.exit_on_unhandled
     def run_real(self):
         """Loads cell state from Zookeeper."""
         self.create_rootns()
+        self.load_snapshot()
         self.load_buckets()
         self.load_cell()
         self.load_servers()
@@ -684,6 +1165,7 @@ class Master(object):
         self.load_strategies()
         self.load_apps()
         self.load_identity_groups(restore=True)
+        self.publisher.load()
 
         self.reschedule(init=True)
 
@@ -692,33 +1174,47 @@ class Master(object):
         self.watch(z.EVENTS)
 
         last_sched_time = time.time()
+        last_full_sched_time = last_sched_time
         last_integrity_check = 0
+        last_metrics_time = last_sched_time
         while not self.exit:
-            queue_empty = False
-            for _idx in xrange(0, EVENT_BATCH_COUNT):
-                try:
-                    event = self.queue.popleft()
-                    self.process(event)
-                except IndexError:
-                    queue_empty = True
-                    break
-            try:
-                if time_past(last_sched_time + SCHEDULER_INTERVAL):
-                    last_sched_time = time.time()
-                    if not self.up_to_date:
-                        self.reschedule()
-                        # TODO: this may be agressive, may want to
-                        #                check integrity out of band only.
-                        assert self.check_integrity()
-
-                if time_past(last_integrity_check + INTEGRITY_INTERVAL):
-                    assert self.check_integrity()
-                    last_integrity_check = time.time()
-            except AssertionError:
-                raise
-
-            if queue_empty:
-                time.sleep(CHECK_EVENT_INTERVAL)
+            self.process_pending()
+
+            if not self.up_to_date and time_past(last_sched_time +
+                                                 SCHEDULER_INTERVAL):
+                last_sched_time = time.time()
+                incremental = not time_past(last_full_sched_time +
+                                            FULL_SCHEDULER_INTERVAL)
+                if not incremental:
+                    last_full_sched_time = last_sched_time
+                self.reschedule(incremental=incremental)
+                # TODO: this may be agressive, may want to
+                #                check integrity out of band only.
+                assert self.check_integrity()
+
+            if time_past(last_integrity_check + INTEGRITY_INTERVAL):
+                assert self.check_integrity()
+                last_integrity_check = time.time()
+
+            if time_past(last_metrics_time + METRICS_INTERVAL):
+                self.report_metrics()
+                last_metrics_time = time.time()
+
+            # Sleep until new event arrives or something is due.
+            deadline = min(last_integrity_check + INTEGRITY_INTERVAL,
+                           last_metrics_time + METRICS_INTERVAL)
+            if not self.up_to_date:
+                deadline = min(deadline, last_sched_time + SCHEDULER_INTERVAL)
+            self.queue.wait(max(0, deadline - time.time()))
+
+    def report_metrics(self):
+        """Report event queue metrics."""
+        metrics = self.queue.metrics()
+        _LOGGER.info('Event queue: depth %(depth)d, max depth %(max_depth)d, '
+                     'received %(received)d, coalesced %(coalesced)d, '
+                     'processed %(processed)d, latency avg %(latency_avg).3f, '
+                     'max %(latency_max).3f', metrics)
+        return metrics
 
     @exc.exit_on_unhandled
     def run(self):
@@ -730,10 +1226,13 @@ class Master(object):
         with lock:
             self.run_real()
 
-    def reschedule(self, init=False):
+    def reschedule(self, init=False, incremental=False):
         """Run scheduler and adjust placement."""
-        placement = self.cell.schedule()
+        placement = self.cell.schedule(incremental=incremental)
 
+        writer = zkutils.BatchWriter(self.zkclient,
+                                     batch_size=PLACEMENT_BATCH_SIZE)
+        tasks = []
         if init:
             for servername, server in self.cell.members().iteritems():
                 placement_node = z.path.placement(servername)
@@ -746,8 +1245,7 @@ class Master(object):
 
                 for app in current - correct:
                     _LOGGER.info('Unscheduling: %s - %s', servername, app)
-                    zkutils.ensure_deleted(self.zkclient,
-                                           os.path.join(placement_node, app))
+                    writer.delete(os.path.join(placement_node, app))
                 for app in correct - current:
                     _LOGGER.info('Scheduling: %s - %s,%s',
                                  servername, app, self.cell.apps[app].identity)
@@ -758,11 +1256,10 @@ class Master(object):
                             'identity': self.cell.apps[app].identity
                         }
 
-                    zkutils.put(self.zkclient,
-                                os.path.join(placement_node, app),
-                                placement_data,
-                                acl=[_SERVERS_ACL])
-                    self._update_task(app, servername)
+                    writer.put(os.path.join(placement_node, app),
+                               placement_data,
+                               acl=[_SERVERS_ACL])
+                    tasks.append((app, servername))
         else:
             for app, before, after in placement:
                 if before == after:
@@ -770,9 +1267,7 @@ class Master(object):
 
                 if before:
                     _LOGGER.info('Unscheduling: %s - %s', before, app)
-                    zkutils.ensure_deleted(
-                        self.zkclient,
-                        z.path.placement(before, app))
+                    writer.delete(z.path.placement(before, app))
                 if after:
                     _LOGGER.info('Scheduling: %s - %s,%s',
                                  after, app, self.cell.apps[app].identity)
@@ -783,19 +1278,20 @@ class Master(object):
                             'identity': self.cell.apps[app].identity
                         }
 
-                    zkutils.put(
-                        self.zkclient,
-                        z.path.placement(after, app),
-                        placement_data,
-                        acl=[_SERVERS_ACL])
-                    self._update_task(app, after)
-                else:
-                    self._update_task(app, None)
+                    writer.put(z.path.placement(after, app),
+                               placement_data,
+                               acl=[_SERVERS_ACL])
+                tasks.append((app, after))
 
-            self._unschedule_evicted()
+        # Publish latest placement for the state readers.
+        self.publisher.publish(writer, placement, full=init)
+        writer.commit()
+        self._update_tasks(tasks)
 
-        # Store latest placement as reference.
-        zkutils.put(self.zkclient, z.path.placement(), placement)
+        if not init:
+            self._unschedule_evicted()
+        if not incremental:
+            self.save_snapshot()
         self.up_to_date = True
 
     def _unschedule_evicted(self):
@@ -818,10 +1314,23 @@ class Master(object):
         zkutils.ensure_exists(self.zkclient, z.path.task(appname),
                               acl=[_SERVERS_ACL])
 
-    def _update_task(self, appname, server):
-        """Creates/updates application task with the new placement."""
+    def _create_tasks(self, appnames):
+        """Ensures that tasks are created for the apps."""
+        zkutils.ensure_many_exist(self.zkclient,
+                                  [z.path.task(appname)
+                                   for appname in appnames],
+                                  acl=[_SERVERS_ACL])
+
+    def _update_tasks(self, updates):
+        """Creates/updates application tasks with the new placement.
+
+        Updates is a list of (appname, server) committed placements.
+        """
         # Servers in the cell have full control over task node.
-        if self.events_dir:
+        if not self.events_dir:
+            return
+
+        for appname, server in updates:
             if server:
                 appevents.post(self.events_dir, appname, 'scheduled', server)
             else:
@@ -0,0 +1,113 @@
+"""Sorted name index and glob pattern matching.
+
+Patterns used to query apps and endpoints almost always start with a literal
+<proid>.<app> prefix. Names are kept sorted, so only the range of names
+starting with the literal prefix of the pattern needs to be matched.
+"""
+from __future__ import absolute_import
+
+import bisect
+import fnmatch
+import re
+
+
+# Max number of compiled patterns kept in the cache.
+MAX_CACHED_PATTERNS = 1024
+
+_GLOB_CHARS_RE = re.compile(r'[*?[]')
+
+_COMPILED = dict()
+
+
+def literal_prefix(pattern):
+    """Returns the part of the pattern before the first glob character."""
+    match = _GLOB_CHARS_RE.search(pattern)
+    if match is None:
+        return pattern
+    return pattern[:match.start()]
+
+
+def compile_pattern(pattern):
+    """Returns (prefix, match function) of the glob pattern, cached."""
+    compiled = _COMPILED.get(pattern)
+    if compiled is None:
+        if len(_COMPILED) >= MAX_CACHED_PATTERNS:
+            _COMPILED.clear()
+        compiled = (literal_prefix(pattern),
+                    re.compile(fnmatch.translate(pattern)).match)
+        _COMPILED[pattern] = compiled
+    return compiled
+
+
+def filter_names(names, pattern):
+    """Returns list of names matching the pattern, in the original order."""
+    if pattern is None:
+        return list(names)
+    prefix, match = compile_pattern(pattern)
+    return [name for name in names
+            if name.startswith(prefix) and match(name)]
+
+
+def filter_sorted(names, pattern):
+    """Returns names matching the pattern from the sorted list of names.
+
+    Only the range of names starting with the pattern prefix is matched.
+    """
+    if pattern is None:
+        return list(names)
+    prefix, match = compile_pattern(pattern)
+    result = []
+    for idx in xrange(bisect.bisect_left(names, prefix), len(names)):
+        name = names[idx]
+        if not name.startswith(prefix):
+            break
+        if match(name):
+            result.append(name)
+    return result
+
+
+class NameIndex(object):
+    """Sorted index of names, supporting pattern range scans."""
+    __slots__ = (
+        'names',
+    )
+
+    def __init__(self, names=None):
+        self.names = sorted(set(names or []))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        idx = bisect.bisect_left(self.names, name)
+        return idx < len(self.names) and self.names[idx] == name
+
+    def add(self, name):
+        """Add name to the index."""
+        idx = bisect.bisect_left(self.names, name)
+        if idx == len(self.names) or self.names[idx] != name:
+            self.names.insert(idx, name)
+
+    def discard(self, name):
+        """Remove name from the index if present."""
+        idx = bisect.bisect_left(self.names, name)
+        if idx < len(self.names) and self.names[idx] == name:
+            del self.names[idx]
+
+    def update(self, added, removed):
+        """Add and remove names, rebuild the index if there are many."""
+        if len(added) + len(removed) > len(self.names) / 4:
+            names = set(self.names)
+            names.difference_update(removed)
+            names.update(added)
+            self.names = sorted(names)
+            return
+
+        for name in removed:
+            self.discard(name)
+        for name in added:
+            self.add(name)
+
+    def match(self, pattern):
+        """Returns sorted list of names matching the pattern."""
+        return filter_sorted(self.names, pattern)
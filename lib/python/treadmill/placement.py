@@ -0,0 +1,273 @@
+"""Sharded, versioned publication of the cell placement.
+
+Placement is sharded by app name prefix (proid). Each shard is a node under
+/placement-shards, holding the shard base record:
+
+    {"version": <version>, "placement": {<app>: <server or null>}}
+
+Every change of the shard is published as delta record child node, named
+after the version (zero padded):
+
+    {"version": <version>, "set": {<app>: <server or null>}, "del": [<app>]}
+
+Readers watch the children of the shards they are interested in and apply
+new deltas in order. Base is rewritten every MAX_DELTAS deltas, deltas folded
+into the previous base are deleted then, so a reader which is behind can
+always reload the base and continue with the deltas which follow it.
+"""
+from __future__ import absolute_import
+
+import collections
+import json
+import logging
+
+import kazoo
+
+from . import zknamespace as z
+from . import zkutils
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of deltas after which shard base is rewritten.
+MAX_DELTAS = 32
+
+
+def shard_name(appname):
+    """Returns placement shard of the app."""
+    return appname.partition('.')[0]
+
+
+def _delta_path(shard, version):
+    """Returns path of the shard delta record."""
+    return z.path.placement_shard(shard, '%010d' % version)
+
+
+def _encode(record):
+    """Encode placement record."""
+    return json.dumps(record, separators=(',', ':'))
+
+
+class PlacementPublisher(object):
+    """Publishes placement as sharded delta records."""
+    __slots__ = (
+        'zkclient',
+        'shards',
+        'versions',
+        'pending',
+        'folded',
+    )
+
+    def __init__(self, zkclient):
+        self.zkclient = zkclient
+        # Published placement, shard -> {app: server}
+        self.shards = dict()
+        # Version of the last published record, shard -> version.
+        self.versions = dict()
+        # Delta versions written since the last base.
+        self.pending = collections.defaultdict(list)
+        # Delta versions folded into the last base, deleted on next
+        # compaction.
+        self.folded = collections.defaultdict(list)
+
+    def load(self):
+        """Load versions of the published shards."""
+        try:
+            shards = self.zkclient.get_children(z.PLACEMENT_SHARDS)
+        except kazoo.client.NoNodeError:
+            shards = []
+
+        bases = dict(zkutils.get_many_raw(
+            self.zkclient, [z.path.placement_shard(shard) for shard in shards]
+        ))
+        for shard in shards:
+            version = 0
+            data = bases.get(z.path.placement_shard(shard))
+            if data:
+                version = json.loads(data)['version']
+
+            deltas = [int(child) for child in self.zkclient.get_children(
+                z.path.placement_shard(shard))]
+            self.versions[shard] = max([version] + deltas)
+            self.folded[shard] = deltas
+            self.shards[shard] = None
+
+    def publish(self, writer, placement, full=False):
+        """Queue placement changes on the zkutils.BatchWriter.
+
+        Placement is the (app, before, after) list returned by the scheduler.
+        If full is set, base of every shard is rewritten.
+        """
+        target = collections.defaultdict(dict)
+        for appname, _before, after in placement:
+            target[shard_name(appname)][appname] = after
+
+        for shard in set(self.shards) | set(target):
+            current = self.shards.get(shard)
+            new = target.get(shard, {})
+            if current is None:
+                # Not known what is published in the shard.
+                full_shard = True
+                changed = new
+                removed = []
+            else:
+                full_shard = full
+                changed = dict(
+                    (appname, server) for appname, server in new.iteritems()
+                    if appname not in current or current[appname] != server
+                )
+                removed = [appname for appname in current
+                           if appname not in new]
+
+            if not (changed or removed or full_shard):
+                continue
+
+            version = self.versions.get(shard, 0) + 1
+            self.versions[shard] = version
+            self.shards[shard] = new
+
+            if full_shard or len(self.pending[shard]) >= MAX_DELTAS:
+                _LOGGER.debug('Placement shard base: %s, %d', shard, version)
+                writer.put(z.path.placement_shard(shard),
+                           _encode({'version': version, 'placement': new}))
+                for folded in self.folded[shard]:
+                    writer.delete(_delta_path(shard, folded))
+                self.folded[shard] = self.pending[shard] + [version]
+                self.pending[shard] = []
+            else:
+                self.pending[shard].append(version)
+
+            writer.put(_delta_path(shard, version),
+                       _encode({'version': version,
+                                'set': changed,
+                                'del': removed}))
+
+
+class PlacementWatch(object):
+    """Keeps placement of the subscribed shards up to date.
+
+    on_change is invoked with (changed, removed), changed is dict of app to
+    server (None if pending) and removed is list of apps.
+    """
+    __slots__ = (
+        'zkclient',
+        'shard_filter',
+        'on_change',
+        'placement',
+        'shards',
+        'versions',
+    )
+
+    def __init__(self, zkclient, shard_filter=None, on_change=None):
+        self.zkclient = zkclient
+        self.shard_filter = shard_filter
+        self.on_change = on_change
+        # Placement of the subscribed shards, app -> server.
+        self.placement = dict()
+        # Apps in the shard, shard -> set of apps.
+        self.shards = dict()
+        # Applied version, shard -> version.
+        self.versions = dict()
+
+    def start(self):
+        """Start watching the placement shards."""
+        @self.zkclient.ChildrenWatch(z.PLACEMENT_SHARDS)
+        def _watch_shards(shards):
+            """Subscribe to new shards."""
+            for shard in shards:
+                if shard in self.versions:
+                    continue
+                if self.shard_filter and not self.shard_filter(shard):
+                    continue
+                self.subscribe(shard)
+            return True
+
+    def subscribe(self, shard):
+        """Start watching the shard."""
+        _LOGGER.debug('Subscribing to placement shard: %s', shard)
+        self.versions[shard] = None
+        self.shards[shard] = set()
+
+        @self.zkclient.ChildrenWatch(z.path.placement_shard(shard))
+        def _watch_shard(children):
+            """Apply new deltas."""
+            self.update(shard, children)
+            return shard in self.versions
+
+    def update(self, shard, children):
+        """Apply new deltas of the shard, reload base if needed."""
+        deltas = sorted(int(child) for child in children)
+        reload_base = self.versions.get(shard) is None
+        while True:
+            if reload_base:
+                version = self.versions.get(shard)
+                if not self._load_base(shard):
+                    return
+                if self.versions[shard] == version:
+                    # Base is not ahead of the missing deltas, wait for the
+                    # next change of the shard.
+                    return
+
+            version = self.versions[shard]
+            deltas = [delta for delta in deltas if delta > version]
+            if not deltas:
+                return
+
+            if deltas[0] != version + 1:
+                reload_base = True
+                continue
+
+            if self._apply_deltas(shard, deltas):
+                return
+
+            # Deltas were compacted meanwhile, continue from the new base.
+            reload_base = True
+
+    def _apply_deltas(self, shard, deltas):
+        """Apply the deltas in order, returns False if any is missing."""
+        records = zkutils.get_many_raw(
+            self.zkclient, [_delta_path(shard, delta) for delta in deltas])
+        for _path, data in records:
+            record = json.loads(data)
+            if record['version'] != self.versions[shard] + 1:
+                break
+
+            self._apply(shard, record['set'], record['del'])
+            self.versions[shard] = record['version']
+
+        return self.versions[shard] == deltas[-1]
+
+    def _load_base(self, shard):
+        """Reset shard from the base record, returns False if missing."""
+        try:
+            data, _metadata = self.zkclient.get(z.path.placement_shard(shard))
+        except kazoo.client.NoNodeError:
+            data = None
+
+        if not data:
+            return False
+
+        base = json.loads(data)
+        placement = base['placement']
+        changed = dict(
+            (appname, server) for appname, server in placement.iteritems()
+            if appname not in self.placement or
+            self.placement[appname] != server
+        )
+        removed = [appname for appname in self.shards[shard]
+                   if appname not in placement]
+        self._apply(shard, changed, removed)
+        self.versions[shard] = base['version']
+        return True
+
+    def _apply(self, shard, changed, removed):
+        """Apply placement changes."""
+        apps = self.shards[shard]
+        for appname in removed:
+            self.placement.pop(appname, None)
+            apps.discard(appname)
+        self.placement.update(changed)
+        apps.update(changed)
+
+        if self.on_change and (changed or removed):
+            self.on_change(changed, removed)
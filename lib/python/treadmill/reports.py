@@ -50,6 +50,40 @@ def servers(cell):
     return frame.set_index('name')
 
 
+def buckets(cell):
+    """Returns dataframe with aggregate capacity of the bucket hierarchy."""
+
+    def _bucket_rows(node):
+        """Generate rows for the node and all child buckets."""
+        if not node.children:
+            return
+
+        size = node.size()
+        free_size = node.free_size()
+        yield {
+            'name': node.name,
+            'level': node.level,
+            'servers': len(node.members()),
+            'memory': size[0],
+            'cpu': size[1],
+            'disk': size[2],
+            'free.memory': free_size[0],
+            'free.cpu': free_size[1],
+            'free.disk': free_size[2],
+        }
+        for child in node.children.values():
+            for row in _bucket_rows(child):
+                yield row
+
+    frame = pd.DataFrame.from_dict(list(_bucket_rows(cell)))
+    if frame.empty:
+        frame = pd.DataFrame(columns=['name', 'level', 'servers',
+                                      'memory', 'cpu', 'disk',
+                                      'free.memory', 'free.cpu', 'free.disk'])
+
+    return frame.set_index('name')
+
+
 def node_features(cell):
     """Return nodes and features as dataframe."""
     # Current concrete model assume features for servers only.
@@ -8,6 +8,8 @@ import importlib
 
 import flask
 
+from treadmill import wsgiserver
+
 
 FLASK_APP = flask.Flask(__name__)
 FLASK_APP.config['BUNDLE_ERRORS'] = True
@@ -23,8 +25,16 @@ class RestServer(object):
         self.port = int(port)
         self.host = host
 
-    def run(self, auth_type=None, protect=None):
-        """Start server"""
+    def run(self, auth_type=None, protect=None, workers=0,
+            threads=wsgiserver.DEFAULT_THREADS,
+            keepalive=wsgiserver.DEFAULT_KEEPALIVE, xheaders=False,
+            worker_init=None):
+        """Start server
+
+        With workers, serve with the pre-forked, multi-threaded server,
+        otherwise with the Flask development server. worker_init is invoked
+        in every server process before serving requests.
+        """
         # TODO: is there better way not to hardcode v3?
         if auth_type is not None:
             _LOGGER.info('Starting REST server: %s:%s, auth: %s, protect: %r',
@@ -41,5 +51,16 @@ class RestServer(object):
                          self.host, self.port)
 
         FLASK_APP.config['REST_SERVER'] = self
+        wsgiserver.install_stats(FLASK_APP)
+
+        if workers:
+            wsgiserver.serve(FLASK_APP, self.port, host=self.host,
+                             workers=workers, threads=threads,
+                             keepalive=keepalive, xheaders=xheaders,
+                             worker_init=worker_init)
+            return
+
+        if worker_init is not None:
+            worker_init()
         FLASK_APP.run(debug=True, use_reloader=False, use_evalex=False,
                       port=self.port, host=self.host)
@@ -6,12 +6,16 @@ from __future__ import absolute_import
 # pylint: disable=C0302
 
 import abc
+import bisect
 import collections
 import heapq
+import json
 import logging
 import operator
 import itertools
+import struct
 import time
+import zlib
 
 import enum
 
@@ -28,6 +32,14 @@ DIMENSION_COUNT = None
 _MAX_UTILIZATION = float('inf')
 _GLOBAL_ORDER_BASE = time.mktime((2014, 1, 1, 0, 0, 0, 0, 0, 0))
 
+# Initial number of rows in the feasibility matrix, doubled when full.
+_FEASIBILITY_INITIAL_ROWS = 64
+
+# Cell snapshot format, see dumps/loads.
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_MAGIC = 'TMSCHED\0'
+_SNAPSHOT_HEADER = struct.Struct('!8sHI')
+
 
 def zero_capacity():
     """Returns zero capacity vector."""
@@ -49,6 +61,20 @@ def utilization(demand, allocated, available):
     return np.max(np.subtract(demand, allocated) / available)
 
 
+def _cumulative_utilization(apps, allocated, available):
+    """Calculates utilization score of accumulated demand of each app.
+
+    Returns list of scores, same as calling utilization() with running sum
+    of app demands.
+    """
+    if not apps:
+        return []
+    acc_demand = np.cumsum([app.demand for app in apps], axis=0)
+    return np.max(
+        np.subtract(acc_demand, allocated) / available, axis=1
+    ).tolist()
+
+
 def _all(oper, left, right):
     """Short circuit all for ndarray."""
     return all(oper(ai, bi) for ai, bi in itertools.izip(left, right))
@@ -195,11 +221,11 @@ class Application(object):
         'name',
         'demand',
         'affinity',
-        'priority',
+        '_priority',
         'features',
         'allocation',
         'data_retention_timeout',
-        'server',
+        '_server',
         'duration',
         'identity',
         'identity_group',
@@ -218,10 +244,10 @@ class Application(object):
 
         self.global_order = _global_order()
         self.allocation = None
-        self.server = None
+        self._server = None
         self.name = name
         self.affinity = Affinity(affinity, affinity_limits)
-        self.priority = priority
+        self._priority = priority
         self.demand = np.array(demand, dtype=float)
         self.data_retention_timeout = data_retention_timeout
         self.duration = duration
@@ -231,6 +257,30 @@ class Application(object):
         self.schedule_once = schedule_once
         self.evicted = False
 
+    @property
+    def server(self):
+        """Name of the server the app is placed on."""
+        return self._server
+
+    @server.setter
+    def server(self, server):
+        """Set app placement, invalidates allocation queue."""
+        if self._server != server and self.allocation is not None:
+            self.allocation.invalidate()
+        self._server = server
+
+    @property
+    def priority(self):
+        """App priority."""
+        return self._priority
+
+    @priority.setter
+    def priority(self, priority):
+        """Set app priority, invalidates allocation queue order."""
+        if self._priority != priority and self.allocation is not None:
+            self.allocation.invalidate(reordered=True)
+        self._priority = priority
+
     def acquire_identity(self):
         """Try to acquire identity if belong to the group.
 
@@ -275,6 +325,22 @@ class Strategy(object):
 
     __metaclass__ = abc.ABCMeta
 
+    @classmethod
+    def create(cls, bucket):
+        """Create strategy for the children of the bucket."""
+        return cls(bucket.children.keys())
+
+    def nodes(self, _app):
+        """Generate node names to try, until the suggestions wrap around."""
+        nodename0 = self.suggested_node()
+        yield nodename0
+
+        while True:
+            nodename = self.next_node()
+            if nodename == nodename0:
+                return
+            yield nodename
+
     @abc.abstractmethod
     def suggested_node(self):
         """Suggested node that should be tried first."""
@@ -313,7 +379,7 @@ class PackStrategy(Strategy):
 
     def __init__(self, nodes):
         self.inodes = itertools.cycle(nodes)
-        self.current = self.inodes.next()
+        self.current = next(self.inodes, None)
 
     def suggested_node(self):
         """Suggest same node as previous placement."""
@@ -325,6 +391,146 @@ class PackStrategy(Strategy):
         return self.current
 
 
+class CapacityIndex(object):
+    """Up children of the bucket, ordered by free capacity.
+
+    Free capacity vectors are compared lexicographically, so nodes ordered
+    before the demand vector can't fit the app and are never visited.
+    """
+    __slots__ = (
+        'keys',
+        'entries',
+    )
+
+    def __init__(self, nodes):
+        self.keys = dict()
+        self.entries = []
+        for node in nodes:
+            self.update(node)
+
+    def update(self, node):
+        """Update node position in the index."""
+        key = self.keys.get(node.name)
+        if node.state is State.up:
+            new_key = tuple(node.free_capacity)
+        else:
+            new_key = None
+
+        if key == new_key:
+            return
+
+        if key is not None:
+            del self.entries[bisect.bisect_left(self.entries,
+                                                (key, node.name))]
+            del self.keys[node.name]
+
+        if new_key is not None:
+            bisect.insort(self.entries, (new_key, node.name))
+            self.keys[node.name] = new_key
+
+    def remove(self, nodename):
+        """Remove node from the index."""
+        key = self.keys.pop(nodename, None)
+        if key is not None:
+            del self.entries[bisect.bisect_left(self.entries,
+                                                (key, nodename))]
+
+    def ascending(self, demand):
+        """Generate names of nodes with free capacity not less than demand,
+        least free capacity first."""
+        first = bisect.bisect_left(self.entries, (tuple(demand),))
+        for idx in xrange(first, len(self.entries)):
+            yield self.entries[idx][1]
+
+    def descending(self, demand):
+        """Generate names of nodes with free capacity not less than demand,
+        most free capacity first."""
+        first = bisect.bisect_left(self.entries, (tuple(demand),))
+        for idx in xrange(len(self.entries) - 1, first - 1, -1):
+            yield self.entries[idx][1]
+
+
+class CapacityStrategy(Strategy):
+    """Base class for strategies ordering nodes by free capacity."""
+    __slots__ = (
+        'index',
+        '_inodes',
+        '_current',
+    )
+
+    def __init__(self, index):
+        self.index = index
+        self._inodes = None
+        self._current = None
+
+    @classmethod
+    def create(cls, bucket):
+        """Create strategy using the capacity index of the bucket."""
+        return cls(bucket.capacity_index())
+
+    @abc.abstractmethod
+    def nodes(self, app):
+        """Generate node names which can fit the app, in preferred order."""
+        pass
+
+    def suggested_node(self):
+        """Suggest preferred node regardless of demand."""
+        self._inodes = self.nodes(None)
+        return self.next_node()
+
+    def next_node(self):
+        """Suggest next node in the preferred order, wrapping around."""
+        if self._inodes is None:
+            return self.suggested_node()
+
+        self._current = next(self._inodes, None)
+        if self._current is None:
+            self._inodes = self.nodes(None)
+            self._current = next(self._inodes, None)
+        return self._current
+
+
+class BestFitStrategy(CapacityStrategy):
+    """Best fit strategy suggests nodes with least free capacity first."""
+    __slots__ = ()
+
+    def nodes(self, app):
+        """Generate nodes which can fit the app, least free capacity first."""
+        demand = app.demand if app is not None else zero_capacity()
+        return self.index.ascending(demand)
+
+
+class WorstFitStrategy(CapacityStrategy):
+    """Worst fit strategy suggests nodes with most free capacity first."""
+    __slots__ = ()
+
+    def nodes(self, app):
+        """Generate nodes which can fit the app, most free capacity first."""
+        demand = app.demand if app is not None else zero_capacity()
+        return self.index.descending(demand)
+
+
+STRATEGIES = {
+    'spread': SpreadStrategy,
+    'pack': PackStrategy,
+    'bestfit': BestFitStrategy,
+    'worstfit': WorstFitStrategy,
+}
+
+
+def register_strategy(name, strategy_t):
+    """Register placement strategy under given name."""
+    assert issubclass(strategy_t, Strategy)
+    STRATEGIES[name] = strategy_t
+
+
+def get_strategy(strategy):
+    """Returns strategy type, looking up strategy names in the registry."""
+    if isinstance(strategy, basestring):
+        return STRATEGIES[strategy]
+    return strategy
+
+
 class FeatureSet(object):
     """Hierarchical set of features."""
     __slots__ = (
@@ -388,6 +594,125 @@ class AffinityCounter(object):
         self.affinity_counter = collections.Counter()
 
 
+class FeasibilityMatrix(object):
+    """Free capacity of all servers in the cell as one contiguous matrix.
+
+    Each attached server owns a row of the (n_servers, DIMENSION_COUNT)
+    matrix, and server.free_capacity becomes a view into that row, so put and
+    remove update the matrix in place.
+
+    The set of servers that can fit a given demand is calculated with single
+    broadcasted comparison, and buckets use it to skip children that do not
+    contain a single feasible server.
+    """
+    __slots__ = (
+        'capacity',
+        'active',
+        'servers',
+        'rows',
+        'generation',
+        '_free_rows',
+        '_node_rows',
+        '_fit_app',
+        '_fit_generation',
+        '_fit_mask',
+    )
+
+    def __init__(self, size=_FEASIBILITY_INITIAL_ROWS):
+        self.capacity = np.zeros((size, DIMENSION_COUNT))
+        self.active = np.zeros(size, dtype=bool)
+        self.servers = [None] * size
+        self.rows = dict()
+        self.generation = 0
+        self._free_rows = range(size - 1, -1, -1)
+        self._node_rows = dict()
+        self._fit_app = None
+        self._fit_generation = None
+        self._fit_mask = None
+
+    def _grow(self):
+        """Double the matrix, re-pointing server capacity views."""
+        size = len(self.servers)
+        capacity = np.zeros((size * 2, DIMENSION_COUNT))
+        capacity[:size] = self.capacity
+        active = np.zeros(size * 2, dtype=bool)
+        active[:size] = self.active
+
+        self.capacity = capacity
+        self.active = active
+        self.servers.extend([None] * size)
+        self._free_rows.extend(xrange(size * 2 - 1, size - 1, -1))
+
+        for row, server in enumerate(self.servers[:size]):
+            if server is not None:
+                server.free_capacity = self.capacity[row]
+
+    def attach(self, server):
+        """Allocate matrix row for the server."""
+        assert server.name not in self.rows
+        if not self._free_rows:
+            self._grow()
+
+        row = self._free_rows.pop()
+        self.capacity[row] = server.free_capacity
+        self.active[row] = server.state is State.up
+        self.servers[row] = server
+        self.rows[server.name] = row
+        server.free_capacity = self.capacity[row]
+
+        self._node_rows = dict()
+        self.changed()
+
+    def detach(self, server):
+        """Release server row, server gets private copy of free capacity."""
+        row = self.rows.pop(server.name)
+        server.free_capacity = self.capacity[row].copy()
+
+        self.capacity[row] = 0
+        self.active[row] = False
+        self.servers[row] = None
+        self._free_rows.append(row)
+
+        self._node_rows = dict()
+        self.changed()
+
+    def set_active(self, server):
+        """Record if server is accepting new placements."""
+        self.active[self.rows[server.name]] = server.state is State.up
+        self.changed()
+
+    def changed(self):
+        """Invalidate cached feasibility, called on every capacity change."""
+        self.generation += 1
+
+    def feasible(self, app):
+        """Returns boolean mask of the rows which can fit the app demand."""
+        if (self._fit_app is not app or
+                self._fit_generation != self.generation):
+            self._fit_mask = np.logical_and(
+                np.all(self.capacity >= app.demand, axis=1),
+                self.active
+            )
+            self._fit_app = app
+            self._fit_generation = self.generation
+
+        return self._fit_mask
+
+    def node_rows(self, node):
+        """Returns array of matrix rows of the servers under the node."""
+        rows = self._node_rows.get(node)
+        if rows is None:
+            rows = np.array([self.rows[name] for name in node.members()],
+                            dtype=int)
+            self._node_rows[node] = rows
+
+        return rows
+
+    def fits(self, node, app):
+        """Check if there is at least one server under node that fits app."""
+        return bool(np.any(self.feasible(app)[self.node_rows(node)]))
+
+
 class Node(object):
     """Abstract placement node."""
 
@@ -400,6 +725,10 @@ class Node(object):
         'features',
         'affinity_counters',
         'valid_until',
+        'feasibility',
+        '_members',
+        '_size',
+        '_free_size',
         '_state',
         '_state_since',
     )
@@ -413,6 +742,10 @@ class Node(object):
         self.features = FeatureSet(features)
         self.affinity_counters = collections.Counter()
         self.valid_until = valid_until
+        self.feasibility = None
+        self._members = dict()
+        self._size = zero_capacity()
+        self._free_size = zero_capacity()
         self._state = State.up
         self._state_since = time.time()
 
@@ -422,9 +755,14 @@ class Node(object):
 
     def set_state(self, state, since):
         """Sets the state and time since."""
-        if self._state is not state:
+        changed = self._state is not state
+        if changed:
             self._state_since = since
+            if self.parent:
+                self.parent.topology_changed(self)
         self._state = state
+        if changed and self.parent:
+            self.parent.child_capacity_changed(self)
         _LOGGER.debug('state: %s - (%s, %s)',
                       self.name, self._state, self._state_since)
 
@@ -458,6 +796,11 @@ class Node(object):
         if self.parent:
             self.parent.adjust_valid_until(child_valid_until)
 
+    def topology_changed(self, node):
+        """Propagate node add/remove/state change to the top."""
+        if self.parent:
+            self.parent.topology_changed(node)
+
     def remove_child_features(self, node):
         """Recursively remove child features up."""
         self.features.remove(node.features)
@@ -466,10 +809,54 @@ class Node(object):
 
     def reset_children(self):
         """Reset children to empty list."""
+        self._remove_members(self._members.keys())
+        if self.parent:
+            self.parent.adjust_totals(-self._size, -self._free_size)
+        self._size = zero_capacity()
+        self._free_size = zero_capacity()
         for child in self.children.values():
             child.parent = None
+            if self.feasibility is not None:
+                child.detach_feasibility()
+            self.topology_changed(child)
         self.children = collections.OrderedDict()
 
+    def _add_members(self, members):
+        """Add leaf servers to the index of self and all parents."""
+        node = self
+        while node is not None:
+            node._members.update(members)
+            node = node.parent
+
+    def _remove_members(self, names):
+        """Remove leaf servers from the index of self and all parents."""
+        node = self
+        while node is not None:
+            for name in names:
+                node._members.pop(name, None)
+            node = node.parent
+
+    def adjust_totals(self, size_delta, free_size_delta):
+        """Adjust aggregate capacity of self and all parents."""
+        node = self
+        while node is not None:
+            node._size += size_delta
+            node._free_size += free_size_delta
+            node = node.parent
+
+    def attach_feasibility(self, feasibility):
+        """Recursively attach node and its children to feasibility matrix."""
+        self.feasibility = feasibility
+        for child in self.children.values():
+            child.attach_feasibility(feasibility)
+
+    def detach_feasibility(self):
+        """Recursively detach node and its children from feasibility matrix.
+        """
+        for child in self.children.values():
+            child.detach_feasibility()
+        self.feasibility = None
+
     def add_node(self, node):
         """Add child node, set the features and propagate features up."""
         assert node.parent is None
@@ -477,22 +864,39 @@ class Node(object):
 
         node.parent = self
         self.children[node.name] = node
+        self._add_members(node.members())
+        # Empty bucket has zero size, eps is only reported by size().
+        # pylint: disable=W0212
+        self.adjust_totals(node._size, node.free_size())
 
         node.features.inherit(self.features)
         self.add_child_features(node)
         self.increment_affinity(node.affinity_counters)
         self.adjust_valid_until(node.valid_until)
 
+        if self.feasibility is not None:
+            node.attach_feasibility(self.feasibility)
+
+        self.topology_changed(node)
+
     def remove_node(self, node_name):
         """Remove child node and adjust the features."""
         assert node_name in self.children
         node = self.children[node_name]
 
         del self.children[node_name]
+        self._remove_members(node.members().keys())
+        # pylint: disable=W0212
+        self.adjust_totals(-node._size, -node.free_size())
         self.remove_child_features(node)
         self.decrement_affinity(node.affinity_counters)
         self.adjust_valid_until(None)
 
+        if node.feasibility is not None:
+            node.detach_feasibility()
+
+        self.topology_changed(node)
+
         node.parent = None
         node.features.inherited_features = set()
 
@@ -519,20 +923,24 @@ class Node(object):
 
     def size(self):
         """Returns total capacity of the children."""
-        if not self.children:
+        if not self._members:
             return np.array(
                 [np.finfo(float).eps for _x in xrange(0, DIMENSION_COUNT)]
             )
         else:
-            return np.sum([n.size() for n in self.children.values()], 0)
+            return self._size.copy()
+
+    def free_size(self):
+        """Returns total free capacity of the children that are up."""
+        return self._free_size.copy()
 
     def members(self):
-        """Return set of all leaf node names."""
-        names = dict()
-        for node in self.children.values():
-            names.update(node.members())
+        """Return dict of all leaf servers by name.
 
-        return names
+        The index is maintained by add_node/remove_node on all levels of the
+        hierarchy, the returned dict must not be modified by the caller.
+        """
+        return self._members
 
     def increment_affinity(self, counters):
         """Increment affinity counters recursively."""
@@ -552,7 +960,9 @@ class Bucket(Node):
 
     __slots__ = (
         'affinity_strategies',
+        'default_strategy_t',
         'features',
+        '_capacity_index',
     )
 
     _default_strategy_t = SpreadStrategy
@@ -560,19 +970,51 @@ class Bucket(Node):
     def __init__(self, name, features=None, level=None):
         super(Bucket, self).__init__(name, features, level)
         self.affinity_strategies = dict()
+        self.default_strategy_t = Bucket._default_strategy_t
         self.features = FeatureSet(features)
+        self._capacity_index = None
 
     def set_affinity_strategy(self, affinity, strategy_t):
-        """Initilaizes placement strategy for given affinity."""
-        self.affinity_strategies[affinity] = strategy_t(self.children.keys())
+        """Initilaizes placement strategy for given affinity.
+
+        Strategy can be a Strategy subclass or a registered strategy name.
+        """
+        strategy_t = get_strategy(strategy_t)
+        self.affinity_strategies[affinity] = strategy_t.create(self)
+
+    def set_default_strategy(self, strategy_t):
+        """Sets strategy for affinities without explicit strategy."""
+        self.default_strategy_t = get_strategy(strategy_t)
 
     def get_affinity_strategy(self, affinity):
         """Returns placement strategy for the affinity, defaults to spread."""
         if affinity not in self.affinity_strategies:
-            self.set_affinity_strategy(affinity, Bucket._default_strategy_t)
+            self.set_affinity_strategy(affinity, self.default_strategy_t)
 
         return self.affinity_strategies[affinity]
 
+    def capacity_index(self):
+        """Returns index of children by free capacity, created on demand."""
+        if self._capacity_index is None:
+            self._capacity_index = CapacityIndex(self.children.values())
+        return self._capacity_index
+
+    def child_capacity_changed(self, node):
+        """Update capacity index after free capacity or state of the child
+        has changed."""
+        if self._capacity_index is not None:
+            self._capacity_index.update(node)
+        if self.parent:
+            self.parent.child_capacity_changed(self)
+
+    def reset_children(self):
+        """Reset children and the capacity index."""
+        super(Bucket, self).reset_children()
+        if self._capacity_index is not None:
+            self._capacity_index = CapacityIndex([])
+        if self.parent:
+            self.parent.child_capacity_changed(self)
+
     def adjust_capacity_up(self, new_capacity):
         """Node can only increase capacity."""
         self.free_capacity = np.maximum(self.free_capacity, new_capacity)
@@ -609,12 +1051,17 @@ class Bucket(Node):
         """Adds node to the bucket."""
         super(Bucket, self).add_node(node)
         self.adjust_capacity_up(node.free_capacity)
+        self.child_capacity_changed(node)
 
     def remove_node(self, node_name):
         """Removes node from the bucket."""
         node = super(Bucket, self).remove_node(node_name)
         # if _any_isclose(self.free_capacity, node.free_capacity):
         self.adjust_capacity_down(node.free_capacity)
+        if self._capacity_index is not None:
+            self._capacity_index.remove(node_name)
+        if self.parent:
+            self.parent.child_capacity_changed(self)
 
         return node
 
@@ -628,16 +1075,7 @@ class Bucket(Node):
             return False
 
         strategy = self.get_affinity_strategy(app.affinity.name)
-        nodename0 = strategy.suggested_node()
-        nodename = nodename0
-        first = True
-        while True:
-            # End of iteration.
-            if not first and nodename == nodename0:
-                _LOGGER.debug('Finished iterating on: %s.', self.name)
-                break
-            first = False
-
+        for nodename in strategy.nodes(app):
             _LOGGER.debug('Trying node: %s:', nodename)
 
             node = self.children.get(nodename)
@@ -646,12 +1084,14 @@ class Bucket(Node):
                     _LOGGER.debug('Node does not exist: %s', nodename)
                 else:
                     _LOGGER.debug('Node not up: %s, %s', nodename, node.state)
+            elif (self.feasibility is not None and
+                  not self.feasibility.fits(node, app)):
+                _LOGGER.debug('No feasible server: %s', nodename)
             else:
                 if node.put(app):
                     return True
 
-            nodename = strategy.next_node()
-
+        _LOGGER.debug('Finished iterating on: %s.', self.name)
         return False
 
 
@@ -668,11 +1108,23 @@ class Server(Node):
                                      valid_until=valid_until)
         self.init_capacity = np.array(capacity, dtype=float)
         self.free_capacity = self.init_capacity.copy()
+        self._size = self.init_capacity.copy()
         self.apps = dict()
+        self._members[self.name] = self
 
     def __str__(self):
         return 'server: %s %s' % (self.name, self.init_capacity)
 
+    def attach_feasibility(self, feasibility):
+        """Allocate server row in the feasibility matrix."""
+        super(Server, self).attach_feasibility(feasibility)
+        feasibility.attach(self)
+
+    def detach_feasibility(self):
+        """Release server row in the feasibility matrix."""
+        self.feasibility.detach(self)
+        super(Server, self).detach_feasibility()
+
     def is_same(self, other):
         """Compares capacity and features against another server.
 
@@ -698,11 +1150,16 @@ class Server(Node):
         prev_capacity = self.free_capacity.copy()
         self.free_capacity -= app.demand
         self.apps[app.name] = app
+        if self.feasibility is not None:
+            self.feasibility.changed()
 
         self.increment_affinity([app.affinity.name])
         app.server = self.name
         if self.parent:
+            if self.state is State.up:
+                self.parent.adjust_totals(0, -app.demand)
             self.parent.adjust_capacity_down(prev_capacity)
+            self.parent.child_capacity_changed(self)
 
         return True
 
@@ -715,10 +1172,42 @@ class Server(Node):
         app.server = None
         app.evicted = True
         self.free_capacity += app.demand
+        if self.feasibility is not None:
+            self.feasibility.changed()
         self.decrement_affinity([app.affinity.name])
 
         if self.parent:
+            if self.state is State.up:
+                self.parent.adjust_totals(0, app.demand)
             self.parent.adjust_capacity_up(self.free_capacity)
+            self.parent.child_capacity_changed(self)
+
+    def restore(self, apps):
+        """Put apps on the server without checking the constraints.
+
+        Used to restore known placements in bulk, capacity changes are
+        propagated to the parents once.
+        """
+        prev_capacity = self.free_capacity.copy()
+        demand = zero_capacity()
+        affinities = []
+        for app in apps:
+            assert app.name not in self.apps
+            self.apps[app.name] = app
+            app.server = self.name
+            demand += app.demand
+            affinities.append(app.affinity.name)
+
+        self.free_capacity -= demand
+        if self.feasibility is not None:
+            self.feasibility.changed()
+
+        self.increment_affinity(affinities)
+        if self.parent:
+            if self.state is State.up:
+                self.parent.adjust_totals(0, -demand)
+            self.parent.adjust_capacity_down(prev_capacity)
+            self.parent.child_capacity_changed(self)
 
     def remove_all(self):
         """Remove all apps."""
@@ -730,13 +1219,28 @@ class Server(Node):
         """Return server capacity."""
         return self.init_capacity
 
+    def free_size(self):
+        """Return server free capacity, zero if server is not up."""
+        if self.state is State.up:
+            return self.free_capacity.copy()
+        else:
+            return zero_capacity()
+
     def members(self):
         """Return set of all leaf node names."""
-        return {self.name: self}
+        return self._members
 
     def set_state(self, state, since):
         """Change host state."""
+        prev_state = self.state
         super(Server, self).set_state(state, since)
+        if self.parent and prev_state is not state:
+            if state is State.up:
+                self.parent.adjust_totals(0, self.free_capacity)
+            elif prev_state is State.up:
+                self.parent.adjust_totals(0, -self.free_capacity)
+        if self.feasibility is not None:
+            self.feasibility.set_active(self)
 
         if self.state is state:
             return
@@ -782,6 +1286,10 @@ class Allocation(object):
 
     Allocation queue can be capped with max_utilization parameter. If set, it
     will specify the max_utilization which will be considered for scheduling.
+
+    Utilization queues are cached, and invalidated up the allocation tree
+    when apps are added, removed, placed or any allocation attribute changes,
+    so that only the modified segments are sorted and merged again.
     """
 
     __slots__ = (
@@ -792,10 +1300,23 @@ class Allocation(object):
         'apps',
         'sub_allocations',
         'path',
+        'parent',
+        'reordered',
+        'added',
+        '_priv_queue',
+        '_queue',
+        '_queue_key',
     )
 
     def __init__(self, reserved=None, rank=None, features=None,
                  max_utilization=None):
+        self.parent = None
+        self.reordered = True
+        self.added = set()
+        self._priv_queue = None
+        self._queue = None
+        self._queue_key = None
+
         self.set_reserved(reserved)
 
         self.rank = None
@@ -815,8 +1336,37 @@ class Allocation(object):
         """Returns full allocation name."""
         return '/'.join(self.path)
 
+    def invalidate(self, reordered=False):
+        """Invalidate cached queue of self and all parent allocations.
+
+        If reordered is set, the change may allow pending apps to evict apps
+        that were placed before (as opposed to only adding/placing apps), and
+        it is recorded on the root allocation.
+
+        Returns the root allocation.
+        """
+        self._priv_queue = None
+        alloc = self
+        while True:
+            alloc._queue = None
+            if alloc.parent is None:
+                break
+            alloc = alloc.parent
+
+        if reordered:
+            alloc.reordered = True
+        return alloc
+
+    def reset_cache(self):
+        """Recursively drop all cached queues."""
+        self._priv_queue = None
+        self._queue = None
+        for alloc in self.sub_allocations.values():
+            alloc.reset_cache()
+
     def set_reserved(self, reserved):
         """Update reserved capacity."""
+        self.invalidate(reordered=True)
         if reserved is None:
             self.reserved = zero_capacity()
         elif isinstance(reserved, int):
@@ -835,6 +1385,7 @@ class Allocation(object):
 
     def update(self, reserved, rank, max_utilization=None):
         """Updates allocation."""
+        self.invalidate(reordered=True)
         if rank is not None:
             self.rank = rank
         else:
@@ -844,6 +1395,7 @@ class Allocation(object):
 
     def set_max_utilization(self, max_utilization):
         """Sets max_utilization, accounting for default None value."""
+        self.invalidate(reordered=True)
         if max_utilization:
             self.max_utilization = max_utilization
         else:
@@ -851,6 +1403,7 @@ class Allocation(object):
 
     def set_features(self, features):
         """Set features, account for default None value."""
+        self.invalidate(reordered=True)
         if not features:
             self.features = set()
         else:
@@ -869,14 +1422,22 @@ class Allocation(object):
 
         app.allocation = self
         self.apps[app.name] = app
+        self.invalidate().added.add(app.name)
 
     def remove(self, name):
         """Remove application from the allocation queue."""
         if name in self.apps:
             self.apps[name].allocation = None
             del self.apps[name]
+            self.invalidate(reordered=True)
 
     def priv_utilization_queue(self):
+        """Returns tuples for sorted by global utilization (cached)."""
+        if self._priv_queue is None:
+            self._priv_queue = list(self._priv_utilization_queue())
+        return iter(self._priv_queue)
+
+    def _priv_utilization_queue(self):
         """Returns tuples for sorted by global utilization.
 
         Apps in the queue are ordered by priority, insertion order.
@@ -893,13 +1454,11 @@ class Allocation(object):
             return (-app.priority, 0 if app.server else 1,
                     app.global_order, app.name)
 
-        acc_demand = zero_capacity()
         prio_queue = sorted(self.apps.values(), key=app_key)
 
         available = self.reserved + np.finfo(float).eps
-        for app in prio_queue:
-            acc_demand = acc_demand + app.demand
-            util = utilization(acc_demand, self.reserved, available)
+        utils = _cumulative_utilization(prio_queue, self.reserved, available)
+        for app, util in itertools.izip(prio_queue, utils):
             # Priority 0 apps are treated specially - utilization is set to
             # max float.
             #
@@ -929,6 +1488,14 @@ class Allocation(object):
         The function maintains invariant that any app (self or inside sub-alloc
         with utilization < 1 will remain with utilzation < 1.
         """
+        queue_key = tuple(np.ravel(free_capacity))
+        if self._queue is None or self._queue_key != queue_key:
+            self._queue = list(self._utilization_queue(free_capacity))
+            self._queue_key = queue_key
+        return iter(self._queue)
+
+    def _utilization_queue(self, free_capacity):
+        """Merges self and sub-alloc queues, recalculating utilization."""
         total_reserved = self.total_reserved()
 
         queues = [alloc.utilization_queue(0)
@@ -936,12 +1503,12 @@ class Allocation(object):
 
         queues.append(self.priv_utilization_queue())
 
-        acc_demand = zero_capacity()
+        merged = list(heapq.merge(*queues))
         available = total_reserved + free_capacity + np.finfo(float).eps
-        for item in heapq.merge(*queues):
+        utils = _cumulative_utilization([item[-1] for item in merged],
+                                        total_reserved, available)
+        for item, util in itertools.izip(merged, utils):
             rank, _util, pending, order, app = item
-            acc_demand = acc_demand + app.demand
-            util = utilization(acc_demand, total_reserved, available)
             if app.priority == 0:
                 util = _MAX_UTILIZATION
             # - lower rank allocations take precedence.
@@ -962,11 +1529,15 @@ class Allocation(object):
         self.sub_allocations[name] = alloc
         assert not alloc.path
         alloc.path = self.path + [name]
+        alloc.parent = self
+        self.invalidate(reordered=True)
 
     def remove_sub_alloc(self, name):
         """Remove chlid allocation."""
         if name in self.sub_allocations:
+            self.sub_allocations[name].parent = None
             del self.sub_allocations[name]
+            self.invalidate(reordered=True)
 
     def get_sub_alloc(self, name):
         """Return sub allocation, create empty if it does not exist."""
@@ -975,6 +1546,98 @@ class Allocation(object):
         return self.sub_allocations[name]
 
 
+class EvictionIndex(object):
+    """Index of placed apps by server, ordered by position in the queue.
+
+    Used to find the cheapest set of apps behind the given queue position
+    which can be evicted from a single server to place the app.
+    """
+    __slots__ = (
+        'queue',
+        'positions',
+        'placed',
+    )
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.positions = dict()
+        self.placed = collections.defaultdict(list)
+        for pos, app in enumerate(queue):
+            self.positions[app.name] = pos
+            if app.server:
+                self.placed[app.server].append(pos)
+
+    def add(self, app):
+        """Record placement of the app."""
+        bisect.insort(self.placed[app.server], self.positions[app.name])
+
+    def remove(self, app):
+        """Remove the app from the index, before it is evicted."""
+        positions = self.placed[app.server]
+        del positions[bisect.bisect_left(positions,
+                                         self.positions[app.name])]
+
+    def victims(self, server, pos, app):
+        """Returns apps behind pos to evict from the server to fit the app.
+
+        Apps are evicted from the end of the queue, apps which are not needed
+        to free enough capacity are retained. Returns None if evicting all
+        apps behind pos is not enough.
+        """
+        positions = self.placed.get(server.name)
+        if not positions:
+            return None
+
+        free_capacity = server.free_capacity.copy()
+        victims = []
+        for idx in xrange(len(positions) - 1,
+                          bisect.bisect_right(positions, pos) - 1, -1):
+            victim = self.queue[positions[idx]]
+            victims.append(victim)
+            free_capacity += victim.demand
+            if not _any_gt(app.demand, free_capacity):
+                break
+        else:
+            return None
+
+        # The last victim is required, see if some of the lower priority
+        # victims can be retained.
+        required = []
+        for victim in victims[:-1]:
+            if _any_gt(app.demand, free_capacity - victim.demand):
+                required.append(victim)
+            else:
+                free_capacity -= victim.demand
+        required.append(victims[-1])
+        return required
+
+    def candidates(self, pos, app, servers):
+        """Returns heap of (cost, server name, victims) for the app.
+
+        Cost is the position of highest priority victim (negated, as evicting
+        apps further in the queue is cheaper) and the number of victims.
+        """
+        heap = []
+        for servername, positions in self.placed.iteritems():
+            if not positions or positions[-1] <= pos:
+                continue
+
+            server = servers[servername]
+            if server.state is not State.up:
+                continue
+            if not all(server.features.has(feature)
+                       for feature in app.features):
+                continue
+
+            victims = self.victims(server, pos, app)
+            if victims:
+                cost = (-self.positions[victims[-1].name], len(victims))
+                heap.append((cost, servername, victims))
+
+        heapq.heapify(heap)
+        return heap
+
+
 class Cell(Bucket):
     """Top level node."""
     __slots__ = (
@@ -982,14 +1645,28 @@ class Cell(Bucket):
         'next_event_at',
         'apps',
         'identity_groups',
+        '_dirty_servers',
+        '_identities_changed',
+        '_scheduled_allocation',
+        '_evicted',
     )
 
-    def __init__(self, name):
+    def __init__(self, name, feasibility=False):
         super(Cell, self).__init__(name, features=[], level='cell')
         self.allocation = Allocation()
         self.apps = dict()
         self.identity_groups = collections.defaultdict(IdentityGroup)
         self.next_event_at = np.inf
+        self._dirty_servers = set()
+        self._identities_changed = False
+        self._scheduled_allocation = None
+        self._evicted = False
+        if feasibility:
+            self.attach_feasibility(FeasibilityMatrix())
+
+    def topology_changed(self, node):
+        """Record modified node, to be handled by next schedule pass."""
+        self._dirty_servers.add(node.name)
 
     def add_app(self, allocation, app):
         """Adds application to the scheduled list."""
@@ -1020,6 +1697,7 @@ class Cell(Bucket):
 
     def configure_identity_group(self, name, count):
         """Add identity group to the cell."""
+        self._identities_changed = True
         if name not in self.identity_groups:
             self.identity_groups[name] = IdentityGroup(count)
         else:
@@ -1029,6 +1707,7 @@ class Cell(Bucket):
         """Remove identity group."""
         ident_group = self.identity_groups.get(name)
         if ident_group:
+            self._identities_changed = True
             in_use = False
             for app in self.apps:
                 if app.identity_group_ref == ident_group:
@@ -1088,13 +1767,32 @@ class Cell(Bucket):
                 for name in to_be_moved:
                     server.remove(name)
 
-    def _find_placements(self, queue, servers):
-        """Run the queue and find placements."""
+    def _find_placements(self, queue, servers, candidates=None):
+        """Run the queue and find placements.
+
+        If candidates is not None, pending apps which are not in candidates
+        are skipped if there are no placed apps behind them in the queue (e.g.
+        there is nothing they can evict). After first eviction capacity is
+        released, and all pending apps are considered.
+
+        Returns True if any app was evicted.
+        """
         # At this point, if app.server is defined, it points to attached
         # server.
         evicted = dict()
-        reversed_queue = queue[::-1]
-        for app in queue:
+        evictions = False
+        eviction_index = None
+
+        placed_behind = None
+        if candidates is not None:
+            placed_behind = []
+            placed = False
+            for app in reversed(queue):
+                placed_behind.append(placed)
+                placed = placed or bool(app.server)
+            placed_behind.reverse()
+
+        for idx, app in enumerate(queue):
             _LOGGER.debug('scheduling %s', app.name)
 
             if app.server:
@@ -1103,6 +1801,11 @@ class Cell(Bucket):
 
             assert app.server is None
 
+            if (candidates is not None and
+                    app.name not in candidates and
+                    not placed_behind[idx]):
+                continue
+
             if not app.acquire_identity():
                 _LOGGER.info('Unable to acquire identity: %s, %s', app.name,
                              app.identity_group)
@@ -1124,37 +1827,100 @@ class Cell(Bucket):
                 continue
 
             if not self.put(app):
-                # There is not enough capacity, from the end of the queue,
-                # evict apps, freeing capacity.
-                for evicted_app in reversed_queue:
-                    # We reached the app we can't place
-                    if evicted_app == app:
-                        break
+                # There is not enough capacity, evict apps behind in the queue
+                # from the server where it is cheapest.
+                if eviction_index is None:
+                    eviction_index = EvictionIndex(queue)
+                if self._evict_and_put(app, idx, servers, eviction_index,
+                                       evicted):
+                    candidates = None
+                    evictions = True
 
-                    # The app is not yet placed, skip
-                    if not evicted_app.server:
-                        continue
+            # Placement failed.
+            if not app.server:
+                app.release_identity()
 
-                    assert evicted_app.server in servers
-                    evicted_app_server = servers[evicted_app.server]
+        return evictions
 
-                    evicted[evicted_app] = evicted_app_server
-                    evicted_app_server.remove(evicted_app.name)
+    def _evict_and_put(self, app, pos, servers, eviction_index, evicted):
+        """Evict apps behind pos in the queue and place the app.
 
-                    # TODO: we need to check affinity limit constraints on
-                    #       each level, all the way to the top.
-                    if evicted_app_server.put(app):
-                        break
+        Candidate servers are tried in the order of eviction cost. If the app
+        can't be placed after eviction, the victims are restored.
 
-            # Placement failed.
-            if not app.server:
-                app.release_identity()
+        Returns True if any app was evicted.
+        """
+        heap = eviction_index.candidates(pos, app, servers)
+        while heap:
+            _cost, servername, victims = heapq.heappop(heap)
+            server = servers[servername]
+
+            evicted_flags = []
+            for victim in victims:
+                evicted_flags.append(victim.evicted)
+                eviction_index.remove(victim)
+                server.remove(victim.name)
+
+            # TODO: we need to check affinity limit constraints on
+            #       each level, all the way to the top.
+            if server.put(app):
+                for victim in victims:
+                    evicted[victim] = server
+                return True
+
+            restored = True
+            for victim, evicted_flag in itertools.izip(victims,
+                                                       evicted_flags):
+                if server.put(victim):
+                    victim.evicted = evicted_flag
+                    eviction_index.add(victim)
+                else:
+                    evicted[victim] = server
+                    restored = False
+
+            if not restored:
+                return True
+
+        return False
 
-    def schedule(self):
-        """Run the scheduler."""
+    def _is_incremental(self):
+        """Check if changes since last run allow incremental scheduling.
+
+        Pending apps that could not be placed in the previous run will not be
+        placed now unless capacity was released, servers changed, identities
+        changed, or the queue was reordered in a way which allows them to
+        evict apps which were placed before. Evictions in previous run
+        reshuffle capacity, so next run is full as well.
+        """
+        if self.allocation is not self._scheduled_allocation:
+            return False
+        if self.allocation.reordered:
+            return False
+        if self._dirty_servers or self._identities_changed:
+            return False
+        if self._evicted:
+            return False
+        if self.next_event_at <= time.time():
+            return False
+        return True
+
+    def schedule(self, incremental=False):
+        """Run the scheduler.
+
+        In incremental mode only pending apps added since the previous run
+        are placed, unless changes since then may affect other apps, in which
+        case full run is done. Non-incremental run also drops all cached
+        allocation queues, and can be used as periodic consistency check.
+        """
 
         begin = time.time()
 
+        if not incremental:
+            self.allocation.reset_cache()
+        elif not self._is_incremental():
+            _LOGGER.info('Incremental schedule not possible, full run.')
+            incremental = False
+
         queue = [item[-1]
                  for item in self.allocation.utilization_queue(self.size())]
 
@@ -1162,16 +1928,27 @@ class Cell(Bucket):
 
         servers = self.members()
 
-        self._fix_invalid_placements(queue, servers)
-        self._handle_inactive_servers(servers)
-        self._fix_invalid_identities(queue, servers)
-        # self._restore(queue, servers)
-        self._find_placements(queue, servers)
+        if incremental:
+            self._evicted = self._find_placements(
+                queue, servers, candidates=self.allocation.added)
+        else:
+            self._fix_invalid_placements(queue, servers)
+            self._handle_inactive_servers(servers)
+            self._fix_invalid_identities(queue, servers)
+            # self._restore(queue, servers)
+            self._evicted = self._find_placements(queue, servers)
+
+        self._dirty_servers = set()
+        self._identities_changed = False
+        self._scheduled_allocation = self.allocation
+        self.allocation.reordered = False
+        self.allocation.added = set()
 
         after = {app.name: app.server for app in queue}
-        _LOGGER.info('Scheduled %d apps in %r',
+        _LOGGER.info('Scheduled %d apps in %r, incremental: %s',
                      len(queue),
-                     time.time() - begin)
+                     time.time() - begin,
+                     incremental)
 
         placement = [(app.name, before[app.name], after[app.name])
                      for app in queue]
@@ -1184,13 +1961,435 @@ class Cell(Bucket):
         return placement
 
 
+class _SnapshotWriter(object):
+    """Collects string table and array blocks of the cell snapshot."""
+    __slots__ = (
+        'strings',
+        'string_idx',
+        'blocks',
+    )
+
+    def __init__(self):
+        self.strings = []
+        self.string_idx = dict()
+        self.blocks = collections.OrderedDict()
+
+    def string(self, value):
+        """Returns index of the string in the string table, -1 for None."""
+        if value is None:
+            return -1
+        idx = self.string_idx.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(value)
+            self.string_idx[value] = idx
+        return idx
+
+    def add(self, name, values, dtype):
+        """Add array block."""
+        self.blocks[name] = np.array(values, dtype=dtype)
+
+    def add_lists(self, name, lists, dtype):
+        """Add list of variable length lists as offsets and values blocks."""
+        offsets = np.zeros(len(lists) + 1, dtype=np.int32)
+        offsets[1:] = np.cumsum([len(values) for values in lists])
+        self.blocks[name + '.offsets'] = offsets
+        self.blocks[name] = np.array(list(itertools.chain(*lists)),
+                                     dtype=dtype)
+
+    def serialize(self, meta):
+        """Returns compressed snapshot."""
+        strings = []
+        for value in self.strings:
+            assert '\0' not in value, 'Invalid name: %r' % value
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            strings.append(value)
+        self.add('strings', bytearray('\0'.join(strings)), np.uint8)
+
+        meta['blocks'] = []
+        chunks = []
+        offset = 0
+        for name, array in self.blocks.iteritems():
+            array = np.ascontiguousarray(array)
+            meta['blocks'].append(
+                [name, array.dtype.str, list(array.shape), offset]
+            )
+            chunks.append(array.tostring())
+            offset += array.nbytes
+
+        header = json.dumps(meta)
+        return zlib.compress(
+            _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                  len(header)) +
+            header + ''.join(chunks)
+        )
+
+
+class _SnapshotReader(object):
+    """Provides access to the blocks of the cell snapshot."""
+    __slots__ = (
+        'meta',
+        'strings',
+        'blocks',
+    )
+
+    def __init__(self, data):
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as err:
+            raise ValueError('Invalid scheduler snapshot: %s' % err)
+
+        if len(data) < _SNAPSHOT_HEADER.size:
+            raise ValueError('Invalid scheduler snapshot: too short.')
+
+        magic, version, header_len = _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError('Invalid scheduler snapshot: bad magic.')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(
+                'Unsupported scheduler snapshot version: %s' % version)
+
+        start = _SNAPSHOT_HEADER.size
+        self.meta = json.loads(data[start:start + header_len])
+        start += header_len
+
+        self.blocks = dict()
+        for name, dtype, shape, offset in self.meta['blocks']:
+            dtype = np.dtype(str(dtype))
+            count = int(np.prod(shape))
+            self.blocks[name] = np.frombuffer(
+                data, dtype=dtype, count=count, offset=start + offset
+            ).reshape(shape)
+
+        strings = self.blocks['strings'].tostring()
+        self.strings = strings.split('\0') if strings else []
+
+    def string(self, idx):
+        """Returns string by index, None for -1."""
+        if idx < 0:
+            return None
+        return self.strings[idx]
+
+    def lists(self, name):
+        """Returns list of variable length lists."""
+        offsets = self.blocks[name + '.offsets']
+        values = self.blocks[name].tolist()
+        return [values[offsets[idx]:offsets[idx + 1]]
+                for idx in xrange(0, len(offsets) - 1)]
+
+
+def _strategy_names():
+    """Returns reverse map of the strategy registry."""
+    return {strategy_t: name for name, strategy_t in STRATEGIES.iteritems()}
+
+
+def _dump_nodes(cell, writer):
+    """Dump node hierarchy in preorder, returns node index by name."""
+    strategy_names = _strategy_names()
+
+    nodes = []
+    stack = [(cell, -1)]
+    while stack:
+        node, parent_idx = stack.pop()
+        nodes.append((node, parent_idx))
+        node_idx = len(nodes) - 1
+        for child in reversed(node.children.values()):
+            stack.append((child, node_idx))
+
+    node_idx = {node.name: idx for idx, (node, _parent) in enumerate(nodes)}
+
+    capacity = np.zeros((len(nodes), DIMENSION_COUNT))
+    strategies = []
+    for idx, (node, _parent) in enumerate(nodes):
+        if isinstance(node, Server):
+            capacity[idx] = node.init_capacity
+        else:
+            for affinity, strategy in node.affinity_strategies.iteritems():
+                strategy_t = type(strategy)
+                if (strategy_t is not node.default_strategy_t and
+                        strategy_t in strategy_names):
+                    strategies.append((idx, writer.string(affinity),
+                                       writer.string(
+                                           strategy_names[strategy_t])))
+
+    writer.add('node.name', [writer.string(node.name)
+                             for node, _parent in nodes], np.int32)
+    writer.add('node.parent', [parent for _node, parent in nodes], np.int32)
+    writer.add('node.level', [writer.string(node.level)
+                              for node, _parent in nodes], np.int32)
+    writer.add('node.server', [isinstance(node, Server)
+                               for node, _parent in nodes], np.uint8)
+    writer.add('node.state', [writer.string(node.state.value)
+                              for node, _parent in nodes], np.int32)
+    writer.add('node.since', [node.get_state()[1]
+                              for node, _parent in nodes], np.float64)
+    writer.add('node.valid_until', [node.valid_until
+                                    for node, _parent in nodes], np.float64)
+    writer.add('node.capacity', capacity, np.float64)
+    writer.add_lists('node.features',
+                     [[writer.string(feature)
+                       for feature in sorted(node.features.features)]
+                      for node, _parent in nodes], np.int32)
+    writer.add('node.default_strategy',
+               [writer.string(strategy_names.get(
+                   getattr(node, 'default_strategy_t', None)))
+                for node, _parent in nodes], np.int32)
+    writer.add('strategy', strategies, np.int32)
+
+    return node_idx
+
+
+def _dump_allocations(cell, writer):
+    """Dump allocation tree in preorder, returns allocation index by id."""
+    allocs = []
+    stack = [('', cell.allocation, -1)]
+    while stack:
+        name, alloc, parent_idx = stack.pop()
+        allocs.append((name, alloc, parent_idx))
+        alloc_idx = len(allocs) - 1
+        for sub_name in sorted(alloc.sub_allocations, reverse=True):
+            stack.append((sub_name, alloc.sub_allocations[sub_name],
+                          alloc_idx))
+
+    writer.add('alloc.name', [writer.string(name)
+                              for name, _alloc, _parent in allocs], np.int32)
+    writer.add('alloc.parent', [parent for _name, _alloc, parent in allocs],
+               np.int32)
+    writer.add('alloc.reserved',
+               np.reshape([alloc.reserved for _name, alloc, _parent in allocs],
+                          (len(allocs), DIMENSION_COUNT)),
+               np.float64)
+    writer.add('alloc.rank', [alloc.rank for _name, alloc, _parent in allocs],
+               np.float64)
+    writer.add('alloc.max_utilization',
+               [alloc.max_utilization for _name, alloc, _parent in allocs],
+               np.float64)
+    writer.add_lists('alloc.features',
+                     [[writer.string(feature)
+                       for feature in sorted(alloc.features)]
+                      for _name, alloc, _parent in allocs], np.int32)
+
+    return {id(alloc): idx for idx, (_name, alloc, _parent)
+            in enumerate(allocs)}
+
+
+def _dump_apps(cell, writer, node_idx, alloc_idx):
+    """Dump apps, their placement and identities."""
+    apps = [cell.apps[name] for name in sorted(cell.apps)]
+
+    def _or_nan(value):
+        """Convert None to nan."""
+        return np.nan if value is None else value
+
+    writer.add('app.name', [writer.string(app.name) for app in apps],
+               np.int32)
+    writer.add('app.alloc', [alloc_idx[id(app.allocation)] for app in apps],
+               np.int32)
+    writer.add('app.priority', [app.priority for app in apps], np.int32)
+    writer.add('app.demand',
+               np.reshape([app.demand for app in apps],
+                          (len(apps), DIMENSION_COUNT)),
+               np.float64)
+    writer.add('app.affinity', [writer.string(app.affinity.name)
+                                for app in apps], np.int32)
+    limits = [sorted((level, limit)
+                     for level, limit in app.affinity.limits.iteritems()
+                     if limit != float('inf'))
+              for app in apps]
+    writer.add_lists('app.limit_levels',
+                     [[writer.string(level) for level, _limit in app_limits]
+                      for app_limits in limits], np.int32)
+    writer.add_lists('app.limits',
+                     [[limit for _level, limit in app_limits]
+                      for app_limits in limits], np.float64)
+    writer.add('app.data_retention_timeout',
+               [_or_nan(app.data_retention_timeout) for app in apps],
+               np.float64)
+    writer.add('app.duration', [_or_nan(app.duration) for app in apps],
+               np.float64)
+    writer.add('app.global_order', [app.global_order for app in apps],
+               np.float64)
+    writer.add('app.identity_group', [writer.string(app.identity_group)
+                                      for app in apps], np.int32)
+    writer.add('app.identity',
+               [-1 if app.identity is None else app.identity
+                for app in apps], np.int32)
+    writer.add('app.schedule_once', [bool(app.schedule_once)
+                                     for app in apps], np.uint8)
+    writer.add('app.evicted', [app.evicted for app in apps], np.uint8)
+    writer.add('app.server',
+               [node_idx[app.server] if app.server else -1 for app in apps],
+               np.int32)
+
+
 def dumps(cell):
-    """Serializes cell to string."""
-    del cell
-    return ''
+    """Serializes cell to string.
+
+    The snapshot is a zlib compressed, versioned binary format: a header
+    with the block table, followed by NumPy arrays of node, allocation and
+    app attributes. Names are stored once in a string table and referenced
+    by index.
+    """
+    writer = _SnapshotWriter()
+    node_idx = _dump_nodes(cell, writer)
+    alloc_idx = _dump_allocations(cell, writer)
+
+    idents = sorted(cell.identity_groups.iteritems())
+    writer.add('ident.name', [writer.string(name) for name, _ident in idents],
+               np.int32)
+    writer.add('ident.count', [ident.count for _name, ident in idents],
+               np.int32)
+
+    _dump_apps(cell, writer, node_idx, alloc_idx)
+
+    return writer.serialize({
+        'dimension_count': DIMENSION_COUNT,
+        'next_event_at': cell.next_event_at,
+        'feasibility': cell.feasibility is not None,
+    })
+
+
+def _load_nodes(reader):
+    """Load cell hierarchy, returns cell and list of nodes by index."""
+    blocks = reader.blocks
+    features = reader.lists('node.features')
+    nodes = []
+    for idx in xrange(0, len(blocks['node.name'])):
+        name = reader.string(blocks['node.name'][idx])
+        level = reader.string(blocks['node.level'][idx])
+        node_features = [reader.string(feature) for feature in features[idx]]
+        if idx == 0:
+            node = Cell(name, feasibility=reader.meta['feasibility'])
+        elif blocks['node.server'][idx]:
+            node = Server(name, blocks['node.capacity'][idx],
+                          valid_until=float(blocks['node.valid_until'][idx]),
+                          features=node_features)
+        else:
+            node = Bucket(name, features=node_features, level=level)
+
+        default_strategy = reader.string(blocks['node.default_strategy'][idx])
+        if default_strategy is not None:
+            node.set_default_strategy(default_strategy)
+
+        nodes.append(node)
+        parent_idx = blocks['node.parent'][idx]
+        if parent_idx >= 0:
+            nodes[parent_idx].add_node(node)
+
+        node.set_state(State(reader.string(blocks['node.state'][idx])),
+                       float(blocks['node.since'][idx]))
+
+    for node_idx, affinity, strategy in blocks['strategy'].reshape(-1, 3):
+        nodes[node_idx].set_affinity_strategy(reader.string(affinity),
+                                              reader.string(strategy))
+
+    return nodes[0], nodes
+
+
+def _load_allocations(reader, cell):
+    """Load allocation tree, returns list of allocations by index."""
+    blocks = reader.blocks
+    features = reader.lists('alloc.features')
+    allocs = []
+    for idx in xrange(0, len(blocks['alloc.name'])):
+        if idx == 0:
+            alloc = cell.allocation
+        else:
+            alloc = Allocation()
+            allocs[blocks['alloc.parent'][idx]].add_sub_alloc(
+                reader.string(blocks['alloc.name'][idx]), alloc)
+
+        alloc.update(blocks['alloc.reserved'][idx].copy(),
+                     float(blocks['alloc.rank'][idx]),
+                     float(blocks['alloc.max_utilization'][idx]))
+        alloc.set_features([reader.string(feature)
+                            for feature in features[idx]])
+        allocs.append(alloc)
+
+    return allocs
+
+
+def _load_apps(reader, cell, nodes, allocs):
+    """Load apps and restore placements and identities."""
+    blocks = reader.blocks
+    names = blocks['app.name'].tolist()
+    alloc_idx = blocks['app.alloc'].tolist()
+    priorities = blocks['app.priority'].tolist()
+    demands = blocks['app.demand']
+    affinities = blocks['app.affinity'].tolist()
+    limit_levels = reader.lists('app.limit_levels')
+    limits = reader.lists('app.limits')
+    data_retention_timeouts = blocks['app.data_retention_timeout'].tolist()
+    durations = blocks['app.duration'].tolist()
+    global_orders = blocks['app.global_order'].tolist()
+    identity_groups = blocks['app.identity_group'].tolist()
+    identities = blocks['app.identity'].tolist()
+    schedule_once = blocks['app.schedule_once'].tolist()
+    evicted = blocks['app.evicted'].tolist()
+    server_idx = blocks['app.server'].tolist()
+
+    def _or_none(value):
+        """Convert nan to None."""
+        return None if value != value else value
+
+    placements = collections.defaultdict(list)
+    for idx in xrange(0, len(names)):
+        affinity_limits = {
+            reader.string(level): limit
+            for level, limit in itertools.izip(limit_levels[idx], limits[idx])
+        }
+        app = Application(
+            reader.string(names[idx]),
+            priorities[idx],
+            demands[idx],
+            affinity=reader.string(affinities[idx]),
+            affinity_limits=affinity_limits,
+            data_retention_timeout=_or_none(data_retention_timeouts[idx]),
+            duration=_or_none(durations[idx]),
+            identity_group=reader.string(identity_groups[idx]),
+            schedule_once=bool(schedule_once[idx]))
+        app.global_order = global_orders[idx]
+        cell.add_app(allocs[alloc_idx[idx]], app)
+
+        if identities[idx] >= 0 and app.identity_group_ref is not None:
+            app.force_set_identity(identities[idx])
+
+        app.evicted = bool(evicted[idx])
+        if server_idx[idx] >= 0:
+            placements[server_idx[idx]].append(app)
+
+    for idx, apps in placements.iteritems():
+        nodes[idx].restore(apps)
 
 
 def loads(data):
-    """Loads scheduler from string."""
-    del data
-    assert False, 'not implemented.'
+    """Loads scheduler from string.
+
+    Returns the Cell, raises ValueError if the snapshot is invalid or the
+    version is not supported.
+    """
+    # pylint: disable=W0603
+    global DIMENSION_COUNT
+
+    reader = _SnapshotReader(data)
+
+    dimension_count = reader.meta['dimension_count']
+    if DIMENSION_COUNT is None:
+        DIMENSION_COUNT = dimension_count
+    elif DIMENSION_COUNT != dimension_count:
+        raise ValueError('Snapshot dimension count mismatch: %s, expected %s'
+                         % (dimension_count, DIMENSION_COUNT))
+
+    cell, nodes = _load_nodes(reader)
+    allocs = _load_allocations(reader, cell)
+
+    blocks = reader.blocks
+    for name, count in itertools.izip(blocks['ident.name'],
+                                      blocks['ident.count']):
+        cell.configure_identity_group(reader.string(name), int(count))
+
+    _load_apps(reader, cell, nodes, allocs)
+    cell.next_event_at = reader.meta['next_event_at']
+
+    return cell
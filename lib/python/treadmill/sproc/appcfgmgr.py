@@ -12,9 +12,11 @@ def init():
     @click.command()
     @click.option('--approot', type=click.Path(exists=True),
                   envvar='TREADMILL_APPROOT', required=True)
-    def top(approot):
+    @click.option('--workers', type=int, default=appcfgmgr.DEFAULT_WORKERS,
+                  help='Number of instances configured concurrently.')
+    def top(approot, workers):
         """Starts appcfgmgr process."""
-        mgr = appcfgmgr.AppCfgMgr(root=approot)
+        mgr = appcfgmgr.AppCfgMgr(root=approot, workers=workers)
         mgr.run()
 
     return top
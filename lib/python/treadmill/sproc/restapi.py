@@ -8,6 +8,7 @@ import click
 
 from .. import rest
 from .. import context
+from .. import wsgiserver
 from .. import zkutils
 # TODO: consider refactoring error_handlers so that exceptions are
 #                configured in function, not on import.
@@ -25,9 +26,24 @@ def init():
                   required=True, type=cli.LIST)
     @click.option('-m', '--modules', help='API modules to load.',
                   required=True, type=cli.LIST)
-    def top(port, auth, versions, modules):
+    @click.option('-w', '--workers', type=int, default=0,
+                  help='Number of pre-forked server processes, '
+                       'development server if not set.')
+    @click.option('--threads', type=int, default=wsgiserver.DEFAULT_THREADS,
+                  help='Number of request threads per server process.')
+    @click.option('--keepalive', type=int,
+                  default=wsgiserver.DEFAULT_KEEPALIVE,
+                  help='Idle keep-alive connection timeout, seconds.')
+    @click.option('--xheaders', is_flag=True, default=False,
+                  help='Trust client address in X-Real-Ip/X-Forwarded-For '
+                       'headers, only behind a proxy.')
+    def top(port, auth, versions, modules, workers, threads, keepalive,
+            xheaders):
         """Run Treadmill API server."""
-        context.GLOBAL.zk.conn.add_listener(zkutils.exit_on_lost)
+        def _worker_init():
+            """Connect to Zookeeper in the server process."""
+            context.GLOBAL.zk.conn.add_listener(zkutils.exit_on_lost)
+
         api_paths = []
         for version in versions:
             module_name = 'treadmill.rest.' + version
@@ -36,6 +52,8 @@ def init():
             api_paths.extend(mod.init(modules))
 
         rest_server = rest.RestServer(port)
-        rest_server.run(auth_type=auth, protect=api_paths)
+        rest_server.run(auth_type=auth, protect=api_paths, workers=workers,
+                        threads=threads, keepalive=keepalive,
+                        xheaders=xheaders, worker_init=_worker_init)
 
     return top
@@ -14,6 +14,8 @@ import tornado.web
 
 import click
 
+from .. import cellcache
+from .. import context
 from .. import discovery_wshandler
 from .. import state_wshandler
 
@@ -36,6 +38,12 @@ def init():
         """Treadmill Websocket"""
         _LOGGER.debug('port: %s', port)
 
+        # Load the cell cache before serving, so that the first subscribers
+        # do not block the IOLoop on Zookeeper.
+        cache = cellcache.get_cache(context.GLOBAL.zk.conn)
+        for collection in ('scheduled', 'running', 'endpoints'):
+            cache.get(collection)
+
         application = tornado.web.Application([
             (r'/discovery', discovery_wshandler.DiscoveryWebSocketHandler),
             (r'/state', state_wshandler.StateWebSocketHandler),
@@ -1,16 +1,15 @@
 """Basic listing module that treadmill_list and REST API can use"""
 from __future__ import absolute_import
 
-import fnmatch
 import logging
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
-
 from enum import Enum
 
+import kazoo
+
+from . import nameindex
+from . import scheduler as treadmill_sched
+from . import zknamespace as z
 from . import zkutils
 
 
@@ -79,27 +78,31 @@ class State(object):
             [strip_instance(a) for a in self.scheduled()])
 
     def scheduler(self):
-        """Returns scheduled state."""
-        sched = None
+        """Returns scheduler cell snapshot, None if not available."""
+        cell = None
 
         try:
-            pickled, _metadata = self.zkclient.get('/scheduler')
-            sched = pickle.loads(pickled.decode('zlib'))
-        except pickle.UnpicklingError:
-            _LOGGER.critical('%s - incompatible cell version.', self.cell)
+            data, _metadata = self.zkclient.get(z.SCHEDULER)
+            if data:
+                cell = treadmill_sched.loads(data)
+        except kazoo.client.NoNodeError:
+            _LOGGER.warn('%s - scheduler snapshot does not exist.', self.cell)
+        except ValueError as err:
+            _LOGGER.critical('%s - incompatible cell version: %s',
+                             self.cell, err)
 
-        return sched
+        return cell
 
     def broken(self):
         """Returns all apps that are scheduled but not running."""
-        sched = self.scheduler()
-        if sched is None:
+        cell = self.scheduler()
+        if cell is None:
             return
 
-        placed = set([app for app in sched.cell.apps
-                      if sched.cell.apps[app].node])
+        placed = set([app for app in cell.apps
+                      if cell.apps[app].server])
 
-        broken_apps = {name: sched.cell.apps[name].node
+        broken_apps = {name: cell.apps[name].server
                        for name in sorted(placed - self.running())}
         broken_nodes = {}
 
@@ -124,23 +127,18 @@ class State(object):
 
         result = handlers.get(state, self.configured())()
 
-        if isinstance(result, list):
-            fully_qualified = ['/'.join([self.cell, name]) for name in result]
-            if pattern:
-                fully_qualified = ['/'.join([self.cell, name])
-                                   for name in result
-                                   if fnmatch.fnmatch(name, pattern)]
+        if not pattern:
+            pattern = None
 
-            return fully_qualified
+        if isinstance(result, list):
+            # List results are sorted, only the pattern prefix is scanned.
+            return ['/'.join([self.cell, name])
+                    for name in nameindex.filter_sorted(result, pattern)]
         elif isinstance(result, dict) and result.keys():
             fully_qualified = {key: ['/'.join([self.cell, app])
-                                     for app in result[key]]
+                                     for app in nameindex.filter_names(
+                                         result[key], pattern)]
                                for key in result}
-            if pattern:
-                fully_qualified = {key: ['/'.join([self.cell, app])
-                                         for app in result[key]
-                                         if fnmatch.fnmatch(app, pattern)]
-                                   for key in result}
 
             return fully_qualified
 
@@ -4,10 +4,12 @@ A WebSocket handler for Treadmill state's, e.g. 'running',
 """
 from __future__ import absolute_import
 
+import functools
 import json
 import logging
 import traceback
 
+from treadmill import cellcache
 from treadmill import exc
 from treadmill import state
 from treadmill import utils
@@ -32,79 +34,109 @@ class StateWebSocketHandler(websocket.WebSocketHandlerBase):
         self.app = None
         self.pattern = None
         self.state = None
-        self.state_info = None
-
-    def state_watcher(self, event):
-        """
-        Watches changes to event.path, when we get in here, get the current
-        'state' for all children, then return the full state back to the
-        client, unless they want deltas only, then calculate the dealtas and
-        provide the action that was taken with the differences.
+        self.since = None
+        self.epoch = None
+        # Apps in the state matching the pattern, kept by cell cache.
+        self.apps = None
+        self.seq = None
+        self.subscription = None
+
+    def on_state_change(self, state_name, seq, changed, removed):
         """
-        try:
-            _LOGGER.debug('event: %r', event)
+        Cell cache callback invoked with the apps created and deleted in the
+        state, filtered by the client pattern. Return the full state back to
+        the client, unless they want deltas only, then provide the action
+        that was taken with the differences.
 
-            previous_state_info = self.state_info
-            _LOGGER.debug('previous_state_info: %s', previous_state_info)
+        Invoked on the IOLoop, changes queued before the subscription was
+        renewed or closed are ignored.
+        """
+        if (self.subscription is None or state_name != self.state or
+                seq <= self.seq):
+            return
 
-            current_state_info = self.get_current_state(False)
-            _LOGGER.debug('current_state_info: %r', current_state_info)
+        try:
+            self.apps.difference_update(removed)
+            self.apps.update(changed)
+            self.seq = seq
 
             # We short-circuit if we don't want deltas
             if not self.deltas:
                 _LOGGER.info('Deltas is not set, returning current state...')
-                current_state_info['sow'] = True
-                self.write_message(json.dumps(current_state_info))
-            else:
-                _LOGGER.info('Client is only interested in the deltas,'
-                             ' returning the difference between current'
-                             ' state and previous state')
-                previous_apps = set(previous_state_info[self.state])
-                current_apps = set(current_state_info[self.state])
-
-                response = {'sow': False, }
-
-                response[websocket.DeltaActions.DELETED.value] = list(
-                    previous_apps - current_apps)
-
-                response[websocket.DeltaActions.CREATED.value] = list(
-                    current_apps - previous_apps)
-
-                response['state'] = self.state
-                _LOGGER.debug('response: %r', response)
-
-                if (response[websocket.DeltaActions.DELETED.value] or
-                        response[websocket.DeltaActions.CREATED.value]):
-                    self.write_message(json.dumps(response))
-                else:
-                    _LOGGER.info('No differences found, thus not sending'
-                                 ' anything back.')
-
-            _LOGGER.info('Overriding previous state info to the current one')
-            self.state_info = current_state_info
-
-            _LOGGER.info('Sit watching children under path: %s', event.path)
-            self.zkclient.get_children(event.path, self.state_watcher)
+                self.send_current_state(True)
+                return
+
+            self.send_deltas(seq, changed, removed)
         except:  # pylint: disable=W0702
             err = traceback.format_exc().splitlines()
-            self.send_error_msg('Unexpected error while watching path %s: %s' %
-                                (event.path, err[-1]), close_conn=False)
-            _LOGGER.info('Sit watching children under path: %s', event.path)
-            self.zkclient.get_children(event.path, self.state_watcher)
+            self.send_error_msg('Unexpected error while processing state %s'
+                                ' changes: %s' % (self.state, err[-1]),
+                                close_conn=False)
+
+    def send_deltas(self, seq, changed, removed):
+        """Send the apps created and deleted by the change seq"""
+        response = {'sow': False, 'seq': seq, 'epoch': self.epoch}
+
+        response[websocket.DeltaActions.DELETED.value] = (
+            self.qualify(removed))
+
+        response[websocket.DeltaActions.CREATED.value] = (
+            self.qualify(changed))
+
+        response['state'] = self.state
+        _LOGGER.debug('response: %r', response)
+
+        self.write_message(json.dumps(response))
+
+    def subscribe(self):
+        """Get SOW, send to client then subscribe to the state changes
+
+        Client which asks for deltas and supplies the epoch and seq of the
+        last message received is sent the changes which follow instead, if
+        they are still in the cell cache change log.
+        """
+        self.unsubscribe()
+
+        pattern = self.pattern
+        if pattern is None:
+            pattern = self.app
 
-    def watch_children(self, path):
-        """Get SOW, send to client then setup a watcher on path"""
+        cache = cellcache.get_cache(self.zkclient)
+        with cache.lock:
+            changes = None
+            if self.deltas and self.epoch == cache.epoch:
+                changes = cache.changes(self.state, self.since, pattern)
+
+            self.subscription, self.seq, apps = cache.subscribe(
+                self.state,
+                self.zk.callback(
+                    functools.partial(self.on_state_change, self.state)),
+                pattern)
+            self.apps = set(apps)
+            self.epoch = cache.epoch
+
+            if changes is None:
+                # Send SOW of current state
+                _LOGGER.info('Sending SOW for state "%s" back to the'
+                             ' client...', self.state)
+                self.send_current_state(True)
+                return
 
-        # Send SOW of current state
-        _LOGGER.info('Sending SOW for state "%s" back to the client...',
-                     self.state)
-        self.state_info = self.get_current_state(True)
-        _LOGGER.debug('state_info: %r', self.state_info)
+            _LOGGER.info('Resuming state "%s" from seq %d, %d changes',
+                         self.state, self.since, len(changes))
+            for seq, changed, removed in changes:
+                self.send_deltas(seq, changed, removed)
 
-        self.write_message(json.dumps(self.state_info))
+    def unsubscribe(self):
+        """Stop receiving state changes"""
+        if self.subscription is not None:
+            cellcache.get_cache(self.zkclient).unsubscribe(self.subscription)
+            self.subscription = None
 
-        _LOGGER.info('Sit watching children under path: %s', path)
-        self.zkclient.get_children(path, self.state_watcher)
+    def on_close(self):
+        """Unsubscribe from the state changes when connection is closed."""
+        self.unsubscribe()
+        websocket.WebSocketHandlerBase.on_close(self)
 
     def on_message(self, jmessage):
         """
@@ -122,15 +154,19 @@ class StateWebSocketHandler(websocket.WebSocketHandlerBase):
                        "test1/ericktr.foo"
             - deltas: option to only send deltas, not a full image
                       of the state, i.e. only applications that have been added
+            - epoch, since: epoch and seq of the last message received,
+                            resume sending deltas after since, instead of
+                            sending SOW; only with deltas
 
             Example return objects::
 
              SOW: {"running": ["test1/ericktr.foo#0000000595",
                                "test1/ericktr.foo#0000002937"],
-                   "sow": true}
+                   "sow": true, "seq": 41, "epoch": 1476654321000}
              Deltas: {"deleted": ["test1/ericktr.foo#0000002936"],
+                      "created": [],
                       "state": "running",
-                      "sow": false}
+                      "sow": false, "seq": 42, "epoch": 1476654321000}
 
         :type jmessage:
             ``str``
@@ -159,7 +195,7 @@ class StateWebSocketHandler(websocket.WebSocketHandlerBase):
                                     % self.state)
                 return
 
-            self.watch_children(node_path)
+            self.subscribe()
 
         except Exception as ex:  # pylint: disable=W0702,W0703
             _LOGGER.exception(ex)
@@ -175,6 +211,8 @@ class StateWebSocketHandler(websocket.WebSocketHandlerBase):
             ('app', False, unicode),
             ('pattern', False, unicode),
             ('deltas', False, bool),
+            ('epoch', False, int),
+            ('since', False, int),
         ]
         try:
             utils.validate(message, schema)
@@ -225,39 +263,25 @@ class StateWebSocketHandler(websocket.WebSocketHandlerBase):
         self.deltas = message.get('deltas', False)
         _LOGGER.debug('deltas: %r', self.deltas)
 
+        self.epoch = message.get('epoch')
+        self.since = message.get('since')
+        _LOGGER.debug('epoch: %r, since: %r', self.epoch, self.since)
+
+    def qualify(self, apps):
+        """Returns sorted list of apps prefixed with the cell name."""
+        return ['/'.join([self.cell, app]) for app in sorted(apps)]
+
     def get_current_state(self, is_sow=False):
         """
-            This method will send the current state to the client, based on the
-            cell, pattern, and state that the client sent in the on_message.
+            This method will return the current state, based on the cell,
+            pattern, and state that the client sent in the on_message.
 
             :param is_sow
                 Whether this state is "SOW" (i.e. State Of the World) or not;
                 default is False
         """
-
-        _LOGGER.info('Getting state in: %r', self.cell)
-        state_lister = state.State(self.cell, self.zkclient)
-
-        state_info = {'sow': is_sow}
-        state_info[self.state] = []
-
-        pattern = self.pattern
-        if pattern is None:
-            pattern = self.app
-
-        _LOGGER.info('Listing apps in %r with pattern %s',
-                     self.state, pattern)
-        apps = state_lister.list(self.state, pattern)
-
-        if apps is None:
-            return state_info
-
-        if isinstance(apps, dict):
-            apps = apps.items()
-
-        _LOGGER.debug('apps: %r', apps)
-
-        state_info[self.state] = apps
+        state_info = {'sow': is_sow, 'seq': self.seq, 'epoch': self.epoch}
+        state_info[self.state] = self.qualify(self.apps)
 
         return state_info
 
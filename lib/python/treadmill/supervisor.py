@@ -40,9 +40,11 @@ be responsible for restart and maintaining restart count.
 """
 from __future__ import absolute_import
 
+import errno
 import glob
 import logging
 import os
+import select
 import stat
 import subprocess
 import time
@@ -52,6 +54,7 @@ import jinja2
 from . import fs
 from . import utils
 from . import subproc
+from .syscall import inotify
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -72,6 +75,9 @@ ERR_COMMAND = 111
 # s6-svc exits 100 if no s6-supervise process is running on servicedir.
 ERR_NO_SUP = 100
 
+# Interval of retries not triggered by inotify events, seconds.
+_CONTROL_RETRY_INTERVAL = 0.5
+
 
 def create_service(app_root, user, home, shell, service, runcmd,
                    env=None, down=True, envdir=None, as_root=True,
@@ -162,6 +168,95 @@ def is_supervisor_running(app_root, service):
         return False
 
 
+def _write_control(svc_dir, command):
+    """Write the command to the s6-supervise control FIFO of the service.
+
+    Returns False if s6-supervise is not (yet) running on the service.
+    """
+    control = os.path.join(svc_dir, 'supervise', 'control')
+    try:
+        # Open fails with ENXIO if nobody reads the FIFO.
+        fd = os.open(control, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as err:
+        if err.errno in (errno.ENOENT, errno.ENOTDIR, errno.ENXIO):
+            return False
+        raise
+
+    try:
+        os.write(fd, command)
+    finally:
+        os.close(fd)
+
+    return True
+
+
+def control_services(svc_dirs, command, timeout=5):
+    """Send the command to the services, as s6-svc does.
+
+    Services without running s6-supervise are waited for, all at once, using
+    inotify events on the service and supervise directories (creation and
+    opening of the control FIFO).
+
+    :param svc_dirs:
+        Service directories
+    :param command:
+        s6-svc command, e.g. 'uO' for s6-svc -uO
+    :returns:
+        ``set`` of the service directories which were not ready in time.
+    """
+    pending = set(
+        svc_dir for svc_dir in svc_dirs
+        if not _write_control(svc_dir, command)
+    )
+    if not pending:
+        return pending
+
+    watcher = inotify.Inotify(inotify.IN_CLOEXEC)
+    poll = select.poll()
+    poll.register(watcher, select.POLLIN)
+    watched = set()
+    deadline = time.time() + timeout
+    try:
+        while pending:
+            for svc_dir in pending:
+                for path in (svc_dir, os.path.join(svc_dir, 'supervise')):
+                    if path in watched:
+                        continue
+                    try:
+                        watcher.add_watch(
+                            path,
+                            event_mask=(inotify.IN_CREATE |
+                                        inotify.IN_MOVED_TO |
+                                        inotify.IN_OPEN)
+                        )
+                        watched.add(path)
+                    except OSError as err:
+                        if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                            raise
+
+            # Retry in case the FIFO was opened before the watch was added.
+            pending = set(
+                svc_dir for svc_dir in pending
+                if not _write_control(svc_dir, command)
+            )
+
+            remaining = deadline - time.time()
+            if not pending or remaining <= 0:
+                break
+
+            try:
+                if poll.poll(
+                        1000 * min(remaining, _CONTROL_RETRY_INTERVAL)):
+                    watcher.read_events()
+            except select.error as err:
+                if err[0] != errno.EINTR:
+                    raise
+    finally:
+        watcher.close()
+
+    return pending
+
+
 def is_running(app_root, service):
     """Checks if the service is running."""
     return bool(get_pid(app_root, service))
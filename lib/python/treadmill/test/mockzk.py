@@ -98,6 +98,26 @@ class MockZookeeperMetadata(namedtuple('MockZookeeperMetadata',
                    ephemeralOwner=ephemeralOwner)
 
 
+class MockAsyncResult(object):
+    """Completed async result, as returned by the kazoo *_async methods."""
+
+    def __init__(self, func, *args, **kwargs):
+        self.value = None
+        self.exception = None
+        try:
+            self.value = func(*args, **kwargs)
+        except kazoo.exceptions.KazooException as err:
+            self.exception = err
+
+    def get(self, block=True, timeout=None):
+        """Returns the value or raises the exception."""
+        del block
+        del timeout
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
 class MockZookeeperTestCase(unittest.TestCase):
     """Helper class to mock Zk get[children] events."""
     # Disable too many branches warning.
@@ -200,10 +220,25 @@ class MockZookeeperTestCase(unittest.TestCase):
 
             watches[(zkpath, states.EventType.CHILD)] = watch
             if isinstance(content, dict):
-                return sorted(content.keys())
+                return sorted(key for key in content.keys()
+                              if key not in ('.data', '.metadata'))
             else:
                 return []
 
+        def mock_get_async(zkpath, watch=None):
+            """Async version of mock_get."""
+            return MockAsyncResult(mock_get, zkpath, watch=watch)
+
+        def mock_exists_async(zkpath, watch=None):
+            """Async exists, returns node metadata or None."""
+            def _stat():
+                """Returns node metadata or None."""
+                try:
+                    return mock_get(zkpath, watch=watch)[1]
+                except kazoo.client.NoNodeError:
+                    return None
+            return MockAsyncResult(_stat)
+
         if events:
             self.watch_events = Queue.Queue()
 
@@ -228,6 +263,8 @@ class MockZookeeperTestCase(unittest.TestCase):
         side_effects = [
             (kazoo.client.KazooClient.exists, mock_exists),
             (kazoo.client.KazooClient.get, mock_get),
+            (kazoo.client.KazooClient.get_async, mock_get_async),
+            (kazoo.client.KazooClient.exists_async, mock_exists_async),
             (kazoo.client.KazooClient.delete, mock_delete),
             (kazoo.client.KazooClient.get_children, mock_get_children)]
 
@@ -9,6 +9,7 @@ This class overrides several methods including:
 This class will also provide the following methods:
 
  - get_zkclient: returns and caches ZK clients at the cell level
+ - zk: ZK adapter, delivering watch events and results on the IOLoop
  - send_error_msg: utility method to help send back an error and close the
    connection to the client
 
@@ -23,6 +24,7 @@ from enum import Enum
 import tornado.websocket
 
 from . import context
+from . import zkioloop
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -48,6 +50,7 @@ class WebSocketHandlerBase(tornado.websocket.WebSocketHandler):
         tornado.websocket.WebSocketHandler.__init__(self, application, request,
                                                     **kwargs)
         self.zkclient = context.GLOBAL.zk.conn
+        self.zk = zkioloop.IOLoopZk(self.zkclient)
 
     def open(self):
         """Called when connection is opened.
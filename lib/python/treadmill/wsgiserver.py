@@ -0,0 +1,414 @@
+"""Pre-forked, multi-threaded WSGI server.
+
+The master process binds the listening sockets and forks the workers. Every
+worker runs Tornado HTTP server (HTTP/1.1 keep-alive) and calls the WSGI app
+on a pool of threads, so slow requests do not queue up the fast ones.
+
+Signals handled by the master process:
+
+ - SIGHUP: graceful reload, start new workers and stop the old ones.
+ - SIGTERM, SIGINT: graceful shutdown.
+
+Workers stop accepting new connections on SIGTERM and exit once in-flight
+requests are finished.
+"""
+from __future__ import absolute_import
+
+import bisect
+import functools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import signal
+import time
+
+import flask
+
+try:
+    # pylint: disable=F0401
+    import tornado
+    import tornado.httpserver
+    import tornado.httputil
+    import tornado.ioloop
+    import tornado.netutil
+    import tornado.wsgi
+except ImportError:
+    # Ignore import errors on RHEL5, as tornado is available only for RHEL6
+    pass
+
+from . import context
+from . import utils
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 16
+
+DEFAULT_KEEPALIVE = 75
+
+# Seconds given to the workers to finish in-flight requests.
+GRACEFUL_TIMEOUT = 30
+
+# Upper bounds of the latency histogram buckets, seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+STATS_PATH = '/stats/latency'
+
+# Key of the requests not matching any url rule.
+_UNMATCHED = '<unmatched>'
+
+_ERROR_STATUS = '500 Internal Server Error'
+
+
+class LatencyStats(object):
+    """Per endpoint latency histograms, shared by the forked workers.
+
+    Endpoints are the Flask url rules, the counters are allocated in shared
+    memory for every rule and method before the workers are forked.
+    """
+    __slots__ = (
+        'keys',
+        'buckets',
+        'counters',
+        'lock',
+    )
+
+    def __init__(self, endpoints, buckets=LATENCY_BUCKETS):
+        self.keys = dict(
+            (endpoint, idx) for idx, endpoint in enumerate(sorted(endpoints))
+        )
+        self.buckets = buckets
+        # Every endpoint has a counter per bucket, +Inf bucket and the sum of
+        # latencies in microseconds.
+        self.counters = multiprocessing.RawArray(
+            'L', len(self.keys) * self._stride()
+        )
+        self.lock = multiprocessing.Lock()
+
+    def _stride(self):
+        """Number of counters per endpoint."""
+        return len(self.buckets) + 2
+
+    def record(self, endpoint, seconds):
+        """Record latency of the endpoint request."""
+        idx = self.keys.get(endpoint)
+        if idx is None:
+            return
+
+        base = idx * self._stride()
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counters[base + bucket] += 1
+            self.counters[base + len(self.buckets) + 1] += int(
+                seconds * 1000000
+            )
+
+    def histograms(self):
+        """Returns cumulative histograms of the requested endpoints."""
+        stride = self._stride()
+        with self.lock:
+            counters = self.counters[:]
+
+        result = dict()
+        for (rule, method), idx in self.keys.iteritems():
+            base = idx * stride
+            count = 0
+            buckets = dict()
+            for bucket, bound in enumerate(self.buckets):
+                count += counters[base + bucket]
+                buckets[str(bound)] = count
+            count += counters[base + len(self.buckets)]
+            if not count:
+                continue
+
+            buckets['+Inf'] = count
+            result.setdefault(rule, dict())[method] = {
+                'count': count,
+                'sum': counters[base + stride - 1] / 1000000.0,
+                'buckets': buckets,
+            }
+
+        return result
+
+
+def install_stats(app):
+    """Record latency of the Flask app endpoints, serve it on STATS_PATH.
+
+    Must be called once all the blueprints are registered.
+    """
+    @app.route(STATS_PATH, endpoint='latency_stats')
+    def _latency_stats():
+        """Latency histograms of the endpoints."""
+        return flask.jsonify(stats.histograms())
+
+    endpoints = set([(_UNMATCHED, method) for method in ['GET', 'HEAD',
+                                                         'POST', 'PUT',
+                                                         'DELETE',
+                                                         'OPTIONS']])
+    for rule in app.url_map.iter_rules():
+        endpoints.update((rule.rule, method) for method in rule.methods)
+
+    stats = LatencyStats(endpoints)
+
+    @app.before_request
+    def _start_timer():
+        """Record the request start time."""
+        flask.g.request_start = time.time()
+
+    @app.teardown_request
+    def _stop_timer(_exc):
+        """Record the request latency."""
+        start = getattr(flask.g, 'request_start', None)
+        if start is None:
+            return
+
+        rule = flask.request.url_rule
+        stats.record(
+            (rule.rule if rule is not None else _UNMATCHED,
+             flask.request.method),
+            time.time() - start
+        )
+
+    return stats
+
+
+class ThreadedWSGIContainer(object):
+    """Tornado request callback calling the WSGI app on a thread pool.
+
+    Requests are parsed and responses written on the IOLoop, only the WSGI
+    app runs on the pool threads.
+    """
+    __slots__ = (
+        'wsgi_app',
+        'pool',
+        'ioloop',
+        'pending',
+    )
+
+    def __init__(self, wsgi_app, threads=DEFAULT_THREADS, ioloop=None):
+        self.wsgi_app = wsgi_app
+        self.pool = multiprocessing.pool.ThreadPool(threads)
+        if ioloop is None:
+            ioloop = tornado.ioloop.IOLoop.current()
+        self.ioloop = ioloop
+        self.pending = 0
+
+    def __call__(self, request):
+        environ = tornado.wsgi.WSGIContainer.environ(request)
+        self.pending += 1
+        self.pool.apply_async(
+            self._call_app, (environ,),
+            callback=functools.partial(
+                self.ioloop.add_callback, self._respond, request
+            )
+        )
+
+    def _call_app(self, environ):
+        """Call the WSGI app, returns (status, headers, body)."""
+        response = dict()
+        body = []
+
+        def _start_response(status, headers, exc_info=None):
+            """WSGI start_response."""
+            del exc_info
+            response['status'] = status
+            response['headers'] = list(headers)
+            return body.append
+
+        try:
+            app_response = self.wsgi_app(environ, _start_response)
+            try:
+                body.extend(app_response)
+            finally:
+                if hasattr(app_response, 'close'):
+                    app_response.close()
+        except Exception:  # pylint: disable=W0703
+            _LOGGER.exception('Unhandled error: %s %s',
+                              environ['REQUEST_METHOD'],
+                              environ['PATH_INFO'])
+            return _ERROR_STATUS, [('Content-Type', 'text/plain')], b''
+
+        return response['status'], response['headers'], b''.join(body)
+
+    def _respond(self, request, response):
+        """Write the app response to the connection."""
+        self.pending -= 1
+        status, headers, body = response
+        status_code, reason = status.split(' ', 1)
+        status_code = int(status_code)
+
+        header_set = set(name.lower() for name, _value in headers)
+        if status_code != 304:
+            if 'content-length' not in header_set:
+                headers.append(('Content-Length', str(len(body))))
+            if 'content-type' not in header_set:
+                headers.append(('Content-Type', 'text/html; charset=UTF-8'))
+        if 'server' not in header_set:
+            headers.append(('Server', 'TornadoServer/%s' % tornado.version))
+
+        header_obj = tornado.httputil.HTTPHeaders()
+        for name, value in headers:
+            header_obj.add(name, value)
+
+        request.connection.write_headers(
+            tornado.httputil.ResponseStartLine('HTTP/1.1', status_code,
+                                               reason),
+            header_obj,
+            chunk=body
+        )
+        request.connection.finish()
+        _LOGGER.info('%d %s %s (%s) %.2fms', status_code, request.method,
+                     request.uri, request.remote_ip,
+                     1000.0 * request.request_time())
+
+
+def _run_worker(wsgi_app, sockets, threads, keepalive, xheaders,
+                worker_init):
+    """Serve requests until SIGTERM, in the forked worker."""
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if worker_init is not None:
+        worker_init()
+
+    ioloop = tornado.ioloop.IOLoop.current()
+    container = ThreadedWSGIContainer(wsgi_app, threads, ioloop)
+    server = tornado.httpserver.HTTPServer(
+        container, idle_connection_timeout=keepalive, xheaders=xheaders
+    )
+    server.add_sockets(sockets)
+
+    def _shutdown():
+        """Stop accepting connections, wait for in-flight requests."""
+        _LOGGER.info('Stopping worker, pending requests: %d',
+                     container.pending)
+        server.stop()
+        deadline = time.time() + GRACEFUL_TIMEOUT
+
+        def _check():
+            """Stop the IOLoop once all requests are done."""
+            if container.pending and time.time() < deadline:
+                ioloop.call_later(0.1, _check)
+            else:
+                ioloop.stop()
+
+        _check()
+
+    signal.signal(
+        signal.SIGTERM,
+        lambda _signum, _frame: ioloop.add_callback_from_signal(_shutdown)
+    )
+
+    _LOGGER.info('Worker started, threads: %d', threads)
+    ioloop.start()
+
+
+def _fork_worker(wsgi_app, sockets, threads, keepalive, xheaders,
+                 worker_init):
+    """Fork the worker process, returns the pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+
+    exit_code = 0
+    try:
+        _run_worker(wsgi_app, sockets, threads, keepalive, xheaders,
+                    worker_init)
+    except Exception:  # pylint: disable=W0703
+        _LOGGER.exception('Worker failed.')
+        exit_code = 1
+    finally:
+        logging.shutdown()
+        # Never return into the code of the master process.
+        os._exit(exit_code)  # pylint: disable=W0212
+
+
+def _stop_workers(workers):
+    """Send SIGTERM to the workers."""
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def serve(wsgi_app, port, host='0.0.0.0', workers=1,
+          threads=DEFAULT_THREADS, keepalive=DEFAULT_KEEPALIVE,
+          xheaders=False, worker_init=None):
+    """Serve the WSGI app with pre-forked workers.
+
+    worker_init is invoked in every worker after fork, it must be used to
+    establish connections (Zookeeper, LDAP) which can't be shared by forked
+    processes.
+
+    Client address is taken from X-Real-Ip/X-Forwarded-For headers only if
+    xheaders is set, i.e. when the server is behind a trusted proxy.
+    """
+    # Kazoo client threads do not survive the fork, every worker must
+    # connect on its own.
+    # pylint: disable=W0212
+    assert context.GLOBAL.zk._conn is None, \
+        'Zookeeper connection established before fork.'
+
+    sockets = tornado.netutil.bind_sockets(port, host)
+    _LOGGER.info('Serving on %s:%s, workers: %d, threads: %d',
+                 host, port, workers, threads)
+
+    signalled = utils.make_signal_flag(signal.SIGHUP, signal.SIGTERM,
+                                       signal.SIGINT)
+
+    def _start():
+        """Start workers of the current generation."""
+        return set(
+            _fork_worker(wsgi_app, sockets, threads, keepalive, xheaders,
+                         worker_init)
+            for _idx in xrange(0, workers)
+        )
+
+    current = _start()
+    stopping = set()
+
+    while True:
+        if signal.SIGTERM in signalled or signal.SIGINT in signalled:
+            _LOGGER.info('Shutting down.')
+            _stop_workers(current | stopping)
+            stopping.update(current)
+            current = set()
+            signalled.clear()
+
+        if signal.SIGHUP in signalled:
+            signalled.discard(signal.SIGHUP)
+            _LOGGER.info('Reloading workers.')
+            stopping.update(current)
+            current = _start()
+            _stop_workers(stopping)
+
+        if not current and not stopping:
+            break
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            # Interrupted by signal.
+            continue
+
+        if not pid:
+            time.sleep(1)
+            continue
+
+        if pid in stopping:
+            stopping.discard(pid)
+        elif pid in current:
+            current.discard(pid)
+            _LOGGER.warning('Worker %d exited unexpectedly: %d, restarting.',
+                            pid, status)
+            # Throttle restarts of a failing worker.
+            time.sleep(1)
+            current.add(_fork_worker(wsgi_app, sockets, threads, keepalive,
+                                     xheaders, worker_init))
+
+    for sock in sockets:
+        sock.close()
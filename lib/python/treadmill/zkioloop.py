@@ -0,0 +1,75 @@
+"""Zookeeper adapter delivering results and watch events on Tornado IOLoop.
+
+Kazoo invokes watches and completes async requests on its own threads. The
+adapter hands them over to the IOLoop with add_callback, the only thread safe
+IOLoop method, so that code using the adapter runs on the IOLoop thread only
+and never blocks it waiting for Zookeeper.
+"""
+from __future__ import absolute_import
+
+import logging
+
+import tornado.concurrent
+import tornado.ioloop
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class IOLoopZk(object):
+    """Tornado IOLoop adapter of the kazoo client."""
+    __slots__ = (
+        'zkclient',
+        'ioloop',
+    )
+
+    def __init__(self, zkclient, ioloop=None):
+        self.zkclient = zkclient
+        if ioloop is None:
+            ioloop = tornado.ioloop.IOLoop.current()
+        self.ioloop = ioloop
+
+    def callback(self, func):
+        """Returns wrapper of func which invokes func on the IOLoop."""
+        def _on_ioloop(*args, **kwargs):
+            """Schedule the call on the IOLoop."""
+            self.ioloop.add_callback(func, *args, **kwargs)
+
+        return _on_ioloop
+
+    def _future(self, async_result):
+        """Returns Future resolved on the IOLoop with the async result."""
+        future = tornado.concurrent.Future()
+
+        def _done(result):
+            """Pass the result to the IOLoop."""
+            try:
+                value = result.get()
+            except Exception as err:  # pylint: disable=W0703
+                self.ioloop.add_callback(future.set_exception, err)
+                return
+            self.ioloop.add_callback(future.set_result, value)
+
+        async_result.rawlink(_done)
+        return future
+
+    def _watch(self, watch):
+        """Returns watch invoked on the IOLoop, None if no watch."""
+        if watch is None:
+            return None
+        return self.callback(watch)
+
+    def get(self, path, watch=None):
+        """Returns Future of the node (data, metadata)."""
+        return self._future(
+            self.zkclient.get_async(path, watch=self._watch(watch)))
+
+    def get_children(self, path, watch=None):
+        """Returns Future of the node children."""
+        return self._future(
+            self.zkclient.get_children_async(path, watch=self._watch(watch)))
+
+    def exists(self, path, watch=None):
+        """Returns Future of the node metadata, None if it does not exist."""
+        return self._future(
+            self.zkclient.exists_async(path, watch=self._watch(watch)))
@@ -18,6 +18,7 @@ EVENTS = '/events'
 IDENTITY_GROUPS = '/identity-groups'
 NODEINFO = '/nodeinfo'
 PLACEMENT = '/placement'
+PLACEMENT_SHARDS = '/placement-shards'
 RUNNING = '/running'
 SCHEDULED = '/scheduled'
 SCHEDULER = '/scheduler'
@@ -104,6 +105,7 @@ path.chroot = _make_path_f(TREADMILL)
 path.event = _make_path_f(EVENTS)
 path.identity_group = _make_path_f(IDENTITY_GROUPS)
 path.placement = _make_path_f(PLACEMENT)
+path.placement_shard = _make_path_f(PLACEMENT_SHARDS)
 path.running = _make_path_f(RUNNING)
 path.scheduled = _make_path_f(SCHEDULED)
 path.scheduler = _make_path_f(SCHEDULER)
@@ -7,6 +7,7 @@ import os
 if os.name != 'nt':
     import pwd  # pylint: disable=C0411
 
+import collections
 import fnmatch
 import logging
 import pickle
@@ -40,6 +41,21 @@ APP_BLACKLIST = '/app_blacklist'
 # This is the maximum time the start will try to connect for, i.e. 1 day
 ZK_MAX_CONNECTION_START_TIMEOUT = 3600
 
+# Maximum number of pipelined async requests in bulk operations.
+MAX_IN_FLIGHT = 256
+
+# Default number of operations in single multi-op transaction.
+BATCH_SIZE = 100
+
+# Maximum number of pipelined transactions.
+MAX_IN_FLIGHT_BATCHES = 8
+
+# Number of attempts to commit the batch before applying ops one by one.
+BATCH_RETRIES = 3
+
+# Use libyaml if available, same semantics as yaml.load.
+_YAML_LOADER = getattr(yaml, 'CLoader', yaml.Loader)
+
 
 def make_user_acl(user, perm):
     """Constructs an ACL based on user and permissions.
@@ -514,6 +530,210 @@ def get_default(zkclient, path, watcher=None, strict=True, need_metadata=False,
             return default
 
 
+def _yaml_load(data):
+    """Parse YAML payload, None if the node is empty."""
+    if data is None:
+        return None
+    return yaml.load(data, Loader=_YAML_LOADER)
+
+
+def get_many_stat(zkclient, paths, max_in_flight=MAX_IN_FLIGHT):
+    """Read content and metadata of many nodes with pipelined async requests.
+
+    At most max_in_flight requests are outstanding at any time. Yields
+    (path, data, metadata) in order, nodes which do not exist are skipped.
+    """
+    paths = iter(paths)
+    pending = collections.deque()
+    while True:
+        for path in paths:
+            pending.append((path, zkclient.get_async(path)))
+            if len(pending) >= max_in_flight:
+                break
+
+        if not pending:
+            return
+
+        path, async_result = pending.popleft()
+        try:
+            data, metadata = async_result.get()
+            yield path, data, metadata
+        except kazoo.client.NoNodeError:
+            pass
+
+
+def get_many_raw(zkclient, paths, max_in_flight=MAX_IN_FLIGHT):
+    """Read content of many nodes with pipelined async requests.
+
+    At most max_in_flight requests are outstanding at any time. Yields
+    (path, data) in order, nodes which do not exist are skipped.
+    """
+    for path, data, _metadata in get_many_stat(zkclient, paths,
+                                               max_in_flight):
+        yield path, data
+
+
+def exists_many(zkclient, paths, max_in_flight=MAX_IN_FLIGHT):
+    """Check existence of many nodes with pipelined async requests.
+
+    Yields (path, metadata) in order, metadata is None if the node does not
+    exist.
+    """
+    paths = iter(paths)
+    pending = collections.deque()
+    while True:
+        for path in paths:
+            pending.append((path, zkclient.exists_async(path)))
+            if len(pending) >= max_in_flight:
+                break
+
+        if not pending:
+            return
+
+        path, async_result = pending.popleft()
+        yield path, async_result.get()
+
+
+def get_many(zkclient, paths, max_in_flight=MAX_IN_FLIGHT):
+    """Read and parse content of many nodes, return dict path -> content.
+
+    Nodes which do not exist are not included in the result.
+    """
+    return dict((path, _yaml_load(data))
+                for path, data in get_many_raw(zkclient, paths,
+                                               max_in_flight))
+
+
+def ensure_many_exist(zkclient, paths, acl=None, max_in_flight=MAX_IN_FLIGHT):
+    """Creates nodes with pipelined async requests if they do not exist.
+
+    Unlike ensure_exists, acl of the existing nodes is not modified.
+    """
+    realacl = make_default_acl(acl)
+    paths = iter(paths)
+    pending = collections.deque()
+    while True:
+        for path in paths:
+            pending.append(zkclient.create_async(path, '', acl=realacl,
+                                                 makepath=True))
+            if len(pending) >= max_in_flight:
+                break
+
+        if not pending:
+            return
+
+        try:
+            pending.popleft().get()
+        except kazoo.client.NodeExistsError:
+            pass
+
+
+class BatchWriter(object):
+    """Writes nodes with pipelined multi-op transactions.
+
+    put/delete have the semantics of zkutils.put/ensure_deleted (delete is not
+    recursive). Operations on the same path should not be queued twice, as
+    retried batches are not ordered.
+    """
+    __slots__ = (
+        'zkclient',
+        'batch_size',
+        'max_in_flight',
+        'retries',
+        'ops',
+        'pending',
+    )
+
+    def __init__(self, zkclient, batch_size=BATCH_SIZE,
+                 max_in_flight=MAX_IN_FLIGHT_BATCHES, retries=BATCH_RETRIES):
+        self.zkclient = zkclient
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.ops = []
+        self.pending = collections.deque()
+
+    def put(self, path, data=None, acl=None):
+        """Create node or set node content."""
+        self._add(('create', path, _payload(data), make_default_acl(acl)))
+
+    def delete(self, path):
+        """Delete node if it exists."""
+        self._add(('delete', path, None, None))
+
+    def commit(self):
+        """Commit queued operations, wait for all batches to complete."""
+        if self.ops:
+            self._send()
+        while self.pending:
+            self._wait()
+
+    def _add(self, operation):
+        """Queue operation, send the batch if full."""
+        self.ops.append(operation)
+        if len(self.ops) >= self.batch_size:
+            self._send()
+
+    def _send(self):
+        """Send queued operations as single transaction."""
+        ops, self.ops = self.ops, []
+        self.pending.append((ops, self._commit_async(ops)))
+        while len(self.pending) > self.max_in_flight:
+            self._wait()
+
+    def _commit_async(self, ops):
+        """Commit ops as transaction asynchronously."""
+        transaction = self.zkclient.transaction()
+        for kind, path, payload, acl in ops:
+            if kind == 'create':
+                transaction.create(path, payload, acl=acl)
+            elif kind == 'set':
+                transaction.set_data(path, payload)
+            else:
+                transaction.delete(path)
+        return transaction.commit_async()
+
+    def _wait(self):
+        """Wait for the oldest batch, retry failed transaction."""
+        ops, async_result = self.pending.popleft()
+        single = []
+        attempt = 1
+        while True:
+            results = async_result.get()
+            if not any(isinstance(result, Exception) for result in results):
+                ops = []
+                break
+
+            retry = []
+            for operation, result in zip(ops, results):
+                kind, path, payload, acl = operation
+                if isinstance(result, kazoo.exceptions.RolledBackError):
+                    retry.append(operation)
+                elif (kind == 'create' and
+                      isinstance(result, kazoo.exceptions.NodeExistsError)):
+                    retry.append(('set', path, payload, acl))
+                elif (kind == 'delete' and
+                      isinstance(result, kazoo.exceptions.NoNodeError)):
+                    pass
+                else:
+                    single.append(operation)
+
+            ops = retry
+            if not ops or attempt >= self.retries:
+                break
+
+            _LOGGER.debug('Retrying transaction: %d ops', len(ops))
+            attempt += 1
+            async_result = self._commit_async(ops)
+
+        # Apply ops which keep failing one by one.
+        for kind, path, payload, acl in single + ops:
+            if kind == 'delete':
+                ensure_deleted(self.zkclient, path, recursive=False)
+            else:
+                put(self.zkclient, path, payload, acl=acl, default_acl=False)
+
+
 def get_children_count(zkclient, path, exc_safe=True):
     """Gets the node children count."""
     try:
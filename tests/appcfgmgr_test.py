@@ -5,7 +5,6 @@ Unit test for appcfgmgr - configuring node apps
 import os
 import shutil
 import tempfile
-import time
 import unittest
 
 # Disable W0611: Unused import
@@ -15,6 +14,7 @@ import mock
 
 import treadmill
 from treadmill import appcfgmgr
+from treadmill import exc
 from treadmill import fs
 
 
@@ -36,13 +36,17 @@ class AppCfgMgrTest(unittest.TestCase):
         if self.root and os.path.isdir(self.root):
             shutil.rmtree(self.root)
 
-    @mock.patch('treadmill.appmgr.configure.configure',
-                mock.Mock(return_value='/test/foo'))
+    @mock.patch('treadmill.appmgr.configure.configure', mock.Mock())
     @mock.patch('treadmill.appmgr.configure.schedule', mock.Mock())
     def test__configure(self):
         """Tests application configuration event."""
         # Access to a protected member _configure of a client class
         # pylint: disable=W0212
+        container_dir = os.path.join(self.apps, 'foo-1_1234')
+        os.mkdir(container_dir)
+        treadmill.appmgr.configure.configure.return_value = container_dir
+        with open(os.path.join(self.cache, 'foo#1'), 'w') as f:
+            f.write('manifest')
 
         self.appcfgmgr._configure('foo#1')
 
@@ -51,9 +55,16 @@ class AppCfgMgrTest(unittest.TestCase):
             os.path.join(self.cache, 'foo#1'),
         )
         treadmill.appmgr.configure.schedule.assert_called_with(
-            '/test/foo',
+            container_dir,
             os.path.join(self.running, 'foo#1'),
         )
+        self.assertTrue(self.appcfgmgr._is_configured('foo#1', container_dir))
+
+        with open(os.path.join(self.cache, 'foo#1'), 'w') as f:
+            f.write('changed manifest')
+        self.assertFalse(
+            self.appcfgmgr._is_configured('foo#1', container_dir)
+        )
 
     @mock.patch('treadmill.appmgr.abort.abort', mock.Mock())
     @mock.patch('treadmill.appmgr.configure.configure', mock.Mock())
@@ -76,6 +87,43 @@ class AppCfgMgrTest(unittest.TestCase):
             os.path.join(self.cache, 'foo#1')
         )
 
+    @mock.patch('treadmill.appmgr.abort.abort', mock.Mock())
+    @mock.patch('treadmill.appmgr.configure.configure', mock.Mock())
+    @mock.patch('treadmill.appmgr.configure.schedule', mock.Mock())
+    def test__configure_instances(self):
+        """Tests configuring instances concurrently, failures are isolated."""
+        # Access to a protected member _configure_instances of a client class
+        # pylint: disable=W0212
+        def _configure(_tm_env, event_file):
+            """Fail configuring foo#2."""
+            if event_file.endswith('#2'):
+                raise Exception('Boom')
+            container_dir = os.path.join(
+                self.apps, os.path.basename(event_file).replace('#', '-')
+            )
+            os.mkdir(container_dir)
+            return container_dir
+
+        treadmill.appmgr.configure.configure.side_effect = _configure
+        instances = ['foo#%d' % idx for idx in range(10)]
+        for instance in instances:
+            with open(os.path.join(self.cache, instance), 'w') as f:
+                f.write(instance)
+
+        self.assertEquals(
+            set(instances) - set(['foo#2']),
+            self.appcfgmgr._configure_instances(instances)
+        )
+        self.assertEquals(
+            10, treadmill.appmgr.configure.configure.call_count
+        )
+        treadmill.appmgr.abort.abort.assert_called_once_with(
+            self.appcfgmgr.tm_env,
+            os.path.join(self.cache, 'foo#2'),
+            mock.ANY,
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.cache, 'foo#2')))
+
     @mock.patch('treadmill.subproc.check_call', mock.Mock())
     @mock.patch('treadmill.utils.rootdir',
                 mock.Mock(return_value='/treadmill'))
@@ -146,6 +194,63 @@ class AppCfgMgrTest(unittest.TestCase):
             instance_names=set(['proid.app#0', 'proid.app#1', 'proid.app#2'])
         )
 
+    @mock.patch('treadmill.appcfgmgr.AppCfgMgr._configure', mock.Mock())
+    @mock.patch('treadmill.appcfgmgr.AppCfgMgr._refresh_supervisor',
+                mock.Mock())
+    @mock.patch('treadmill.appcfgmgr.AppCfgMgr._terminate', mock.Mock())
+    @mock.patch('treadmill.appmgr.eventfile_unique_name', mock.Mock())
+    def test__synchronize_unchanged(self):
+        """Tests synchronize only configures new or changed instances.
+        """
+        # Access to a protected member _synchronize of a client class
+        # pylint: disable=W0212
+        def _fake_unique_name(name):
+            """Fake container unique name function.
+            """
+            uniquename = os.path.basename(name)
+            uniquename = uniquename.replace('#', '-')
+            uniquename += '_1234'
+            return uniquename
+        treadmill.appmgr.eventfile_unique_name.side_effect = _fake_unique_name
+        for app in ('proid.app#0', 'proid.app#1', 'proid.app#2'):
+            # Create cache/ entry
+            event_file = os.path.join(self.cache, app)
+            with open(event_file, 'w') as f:
+                f.write(app)
+            # Create app/ dir, configured with the cached manifest
+            uniquename = _fake_unique_name(app)
+            container_dir = os.path.join(self.apps, uniquename)
+            os.mkdir(container_dir)
+            with open(os.path.join(container_dir, 'fingerprint'), 'w') as f:
+                f.write(appcfgmgr._fingerprint(event_file, uniquename))
+            # Create running/ symlink
+            os.symlink(container_dir, os.path.join(self.running, app))
+
+        # Manifest of proid.app#1 changed since it was configured
+        with open(os.path.join(self.cache, 'proid.app#1'), 'w') as f:
+            f.write('changed')
+        # New instance
+        with open(os.path.join(self.cache, 'proid.app#3'), 'w') as f:
+            f.write('proid.app#3')
+
+        self.appcfgmgr._synchronize()
+
+        self.assertFalse(treadmill.appcfgmgr.AppCfgMgr._terminate.called)
+        treadmill.appcfgmgr.AppCfgMgr._configure.assert_has_calls(
+            [
+                mock.call('proid.app#1'),
+                mock.call('proid.app#3'),
+            ],
+            any_order=True
+        )
+        self.assertEquals(
+            2, treadmill.appcfgmgr.AppCfgMgr._configure.call_count
+        )
+        treadmill.appcfgmgr.AppCfgMgr._refresh_supervisor.assert_called_with(
+            instance_names=set(['proid.app#0', 'proid.app#1', 'proid.app#2',
+                                'proid.app#3'])
+        )
+
     @mock.patch('treadmill.appcfgmgr.AppCfgMgr._configure', mock.Mock())
     @mock.patch('treadmill.appcfgmgr.AppCfgMgr._refresh_supervisor',
                 mock.Mock())
@@ -289,10 +394,9 @@ class AppCfgMgrTest(unittest.TestCase):
             instance_names=set(['foo#1'])
         )
 
-    @mock.patch('time.sleep', mock.Mock())
-    @mock.patch('treadmill.subproc.call',
-                mock.Mock(side_effect=[1, 1, 0, 1, 0]))
     @mock.patch('treadmill.subproc.check_call', mock.Mock())
+    @mock.patch('treadmill.supervisor.control_services',
+                mock.Mock(return_value=set()))
     def test__refresh_supervisor(self):
         """Check how the supervisor is beeing refreshed.
         """
@@ -300,72 +404,33 @@ class AppCfgMgrTest(unittest.TestCase):
         # pylint: disable=W0212
 
         self.appcfgmgr._refresh_supervisor(
-            instance_names=set(['foo#1', 'bar#2'])
+            instance_names=['foo#1', 'bar#2']
         )
 
-        treadmill.subproc.check_call.assert_has_calls(
+        treadmill.subproc.check_call.assert_called_with(
             [
-                mock.call(
-                    [
-                        's6-svscanctl',
-                        '-an',
-                        self.running
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svc',
-                        '-uO',
-                        os.path.join(self.running, 'foo#1'),
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svc',
-                        '-uO',
-                        os.path.join(self.running, 'bar#2'),
-                    ]
-                ),
+                's6-svscanctl',
+                '-an',
+                self.running
             ]
         )
-        # Make sure we did the right amount of retries
-        treadmill.subproc.call.assert_has_calls(
+        treadmill.supervisor.control_services.assert_called_with(
             [
-                mock.call(
-                    [
-                        's6-svok',
-                        os.path.join(self.running, 'foo#1'),
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svok',
-                        os.path.join(self.running, 'foo#1'),
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svok',
-                        os.path.join(self.running, 'foo#1'),
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svok',
-                        os.path.join(self.running, 'bar#2'),
-                    ]
-                ),
-                mock.call(
-                    [
-                        's6-svok',
-                        os.path.join(self.running, 'bar#2'),
-                    ]
-                ),
-            ]
+                os.path.join(self.running, 'foo#1'),
+                os.path.join(self.running, 'bar#2'),
+            ],
+            'uO',
+            timeout=mock.ANY
+        )
+
+        # Instances not picked up by the supervisor in time.
+        treadmill.supervisor.control_services.return_value = set(
+            [os.path.join(self.running, 'bar#2')]
         )
-        self.assertEqual(
-            time.sleep.call_count,
-            3
+        self.assertRaises(
+            exc.NodeSetupError,
+            self.appcfgmgr._refresh_supervisor,
+            instance_names=['foo#1', 'bar#2']
         )
 
 
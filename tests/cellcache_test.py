@@ -0,0 +1,177 @@
+"""Unit test for treadmill.cellcache.
+"""
+
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+import kazoo
+import kazoo.client
+import mock
+
+from treadmill import cellcache
+from treadmill.test import mockzk
+
+
+class CellCacheTest(mockzk.MockZookeeperTestCase):
+    """Mock test for treadmill.cellcache."""
+
+    def setUp(self):
+        super(CellCacheTest, self).setUp()
+        self.watches = {}
+        self.zkclient = kazoo.client.KazooClient()
+
+        def children_watch(path):
+            """Record the watch function, invoke it with current children."""
+            def _decorator(func):
+                """Register the watch."""
+                self.watches[path] = func
+                func(self.zkclient.get_children(path))
+                return func
+            return _decorator
+
+        self.zkclient.ChildrenWatch = children_watch
+        self.cache = cellcache.CellCache(self.zkclient)
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_children(self):
+        """Test sharing children watch between subscribers."""
+        zk_content = {
+            'running': {
+                'foo.x#0000000001': {},
+                'bar.x#0000000002': {},
+            },
+        }
+        self.make_mock_zk(zk_content)
+
+        foo_changes = []
+        all_changes = []
+        foo, seq, snapshot = self.cache.subscribe(
+            'running', lambda *args: foo_changes.append(args), 'foo.*')
+        self.assertEquals(1, seq)
+        self.assertEquals({'foo.x#0000000001': None}, snapshot)
+        _all, seq, snapshot = self.cache.subscribe(
+            'running', lambda *args: all_changes.append(args))
+        self.assertEquals(2, len(snapshot))
+        self.assertEquals(['/running'], self.watches.keys())
+
+        del zk_content['running']['foo.x#0000000001']
+        zk_content['running']['bar.x#0000000003'] = {}
+        self.watches['/running'](['bar.x#0000000002', 'bar.x#0000000003'])
+
+        self.assertEquals([(2, {}, ['foo.x#0000000001'])], foo_changes)
+        self.assertEquals(
+            [(2, {'bar.x#0000000003': None}, ['foo.x#0000000001'])],
+            all_changes
+        )
+
+        # Unsubscribed and not matching subscribers are not notified.
+        self.cache.unsubscribe(foo)
+        self.watches['/running'](['foo.x#0000000004'])
+        self.assertEquals(1, len(foo_changes))
+        self.assertEquals(2, len(all_changes))
+        self.assertEquals({'foo.x#0000000004': None},
+                          self.cache.get('running'))
+
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.exists_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_endpoints(self):
+        """Test endpoints are fetched once per endpoint node version."""
+        zk_content = {
+            'endpoints': {
+                'foo': {
+                    'x#0000000001:http': {
+                        '.data': 'host1:1234',
+                        '.metadata': {'last_modified_transaction_id': 1},
+                    },
+                },
+                'bar': {
+                    'x#0000000002:http': {
+                        '.data': 'host2:1234',
+                        '.metadata': {'last_modified_transaction_id': 2},
+                    },
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+
+        changes = []
+        _sub, _seq, snapshot = self.cache.subscribe(
+            'endpoints', lambda *args: changes.append(args), 'foo.*')
+        self.assertEquals({'foo.x#0000000001:http': 'host1:1234'}, snapshot)
+        self.assertEquals(2, kazoo.client.KazooClient.get_async.call_count)
+
+        zk_content['endpoints']['foo']['x#0000000003:http'] = {
+            '.data': 'host3:1234',
+            '.metadata': {'last_modified_transaction_id': 3},
+        }
+        self.watches['/endpoints/foo'](['x#0000000001:http',
+                                        'x#0000000003:http'])
+        self.assertEquals(3, kazoo.client.KazooClient.get_async.call_count)
+        self.assertEquals(
+            [(3, {'foo.x#0000000003:http': 'host3:1234'}, [])],
+            changes
+        )
+
+        # Endpoint recreated before the children are listed is fetched again.
+        zk_content['endpoints']['foo']['x#0000000003:http'] = {
+            '.data': 'host4:1234',
+            '.metadata': {'last_modified_transaction_id': 4},
+        }
+        del zk_content['endpoints']['foo']['x#0000000001:http']
+        self.watches['/endpoints/foo'](['x#0000000003:http'])
+        self.assertEquals(4, kazoo.client.KazooClient.get_async.call_count)
+        self.assertEquals(
+            (4, {'foo.x#0000000003:http': 'host4:1234'},
+             ['foo.x#0000000001:http']),
+            changes[-1]
+        )
+        self.assertEquals(
+            {'foo.x#0000000003:http': 'host4:1234'},
+            self.cache.snapshot('endpoints', 'foo.*')
+        )
+
+        # Endpoints of the deleted proid are removed.
+        del zk_content['endpoints']['foo']
+        self.watches['/endpoints'](['bar'])
+        self.assertEquals((5, {}, ['foo.x#0000000003:http']), changes[-1])
+        self.assertEquals({}, self.cache.snapshot('endpoints', 'foo.*'))
+        self.assertEquals(
+            {'bar.x#0000000002:http': 'host2:1234'},
+            self.cache.snapshot('endpoints')
+        )
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('treadmill.cellcache.CHANGELOG_SIZE', 2)
+    def test_changes(self):
+        """Test replaying changes from the change log."""
+        self.make_mock_zk({'running': {}})
+        self.cache.get('running')
+        self.assertEquals([], self.cache.changes('running', 0))
+
+        self.watches['/running'](['foo.x#0000000001'])
+        self.watches['/running'](['foo.x#0000000001', 'bar.x#0000000002'])
+        self.watches['/running'](['bar.x#0000000002'])
+
+        self.assertEquals(
+            [(2, {'bar.x#0000000002': None}, []),
+             (3, {}, ['foo.x#0000000001'])],
+            self.cache.changes('running', 1)
+        )
+        self.assertEquals(
+            [(3, {}, ['foo.x#0000000001'])],
+            self.cache.changes('running', 1, 'foo.*')
+        )
+        self.assertEquals([], self.cache.changes('running', 3))
+
+        # Change 1 is no longer in the change log, unknown seq.
+        self.assertIsNone(self.cache.changes('running', 0))
+        self.assertIsNone(self.cache.changes('running', 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
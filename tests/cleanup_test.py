@@ -0,0 +1,122 @@
+"""Unit test for cleanup - finishing node containers.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+import mock
+
+import treadmill
+from treadmill import cleanup
+from treadmill import exc
+
+
+class CleanupTest(unittest.TestCase):
+    """Mock test for treadmill.cleanup.Cleanup."""
+
+    @mock.patch('treadmill.watchdog.Watchdog', mock.Mock(autospec=True))
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+        self.zkclient = mock.Mock()
+        self.cleanup = cleanup.Cleanup(root=self.root,
+                                       zkclient=self.zkclient,
+                                       workers=2)
+
+        self.apps = self.cleanup.tm_env.apps_dir
+        self.cleanup_dir = self.cleanup.tm_env.cleanup_dir
+
+    def tearDown(self):
+        self.cleanup.pool.terminate()
+        if self.root and os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+    def _link(self, name):
+        """Create the container dir and its cleanup link."""
+        container_dir = os.path.join(self.apps, name)
+        os.mkdir(container_dir)
+        os.symlink(container_dir, os.path.join(self.cleanup_dir, name))
+        return container_dir
+
+    @mock.patch('treadmill.appmgr.finish.finish', mock.Mock())
+    def test__on_created(self):
+        """Test finishing the containers on the workers."""
+        # Access to a protected member _on_created of a client class
+        # pylint: disable=W0212
+        started = threading.Event()
+        release = threading.Event()
+
+        def _finish(_tm_env, _zkclient, container_dir):
+            """Block the finish of foo."""
+            if container_dir.endswith('foo-1_1234'):
+                started.set()
+                release.wait(5)
+
+        treadmill.appmgr.finish.finish.side_effect = _finish
+        foo = self._link('foo-1_1234')
+        bar = self._link('bar-1_5678')
+
+        self.cleanup._on_created('foo-1_1234')
+        self.assertTrue(started.wait(5))
+        # Link reported twice is finished once.
+        self.cleanup._on_created('foo-1_1234')
+        self.cleanup._on_created('bar-1_5678')
+
+        release.set()
+        self.cleanup.pool.close()
+        self.cleanup.pool.join()
+
+        treadmill.appmgr.finish.finish.assert_has_calls(
+            [
+                mock.call(self.cleanup.tm_env, self.zkclient, foo),
+                mock.call(self.cleanup.tm_env, self.zkclient, bar),
+            ],
+            any_order=True
+        )
+        self.assertEquals(2, treadmill.appmgr.finish.finish.call_count)
+        self.assertEquals([], os.listdir(self.cleanup_dir))
+        self.assertEquals(set(), self.cleanup.pending)
+        self.assertEquals(set(), self.cleanup.failed)
+
+    @mock.patch('treadmill.appmgr.finish.finish', mock.Mock())
+    @mock.patch('treadmill.cleanup._BUSY_WAIT_SEC', 0.1)
+    def test_run_failure(self):
+        """Test that failed cleanup stops the service."""
+        # Access to a protected member _on_created of a client class
+        # pylint: disable=W0212
+        def _finish(_tm_env, _zkclient, container_dir):
+            """Fail the finish of foo."""
+            if container_dir.endswith('foo-1_1234'):
+                raise Exception('boom')
+
+        treadmill.appmgr.finish.finish.side_effect = _finish
+        self._link('foo-1_1234')
+        self._link('bar-1_5678')
+
+        with self.assertRaises(exc.TreadmillError):
+            self.cleanup.run()
+
+        # Failed link is kept to be retried on restart.
+        self.assertEquals(['foo-1_1234'], os.listdir(self.cleanup_dir))
+        self.assertEquals(
+            set([os.path.join(self.cleanup_dir, 'foo-1_1234')]),
+            self.cleanup.failed
+        )
+        self.assertEquals(set(), self.cleanup.pending)
+
+        # No new cleanups are queued once a cleanup failed.
+        treadmill.appmgr.finish.finish.reset_mock()
+        self._link('baz-1_9012')
+        self.cleanup._on_created('baz-1_9012')
+        self.assertEquals(set(), self.cleanup.pending)
+        self.assertFalse(treadmill.appmgr.finish.finish.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
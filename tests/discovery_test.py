@@ -26,8 +26,8 @@ class DiscoveryTest(mockzk.MockZookeeperTestCase):
 
     @mock.patch('treadmill.zkutils.connect', mock.Mock(
         return_value=kazoo.client.KazooClient()))
-    @mock.patch('kazoo.client.KazooClient.get', mock.Mock(
-        return_value=('xxx:111', None)))
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('treadmill.utils.rootdir', mock.Mock(return_value='/some'))
@@ -36,14 +36,16 @@ class DiscoveryTest(mockzk.MockZookeeperTestCase):
         zkclient = kazoo.client.KazooClient()
         app_discovery = discovery.Discovery(zkclient, 'appproid.foo.*', 'http')
 
-        kazoo.client.KazooClient.get_children.return_value = [
-            'foo.1#0:http',
-            'foo.2#0:http',
-            'foo.2#0:tcp',
-            'bar.1#0:http'
-        ]
-
-        kazoo.client.KazooClient.get.return_value = ('xxx:123', None)
+        self.make_mock_zk({
+            'endpoints': {
+                'appproid': {
+                    'foo.1#0:http': {'.data': 'xxx:123'},
+                    'foo.2#0:http': {'.data': 'xxx:123'},
+                    'foo.2#0:tcp': {'.data': 'xxx:123'},
+                    'bar.1#0:http': {'.data': 'xxx:123'},
+                },
+            },
+        })
 
         # Need to call sync first, then put 'exit' on the queue to terminate
         # the loop.
@@ -52,6 +54,9 @@ class DiscoveryTest(mockzk.MockZookeeperTestCase):
         app_discovery.sync()
         kazoo.client.KazooClient.get_children.assert_called_with(
             '/endpoints/appproid', watch=mock.ANY)
+        # Endpoints are resolved with pipelined requests.
+        self.assertFalse(kazoo.client.KazooClient.get.called)
+        self.assertEquals(2, kazoo.client.KazooClient.get_async.call_count)
         app_discovery.exit_loop()
 
         expected = {}
@@ -76,6 +81,44 @@ class DiscoveryTest(mockzk.MockZookeeperTestCase):
         kazoo.client.KazooClient.exists.assert_called_with(
             '/endpoints/appproid', watch=mock.ANY)
 
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.exists_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_get_endpoints(self):
+        """Checks hostports are cached by endpoint node version."""
+        zk_content = {
+            'endpoints': {
+                'appproid': {
+                    'foo.1#0:http': {
+                        '.data': 'xxx:123',
+                        '.metadata': {'last_modified_transaction_id': 1},
+                    },
+                    'foo.2#0:http': {
+                        '.data': 'yyy:123',
+                        '.metadata': {'last_modified_transaction_id': 2},
+                    },
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+        zkclient = kazoo.client.KazooClient()
+        app_discovery = discovery.Discovery(zkclient, 'appproid.foo.*', 'http')
+
+        self.assertEquals(['xxx:123', 'yyy:123'],
+                          sorted(app_discovery.get_endpoints()))
+        self.assertEquals(2, kazoo.client.KazooClient.get_async.call_count)
+
+        # Unchanged endpoints are not fetched again.
+        kazoo.client.KazooClient.get_async.reset_mock()
+        zk_content['endpoints']['appproid']['foo.2#0:http'] = {
+            '.data': 'zzz:123',
+            '.metadata': {'last_modified_transaction_id': 3},
+        }
+        self.assertEquals(['xxx:123', 'zzz:123'],
+                          sorted(app_discovery.get_endpoints()))
+        kazoo.client.KazooClient.get_async.assert_called_once_with(
+            '/endpoints/appproid/foo.2#0:http')
+
     def test_pattern(self):
         """Checks instance aware pattern construction."""
         app_discovery = discovery.Discovery(None, 'appproid.foo', 'http')
@@ -101,35 +101,103 @@ class EventMgrTest(mockzk.MockZookeeperTestCase):
     #
     #     mock_watchdog_lease.remove.assert_called_with()
 
-    @mock.patch('treadmill.zkutils.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     def test__cache(self):
         """Tests application cache event.
         """
         # Access to a protected member _cache of a client class
         # pylint: disable=W0212
-        treadmill.zkutils.get.return_value = {}
+        self.make_mock_zk({
+            'scheduled': {
+                'foo#001': {},
+            },
+            'placement': {
+                'test.xx.com': {
+                    'foo#001': {},
+                },
+            },
+        })
+        self.evmgr._hostname = 'test.xx.com'
 
         zkclient = kazoo.client.KazooClient()
-        self.evmgr._cache(zkclient, 'foo#001')
+        self.evmgr._cache(zkclient, ['foo#001'])
 
         appcache = os.path.join(self.cache, 'foo#001')
         self.assertTrue(os.path.exists(appcache))
 
-    @mock.patch('treadmill.zkutils.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     def test__cache_notfound(self):
         """Tests application cache event when app is not found.
         """
         # Access to a protected member _cache of a client class
         # pylint: disable=W0212
-        treadmill.zkutils.get.side_effect = \
-            kazoo.exceptions.NoNodeError
+        self.make_mock_zk({
+            'scheduled': {},
+            'placement': {
+                'test.xx.com': {
+                    'foo#001': {},
+                },
+            },
+        })
+        self.evmgr._hostname = 'test.xx.com'
 
         zkclient = kazoo.client.KazooClient()
-        self.evmgr._cache(zkclient, 'foo#001')
+        self.evmgr._cache(zkclient, ['foo#001'])
 
         appcache = os.path.join(self.cache, 'foo#001')
         self.assertFalse(os.path.exists(appcache))
 
+    @mock.patch('kazoo.client.KazooClient.exists_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    def test__cache_unchanged(self):
+        """Tests unchanged manifests are not fetched again.
+        """
+        # Access to a protected member _cache of a client class
+        # pylint: disable=W0212
+        zk_content = {
+            'scheduled': {
+                'foo#001': {
+                    '.data': '{memory: 1G}\n',
+                    '.metadata': {'last_modified_transaction_id': 10},
+                },
+            },
+            'placement': {
+                'test.xx.com': {
+                    'foo#001': {
+                        '.data': '{identity: 1}\n',
+                        '.metadata': {'last_modified_transaction_id': 11},
+                    },
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+        self.evmgr._hostname = 'test.xx.com'
+        appcache = os.path.join(self.cache, 'foo#001')
+
+        zkclient = kazoo.client.KazooClient()
+        self.evmgr._cache(zkclient, ['foo#001'])
+        self.assertEquals(2, kazoo.client.KazooClient.get_async.call_count)
+
+        os.unlink(appcache)
+        self.evmgr._cache(zkclient, ['foo#001'])
+        self.assertEquals(2, kazoo.client.KazooClient.get_async.call_count)
+        with open(appcache) as f:
+            self.assertEquals(
+                {'memory': '1G', 'identity': 1, 'task': '001'},
+                yaml.load(f.read())
+            )
+
+        # Placement changed, fetch again.
+        os.unlink(appcache)
+        zk_content['placement']['test.xx.com']['foo#001'] = {
+            '.data': '{identity: 2}\n',
+            '.metadata': {'last_modified_transaction_id': 12},
+        }
+        self.evmgr._cache(zkclient, ['foo#001'])
+        self.assertEquals(4, kazoo.client.KazooClient.get_async.call_count)
+        with open(appcache) as f:
+            self.assertEquals(2, yaml.load(f.read())['identity'])
+
     @mock.patch('glob.glob', mock.Mock())
     @mock.patch('treadmill.eventmgr.EventMgr._cache', mock.Mock())
     def test__synchronize(self):
@@ -144,7 +212,7 @@ class EventMgrTest(mockzk.MockZookeeperTestCase):
 
         # cache should have been called with 'foo' app
         treadmill.eventmgr.EventMgr._cache.assert_called_with(
-            zkclient, 'foo#001')
+            zkclient, set(['foo#001']))
 
     @mock.patch('glob.glob', mock.Mock())
     @mock.patch('os.unlink', mock.Mock())
@@ -169,6 +237,7 @@ class EventMgrTest(mockzk.MockZookeeperTestCase):
         self.assertFalse(treadmill.eventmgr.EventMgr._cache.called)
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     def test_cache_placement_data(self):
@@ -198,7 +267,7 @@ class EventMgrTest(mockzk.MockZookeeperTestCase):
         self.make_mock_zk(zk_content)
         zkclient = kazoo.client.KazooClient()
         self.evmgr._hostname = 'test.xx.com'
-        self.evmgr._cache(zkclient, 'xxx.app1#1234')
+        self.evmgr._cache(zkclient, ['xxx.app1#1234'])
 
         appcache = os.path.join(self.cache, 'xxx.app1#1234')
         self.assertTrue(os.path.exists(appcache))
@@ -58,6 +58,7 @@ class MasterTest(mockzk.MockZookeeperTestCase):
                                                            'disk': '1G'}))
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.set', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.create', mock.Mock())
@@ -138,6 +139,70 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         self.assertNotIn('test.xx.com', self.master.servers)
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    def test_load_snapshot(self):
+        """Tests warm start from the scheduler snapshot."""
+        cell = scheduler.Cell('test-cell')
+        rack = scheduler.Bucket('rack:1234', level='rack')
+        cell.add_node(rack)
+        server = scheduler.Server('test.xx.com', [10, 10, 10],
+                                  valid_until=time.time() + 1000)
+        rack.add_node(server)
+        cell.add_app(cell.allocation,
+                     scheduler.Application('foo.bar#1234', 10, [1, 1, 1],
+                                           'foo.bar'))
+        cell.schedule()
+
+        kazoo.client.KazooClient.get.return_value = (scheduler.dumps(cell),
+                                                     None)
+        self.assertTrue(self.master.load_snapshot())
+        self.assertEquals(['rack:1234'], self.master.buckets.keys())
+        self.assertEquals(['test.xx.com'], self.master.servers.keys())
+        self.assertEquals('test.xx.com',
+                          self.master.cell.apps['foo.bar#1234'].server)
+
+        kazoo.client.KazooClient.get.return_value = ('garbage', None)
+        self.assertFalse(self.master.load_snapshot())
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_load_strategies(self):
+        """Tests loading bucket affinity strategies."""
+        zk_content = {
+            'buckets': {
+                'pod:pod1': {
+                    'features': []
+                },
+            },
+            'strategies': {
+                'pod:pod1': {
+                    '*': 'bestfit',
+                    'foo.bar': 'pack',
+                    'foo.baz': 'nosuchstrategy',
+                },
+                'test-cell': {
+                    'foo.bar': 'worstfit',
+                },
+                'pod:nosuchpod': {
+                    'foo.bar': 'pack',
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+        self.master.load_buckets()
+        self.master.load_strategies()
+
+        pod1 = self.master.buckets['pod:pod1']
+        self.assertIs(scheduler.BestFitStrategy, pod1.default_strategy_t)
+        self.assertIsInstance(pod1.get_affinity_strategy('foo.bar'),
+                              scheduler.PackStrategy)
+        self.assertIsInstance(pod1.get_affinity_strategy('foo.baz'),
+                              scheduler.BestFitStrategy)
+        self.assertIsInstance(
+            self.master.cell.get_affinity_strategy('foo.bar'),
+            scheduler.WorstFitStrategy)
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.set', mock.Mock())
@@ -227,7 +292,134 @@ treadmill:
             self.master.find_assignment('xxx.bla#1234567890', {})
         )
 
+    def test_find_assignment(self):
+        """Tests matching app names against assignment patterns."""
+        suffix = '[#]' + '[0-9]' * 10
+        alloc = self.master.cell.allocation
+        self.master.assignments = {
+            'proid:treadmlx': {
+                '*' + suffix: (1, alloc.get_sub_alloc('all')),
+                'foo*' + suffix: (2, alloc.get_sub_alloc('foo')),
+                'foo.bar' + suffix: (3, alloc.get_sub_alloc('foo.bar')),
+            },
+        }
+        manifest = {'allocation': 'proid:treadmlx'}
+
+        with mock.patch('treadmill.master.ASSIGNMENT_CHUNK_SIZE', 2):
+            self.assertEquals(
+                (3, alloc.get_sub_alloc('foo.bar')),
+                self.master.find_assignment('treadmlx.foo.bar#0000000001',
+                                            manifest)
+            )
+            self.assertEquals(
+                (2, alloc.get_sub_alloc('foo')),
+                self.master.find_assignment('treadmlx.foo.baz#0000000001',
+                                            manifest)
+            )
+            self.assertEquals(
+                (1, alloc.get_sub_alloc('all')),
+                self.master.find_assignment('treadmlx.xxx#0000000001',
+                                            manifest)
+            )
+            # Instance number is required.
+            self.assertEquals(
+                (1, alloc.get_sub_alloc('default:treadmlx')),
+                self.master.find_assignment('treadmlx.xxx', manifest)
+            )
+
+        # Results are memoized by app base name.
+        self.assertEquals(
+            (2, alloc.get_sub_alloc('foo')),
+            self.master.assignment_matcher.matched[
+                ('proid:treadmlx', 'foo.baz')]
+        )
+
+        # Setting assignments drops memoized results.
+        self.master.assignments = {}
+        self.assertEquals(
+            (1, alloc.get_sub_alloc('default:treadmlx')),
+            self.master.find_assignment('treadmlx.foo.baz#0000000002',
+                                        manifest)
+        )
+
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('treadmill.master.Master._create_tasks', mock.Mock())
+    def test_reload_allocations(self):
+        """Tests applying allocation changes to the loaded apps."""
+        zk_content = {
+            'allocations': {
+                '.data': """
+                    treadmill:
+                      dev:
+                        -alloc:
+                          assignments:
+                            proid:treadmlx:
+                              'foo%': 10
+                          rank: 100
+                          reserved:
+                            memory: 1G
+                      old:
+                        -alloc:
+                          rank: 100
+                          reserved:
+                            memory: 1G
+                """,
+            },
+            'scheduled': {
+                'treadmlx.foo#0000000001': {
+                    'memory': '1G',
+                    'allocation': 'proid:treadmlx',
+                },
+                'treadmlx.bar#0000000002': {
+                    'memory': '1G',
+                    'allocation': 'proid:treadmlx',
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+        self.master.load_allocations()
+        self.master.load_apps()
+
+        apps = self.master.cell.apps
+        root = self.master.cell.allocation
+        dev = root.sub_allocations['treadmill'].sub_allocations['dev']
+        default = root.sub_allocations['default:treadmlx']
+        self.assertIs(dev, apps['treadmlx.foo#0000000001'].allocation)
+        self.assertIs(default, apps['treadmlx.bar#0000000002'].allocation)
+
+        # Allocation is updated in place, only matching apps are rebound.
+        zk_content['allocations']['.data'] = """
+            treadmill:
+              dev:
+                -alloc:
+                  assignments:
+                    proid:treadmlx:
+                      'bar': 20
+                  rank: 50
+                  reserved:
+                    memory: 2G
+        """
+        self.master.reload_allocations()
+        self.assertIs(dev, root.sub_allocations['treadmill'].sub_allocations[
+            'dev'])
+        self.assertEquals(50, dev.rank)
+        self.assertEquals(2048, dev.reserved[0])
+        self.assertNotIn('old',
+                         root.sub_allocations['treadmill'].sub_allocations)
+
+        foo = apps['treadmlx.foo#0000000001']
+        bar = apps['treadmlx.bar#0000000002']
+        self.assertIs(default, foo.allocation)
+        self.assertEquals(1, foo.priority)
+        self.assertIs(dev, bar.allocation)
+        self.assertEquals(20, bar.priority)
+        self.assertEquals(['treadmlx.bar#0000000002'], dev.apps.keys())
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('treadmill.master.Master._create_tasks', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('treadmill.master.Master._create_task', mock.Mock())
     def test_load_apps(self):
@@ -258,6 +450,9 @@ treadmill:
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.put', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.delete', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.commit', mock.Mock())
     @mock.patch('time.time', mock.Mock(return_value=500))
     def test_reschedule(self):
         """Tests application placement."""
@@ -283,20 +478,24 @@ treadmill:
 
         # At this point app1 is on server 1, app2 on server 2.
         self.master.reschedule()
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1', None, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement/2/app2', None, acl=mock.ANY),
+        treadmill.zkutils.BatchWriter.put.assert_has_calls([
+            mock.call('/placement/1/app1', None, acl=mock.ANY),
+            mock.call('/placement/2/app2', None, acl=mock.ANY),
         ])
+        self.assertTrue(treadmill.zkutils.BatchWriter.commit.called)
 
         srv_1.state = scheduler.State.down
         self.master.reschedule()
 
-        treadmill.zkutils.ensure_deleted.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1'),
+        treadmill.zkutils.BatchWriter.delete.assert_has_calls([
+            mock.call('/placement/1/app1'),
+        ])
+        treadmill.zkutils.BatchWriter.put.assert_has_calls([
+            mock.call('/placement/3/app1', None, acl=mock.ANY),
         ])
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/3/app1', None, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement', mock.ANY),
+        # Placement published as delta of the app1 shard.
+        treadmill.zkutils.BatchWriter.put.assert_has_calls([
+            mock.call('/placement-shards/app1/0000000002', mock.ANY),
         ])
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
@@ -304,6 +503,9 @@ treadmill:
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.put', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.delete', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.commit', mock.Mock())
     @mock.patch('time.time', mock.Mock(return_value=500))
     def test_reschedule_once(self):
         """Tests application placement."""
@@ -330,25 +532,30 @@ treadmill:
 
         # At this point app1 is on server 1, app2 on server 2.
         self.master.reschedule()
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1', None, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement/2/app2', None, acl=mock.ANY),
+        treadmill.zkutils.BatchWriter.put.assert_has_calls([
+            mock.call('/placement/1/app1', None, acl=mock.ANY),
+            mock.call('/placement/2/app2', None, acl=mock.ANY),
         ])
 
         srv_1.state = scheduler.State.down
         self.master.reschedule()
 
+        treadmill.zkutils.BatchWriter.delete.assert_has_calls([
+            mock.call('/placement/1/app1'),
+        ])
         treadmill.zkutils.ensure_deleted.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1'),
             mock.call(mock.ANY, '/scheduled/app1'),
         ])
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('treadmill.master.Master._create_tasks', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_exists', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
+    @mock.patch('treadmill.zkutils.BatchWriter.commit', mock.Mock())
     @mock.patch('treadmill.master.Master._create_task', mock.Mock())
     def test_restore_placement(self):
         """Tests application placement."""
@@ -439,6 +646,8 @@ treadmill:
             set([0, 2, 3, 4]))
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('treadmill.master.Master._create_tasks', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_exists', mock.Mock())
@@ -530,7 +739,7 @@ treadmill:
     @mock.patch('treadmill.zkutils.ensure_exists', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
-    @mock.patch('treadmill.master.Master.load_allocations', mock.Mock())
+    @mock.patch('treadmill.master.Master.reload_allocations', mock.Mock())
     @mock.patch('treadmill.master.Master.load_apps', mock.Mock())
     @mock.patch('treadmill.master.Master.load_app', mock.Mock())
     def test_process_events(self):
@@ -549,19 +758,100 @@ treadmill:
 
         self.make_mock_zk(zk_content)
         self.master.watch('/events')
-        while True:
-            try:
-                event = self.master.queue.popleft()
-                self.master.process(event)
-            except IndexError:
-                break
-
-        self.assertTrue(treadmill.master.Master.load_allocations.called)
-        self.assertTrue(treadmill.master.Master.load_apps.called)
+        self.master.process_pending()
+
+        self.assertTrue(treadmill.master.Master.reload_allocations.called)
+        # Allocation change does not reload all apps.
+        self.assertFalse(treadmill.master.Master.load_apps.called)
+        self.assertEquals(2, treadmill.master.Master.load_app.call_count)
+
+        # Duplicate events are coalesced.
+        treadmill.master.Master.reload_allocations.reset_mock()
+        treadmill.master.Master.load_app.reset_mock()
+        zk_content['events'] = {
+            '000-apps-12347': {
+                '.data': """
+                    - xxx.app1#1234
+                    - xxx.app2#2345
+                """
+            },
+            '000-apps-12348': {
+                '.data': """
+                    - xxx.app2#2345
+                """
+            },
+        }
+        self.master.process((
+            '/events', ['000-apps-12347', '000-apps-12348']
+        ))
         treadmill.master.Master.load_app.assert_has_calls([
             mock.call('xxx.app1#1234'),
             mock.call('xxx.app2#2345'),
         ])
+        self.assertEquals(2, treadmill.master.Master.load_app.call_count)
+        self.assertFalse(treadmill.master.Master.reload_allocations.called)
+
+        # Already processed events are not processed again.
+        treadmill.master.Master.load_app.reset_mock()
+        self.master.process((
+            '/events', ['000-apps-12347', '000-apps-12348']
+        ))
+        self.assertFalse(treadmill.master.Master.load_app.called)
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
+    @mock.patch('treadmill.master.Master.reload_servers', mock.Mock())
+    def test_process_events_servers(self):
+        """Tests coalescing of server events with reload all event."""
+        zk_content = {
+            'events': {
+                '000-servers-12345': {
+                    '.data': """
+                        - srv1
+                    """
+                },
+                '000-servers-12346': {},
+            },
+            'servers': {
+                'srv2': {},
+            },
+        }
+
+        self.make_mock_zk(zk_content)
+        self.master.process((
+            '/events', ['000-servers-12345', '000-servers-12346']
+        ))
+
+        treadmill.master.Master.reload_servers.assert_called_once_with(
+            set(['srv1', 'srv2'])
+        )
+
+    @mock.patch('time.time', mock.Mock(return_value=100))
+    def test_event_queue(self):
+        """Tests coalescing and priority of the event queue."""
+        queue = master.EventQueue()
+        queue.put('/scheduled', ['app1'])
+        queue.put('/events', ['000-apps-1', '001-cell-2'])
+        time.time.return_value = 101
+        queue.put('/scheduled', ['app1', 'app2'])
+        queue.put('/server.presence', ['srv1'])
+
+        self.assertEquals(4, queue.depth())
+        self.assertEquals(('/server.presence', ['srv1'], 101), queue.get())
+        self.assertEquals(('/events', ['000-apps-1', '001-cell-2'], 100),
+                          queue.get())
+        # Latest children, time of the first event.
+        self.assertEquals(('/scheduled', ['app1', 'app2'], 100), queue.get())
+        self.assertRaises(IndexError, queue.get)
+
+        time.time.return_value = 103
+        queue.done(100)
+        metrics = queue.metrics()
+        self.assertEquals(4, metrics['received'])
+        self.assertEquals(1, metrics['coalesced'])
+        self.assertEquals(4, metrics['max_depth'])
+        self.assertEquals(3, metrics['latency_max'])
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.create', mock.Mock())
@@ -0,0 +1,67 @@
+"""Unit test for treadmill.nameindex.
+"""
+
+import fnmatch
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+from treadmill import nameindex
+
+
+_NAMES = [
+    'proid.foo#0000000001',
+    'proid.foo#0000000002',
+    'proid.foobar#0000000003',
+    'proid.bar#0000000004',
+    'other.foo#0000000005',
+]
+
+
+class NameIndexTest(unittest.TestCase):
+    """Tests for teadmill.nameindex."""
+
+    def test_literal_prefix(self):
+        """Test literal prefix of the pattern."""
+        self.assertEquals('proid.foo', nameindex.literal_prefix('proid.foo*'))
+        self.assertEquals('proid.', nameindex.literal_prefix('proid.[fb]*'))
+        self.assertEquals('', nameindex.literal_prefix('?roid.foo'))
+        self.assertEquals('proid.foo#1',
+                          nameindex.literal_prefix('proid.foo#1'))
+
+    def test_filter(self):
+        """Test filtering matches fnmatch."""
+        names = sorted(_NAMES)
+        for pattern in ['proid.foo*', 'proid.foo#*', '*.foo#*', 'proid.*',
+                        'proid.[b]*', 'proid.foo#0000000001', 'x*']:
+            expected = [name for name in names
+                        if fnmatch.fnmatch(name, pattern)]
+            self.assertEquals(expected,
+                              nameindex.filter_sorted(names, pattern))
+            self.assertEquals(expected,
+                              nameindex.filter_names(names, pattern))
+
+        self.assertEquals(names, nameindex.filter_sorted(names, None))
+
+    def test_index(self):
+        """Test maintaining the index."""
+        index = nameindex.NameIndex(_NAMES)
+        self.assertEquals(['proid.foo#0000000001', 'proid.foo#0000000002'],
+                          index.match('proid.foo#*'))
+
+        index.update(['proid.foo#0000000006'], ['proid.foo#0000000001'])
+        index.add('proid.foo#0000000002')
+        self.assertEquals(['proid.foo#0000000002', 'proid.foo#0000000006'],
+                          index.match('proid.foo#*'))
+        self.assertIn('proid.bar#0000000004', index)
+        self.assertNotIn('proid.foo#0000000001', index)
+
+        # Many changes rebuild the index.
+        index.update(['a', 'b', 'c'], ['proid.bar#0000000004'])
+        self.assertEquals(['a', 'b', 'c'], index.match('?'))
+        self.assertEquals(7, len(index))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+"""Unit test for treadmill.placement.
+"""
+
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+import kazoo
+import kazoo.client
+import mock
+
+from treadmill import placement
+from treadmill.test import mockzk
+
+
+class _ContentWriter(object):
+    """zkutils.BatchWriter writing into the mock Zookeeper content."""
+
+    def __init__(self, zk_content):
+        self.zk_content = zk_content
+
+    def _node(self, path, create=False):
+        """Returns parent node and name of the node."""
+        components = path.split('/')[1:]
+        parent = self.zk_content
+        for component in components[:-1]:
+            if create:
+                parent = parent.setdefault(component, {})
+            else:
+                parent = parent[component]
+        return parent, components[-1]
+
+    def put(self, path, data):
+        """Set node data."""
+        parent, name = self._node(path, create=True)
+        parent.setdefault(name, {})['.data'] = data
+
+    def delete(self, path):
+        """Delete the node."""
+        parent, name = self._node(path)
+        del parent[name]
+
+
+class PlacementTest(mockzk.MockZookeeperTestCase):
+    """Mock test for treadmill.placement."""
+
+    def setUp(self):
+        super(PlacementTest, self).setUp()
+        self.zk_content = {'placement-shards': {}}
+        self.writer = _ContentWriter(self.zk_content)
+        self.watches = {}
+
+    def _zkclient(self):
+        """Returns Zookeeper client, recording children watches."""
+        zkclient = kazoo.client.KazooClient()
+
+        def children_watch(path):
+            """Record the watch function."""
+            def _decorator(func):
+                """Register the watch."""
+                self.watches[path] = func
+                return func
+            return _decorator
+
+        zkclient.ChildrenWatch = children_watch
+        return zkclient
+
+    def _notify(self, shard):
+        """Invoke shard children watch."""
+        path = '/placement-shards/%s' % shard
+        children = [child for child in self.zk_content['placement-shards'][
+            shard] if not child.startswith('.')]
+        self.watches[path](children)
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_publish_watch(self):
+        """Test publishing deltas and applying them in the watch."""
+        self.make_mock_zk(self.zk_content)
+        zkclient = self._zkclient()
+
+        publisher = placement.PlacementPublisher(zkclient)
+        publisher.load()
+        publisher.publish(self.writer, [
+            ('foo.app#1', None, 'srv1'),
+            ('foo.app#2', None, None),
+            ('bar.app#1', None, 'srv2'),
+        ], full=True)
+
+        changes = []
+        watch = placement.PlacementWatch(
+            zkclient,
+            shard_filter=lambda shard: shard == 'foo',
+            on_change=lambda changed, removed: changes.append(
+                (changed, removed)))
+        watch.start()
+        self.watches['/placement-shards'](['foo', 'bar'])
+        self._notify('foo')
+
+        self.assertEquals({'foo.app#1': 'srv1', 'foo.app#2': None},
+                          watch.placement)
+        self.assertEquals(1, watch.versions['foo'])
+        self.assertNotIn('bar', watch.versions)
+
+        # Only changes of the shard are published.
+        publisher.publish(self.writer, [
+            ('foo.app#2', None, 'srv3'),
+            ('bar.app#1', 'srv2', 'srv2'),
+        ])
+        self.assertIn('0000000002', self.zk_content['placement-shards']['foo'])
+        self.assertNotIn('0000000002',
+                         self.zk_content['placement-shards']['bar'])
+
+        del changes[:]
+        self._notify('foo')
+        self.assertEquals([({'foo.app#2': 'srv3'}, ['foo.app#1'])], changes)
+        self.assertEquals({'foo.app#2': 'srv3'}, watch.placement)
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('treadmill.placement.MAX_DELTAS', 2)
+    def test_compaction(self):
+        """Test that reader which is behind reloads the compacted base."""
+        self.make_mock_zk(self.zk_content)
+        zkclient = self._zkclient()
+
+        publisher = placement.PlacementPublisher(zkclient)
+        publisher.publish(self.writer, [('foo.app#1', None, 'srv1')])
+
+        watch = placement.PlacementWatch(zkclient)
+        watch.subscribe('foo')
+        self._notify('foo')
+        self.assertEquals({'foo.app#1': 'srv1'}, watch.placement)
+
+        for idx in xrange(2, 8):
+            publisher.publish(self.writer,
+                              [('foo.app#1', None, 'srv%s' % idx)])
+
+        # Old deltas are deleted, the latest one is always kept.
+        shard = self.zk_content['placement-shards']['foo']
+        self.assertNotIn('0000000002', shard)
+        self.assertIn('0000000007', shard)
+
+        self._notify('foo')
+        self.assertEquals({'foo.app#1': 'srv7'}, watch.placement)
+        self.assertEquals(7, watch.versions['foo'])
+
+        # Master restart continues with the next version.
+        publisher = placement.PlacementPublisher(zkclient)
+        publisher.load()
+        publisher.publish(self.writer, [('foo.app#1', None, 'srv7')],
+                          full=True)
+        self.assertIn('0000000008', shard)
+        self._notify('foo')
+        self.assertEquals({'foo.app#1': 'srv7'}, watch.placement)
+        self.assertEquals(8, watch.versions['foo'])
+
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_compaction_during_update(self):
+        """Test that deltas following the reloaded base are applied."""
+        self.make_mock_zk(self.zk_content)
+        zkclient = self._zkclient()
+
+        publisher = placement.PlacementPublisher(zkclient)
+        publisher.publish(self.writer, [('foo.app#1', None, 'srv1')])
+
+        watch = placement.PlacementWatch(zkclient)
+        watch.subscribe('foo')
+        self._notify('foo')
+        self.assertEquals(1, watch.versions['foo'])
+
+        for idx in xrange(2, 5):
+            publisher.publish(self.writer,
+                              [('foo.app#1', None, 'srv%s' % idx)])
+
+        get_many_raw = placement.zkutils.get_many_raw
+
+        def _compact(zkclient, paths):
+            """Fold delta 2 into the base before the deltas are read."""
+            if '/placement-shards/foo/0000000002' in paths:
+                self.writer.put(
+                    '/placement-shards/foo',
+                    placement._encode({  # pylint: disable=W0212
+                        'version': 2,
+                        'placement': {'foo.app#1': 'srv2'},
+                    })
+                )
+                self.writer.delete('/placement-shards/foo/0000000002')
+            return get_many_raw(zkclient, paths)
+
+        with mock.patch('treadmill.zkutils.get_many_raw',
+                        mock.Mock(side_effect=_compact)):
+            self._notify('foo')
+
+        self.assertEquals({'foo.app#1': 'srv4'}, watch.placement)
+        self.assertEquals(4, watch.versions['foo'])
+
+
+if __name__ == '__main__':
+    unittest.main()
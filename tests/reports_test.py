@@ -84,6 +84,18 @@ class ReportsTest(unittest.TestCase):
         # XXX(boysson): self.assertEquals(str(df.ix['srv4']['valid_until']),
         # XXX(boysson):                   '1969-12-31 20:06:40')
 
+    def test_buckets(self):
+        """Tests buckets report."""
+        self.cell.members()['srv2'].state = scheduler.State.down
+
+        df = reports.buckets(self.cell)
+        self.assertEquals(df.ix['top']['servers'], 4)
+        self.assertEquals(df.ix['top']['memory'], 40)
+        self.assertEquals(df.ix['top']['free.memory'], 30)
+        self.assertEquals(df.ix['rack:rack1']['level'], 'rack')
+        self.assertEquals(df.ix['rack:rack1']['free.cpu'], 20)
+        self.assertEquals(df.ix['rack:rack2']['free.disk'], 60)
+
     def test_allocations(self):
         """Tests allocations report."""
         df = reports.allocations(self.cell)
@@ -1,101 +1,257 @@
 """Performance test for treadmill.scheduler
+
+Builds synthetic cells and times Cell.schedule() for a sequence of scenarios,
+reporting per-phase timing and placement churn as JSON, so that the results
+can be compared between commits:
+
+    python tests/scheduler_perf.py --servers 2000 --apps 20000 > before.json
 """
 
+import argparse
+import json
+import random
+import sys
+import time
 import timeit
 
 # Disable W0611: Unused import
 import tests.treadmill_test_deps  # pylint: disable=W0611
 
-# XXX(boysson): Test needs update to new Scheduler API
-# XXX: from treadmill import scheduler
-
-
-def schedule(sched):
-    """Helper function to run the scheduler."""
-
-    def _schedule():
-        """Run the scheduler, print some stats."""
-        new_placement = 0
-        evicted = 0
-        for event in sched.schedule():
-            if event.node:
-                new_placement = new_placement + 1
-            else:
-                evicted = evicted + 1
-
-        print 'scheduled: ', new_placement, ', evicted: ', evicted
-
-    interval = timeit.timeit(stmt=_schedule, number=1)
-    print 'time  :', interval
-
-
-# XXX(boysson): Test needs update to new Scheduler API
-# XXX:
-# XXX: def test_reschedule(nodes_count, app_count, attempts, affinity):
-# XXX:     """Add high priority apps on top of low priority with full capacity.
-# XXX:     """
-# XXX:     print 'nodes: %s, apps: %s, attempts: %s' % (nodes_count,
-# XXX:                                                  app_count,
-# XXX:                                                  attempts)
-# XXX:     cell = scheduler.Cell(3)
-# XXX:     for idx in xrange(0, nodes_count):
-# XXX:         node = scheduler.Node('node' + str(idx), [48, 48, 48])
-# XXX:         cell.add_node(node)
-# XXX:
-# XXX:     alloc = scheduler.Allocation([10, 10, 10])
-# XXX:     cell.add_allocation('a1', alloc)
-# XXX:
-# XXX:     sched = scheduler.Scheduler(cell)
-# XXX:
-# XXX:     for attempt in xrange(0, attempts):
-# XXX:         for app_idx in xrange(0, app_count):
-# XXX:             prio = attempt * 5 + random.randint(0, 5)
-# XXX:             demand = [random.randint(1, 48),
-# XXX:                       random.randint(1, 48),
-# XXX:                       random.randint(1, 48)]
-# XXX:             name = 'app_%s.%s' % (attempt, app_idx)
-# XXX:             alloc.add(scheduler.Application(name, prio, demand,
-# XXX:                                             affinity=affinity(app_idx)))
-# XXX:
-# XXX:         schedule(sched)
-
-
-# XXX(boysson): Test needs update to new Scheduler API
-# XXX:
-# XXX: def test_affinity(nodes_count, app_count, affinity_limit):
-# XXX:     """Add more apps than nodes count to test affinity limit algo."""
-# XXX:     print 'node: %s, apps: %s, affinity_limit %s' % (nodes_count,
-# XXX:                                                      app_count,
-# XXX:                                                      affinity_limit)
-# XXX:
-# XXX:     cell = scheduler.Cell(3)
-# XXX:     for idx in xrange(0, nodes_count):
-# XXX:         node = scheduler.Node('node' + str(idx), [48, 48, 48])
-# XXX:         cell.add_node(node)
-# XXX:
-# XXX:     alloc = scheduler.Allocation([10, 10, 10])
-# XXX:     cell.add_allocation('a1', alloc)
-# XXX:     for app_idx in xrange(0, app_count):
-# XXX:         name = '1.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='1'))
-# XXX:         name = '2.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='2'))
-# XXX:         name = '3.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='3'))
-# XXX:
-# XXX:     sched = scheduler.Scheduler(cell)
-# XXX:     schedule(sched)
+from treadmill import scheduler
+
+
+# Capacity of the synthetic servers - memory, cpu, disk.
+_SERVER_CAPACITY = [48, 48, 48]
+
+
+def _strategy_cell(strategy, racks_count, servers_count, app_count, seed):
+    """Build cell using the strategy on all levels, with pending apps."""
+    rand = random.Random(seed)
+    cell = scheduler.Cell('top')
+    cell.set_default_strategy(strategy)
+    for rack_idx in xrange(0, racks_count):
+        rack = scheduler.Bucket('rack:%s' % rack_idx, level='rack')
+        rack.set_default_strategy(strategy)
+        cell.add_node(rack)
+        for srv_idx in xrange(0, servers_count):
+            rack.add_node(scheduler.Server('srv%s.%s' % (rack_idx, srv_idx),
+                                           _SERVER_CAPACITY,
+                                           valid_until=0))
+
+    for app_idx in xrange(0, app_count):
+        demand = [rand.randint(1, 24),
+                  rand.randint(1, 24),
+                  rand.randint(1, 24)]
+        cell.allocation.add(scheduler.Application(
+            'app.%s' % app_idx, rand.randint(1, 100), demand,
+            affinity=str(app_idx % 50)))
+
+    return cell
+
+
+def test_strategies(racks_count, servers_count, app_count, seed=0):
+    """Compare placement quality and time per pass of the strategies."""
+    print 'racks: %s, servers: %s, apps: %s' % (racks_count,
+                                                servers_count,
+                                                app_count)
+    for strategy in sorted(scheduler.STRATEGIES):
+        cell = _strategy_cell(strategy, racks_count, servers_count,
+                              app_count, seed)
+        interval = timeit.timeit(stmt=cell.schedule, number=1)
+
+        servers = cell.members().values()
+        placed = sum(len(server.apps) for server in servers)
+        used = len([server for server in servers if server.apps])
+        # Capacity on servers which can't fit an average app is stranded.
+        stranded = sum(min(server.free_capacity) for server in servers
+                       if min(server.free_capacity) < 12)
+        print '%-10s time: %.3f, placed: %s, used servers: %s, ' \
+              'stranded: %s' % (strategy, interval, placed, used, stranded)
+
+
+class SyntheticCell(object):
+    """Synthetic cell - bucket hierarchy, allocations and apps."""
+
+    def __init__(self, servers_count, app_count, seed=0,
+                 buildings_count=2, racks_count=20, tenants_count=10,
+                 identity_groups_count=5):
+        self.rand = random.Random(seed)
+        self.cell = scheduler.Cell('top')
+        self.allocations = []
+        self.apps_count = 0
+
+        self._build_hierarchy(servers_count, buildings_count, racks_count)
+        self._build_allocations(tenants_count)
+
+        for idx in xrange(0, identity_groups_count):
+            self.cell.configure_identity_group('ident%s' % idx, 100)
+
+        self.add_apps(app_count)
+
+    def _build_hierarchy(self, servers_count, buildings_count, racks_count):
+        """Build cell -> building -> rack -> server hierarchy."""
+        racks = []
+        for building_idx in xrange(0, buildings_count):
+            building = scheduler.Bucket('building:%s' % building_idx,
+                                        level='building')
+            self.cell.add_node(building)
+            for rack_idx in xrange(0, racks_count):
+                rack = scheduler.Bucket(
+                    'rack:%s.%s' % (building_idx, rack_idx), level='rack')
+                building.add_node(rack)
+                racks.append(rack)
+
+        for idx in xrange(0, servers_count):
+            racks[idx % len(racks)].add_node(
+                scheduler.Server('srv%s' % idx, _SERVER_CAPACITY,
+                                 valid_until=time.time() + 10 * 24 * 3600))
+
+    def _build_allocations(self, tenants_count):
+        """Build tenant allocations, each with several leaf allocations."""
+        total = self.cell.size()
+        for tenant_idx in xrange(0, tenants_count):
+            tenant = scheduler.Allocation()
+            self.cell.allocation.add_sub_alloc('tenant%s' % tenant_idx,
+                                               tenant)
+            for alloc_idx in xrange(0, 3):
+                reserved = total * self.rand.uniform(0.005, 0.03)
+                alloc = scheduler.Allocation(reserved, rank=100)
+                tenant.add_sub_alloc('alloc%s' % alloc_idx, alloc)
+                self.allocations.append(alloc)
+
+    def add_apps(self, count, priority=None, demand=None, prefix='app'):
+        """Add apps to random allocations, returns list of apps."""
+        apps = []
+        for _idx in xrange(0, count):
+            self.apps_count += 1
+            affinity = '%s.%s' % (prefix, self.apps_count % 200)
+            app_priority = priority
+            if app_priority is None:
+                app_priority = self.rand.randint(1, 99)
+            app_demand = demand
+            if app_demand is None:
+                app_demand = [self.rand.randint(1, 8),
+                              self.rand.randint(1, 8),
+                              self.rand.randint(1, 8)]
+            identity_group = None
+            if self.rand.random() < 0.05:
+                identity_group = 'ident%s' % self.rand.randint(0, 4)
+
+            app = scheduler.Application(
+                '%s#%010d' % (affinity, self.apps_count),
+                app_priority, app_demand, affinity=affinity,
+                affinity_limits={'server': 4, 'rack': 40},
+                identity_group=identity_group,
+                data_retention_timeout=0)
+            self.cell.add_app(self.rand.choice(self.allocations), app)
+            apps.append(app)
+
+        return apps
+
+    def stats(self):
+        """Returns placed and pending app count."""
+        placed = len([app for app in self.cell.apps.itervalues()
+                      if app.server])
+        return placed, len(self.cell.apps) - placed
+
+
+def _run_phase(synthetic, phase, incremental=False):
+    """Time single scheduler run and count placement churn."""
+    start = time.time()
+    placement = synthetic.cell.schedule(incremental=incremental)
+    seconds = time.time() - start
+
+    new = evicted = moved = 0
+    for _app, before, after in placement:
+        if before == after:
+            continue
+        if before is None:
+            new += 1
+        elif after is None:
+            evicted += 1
+        else:
+            moved += 1
+
+    placed, pending = synthetic.stats()
+    return {
+        'phase': phase,
+        'incremental': incremental,
+        'seconds': round(seconds, 4),
+        'apps': len(synthetic.cell.apps),
+        'placed': placed,
+        'pending': pending,
+        'new': new,
+        'evicted': evicted,
+        'moved': moved,
+    }
+
+
+def run_scenarios(servers_count, app_count, seed=0):
+    """Run all scenarios on single synthetic cell, returns list of phases."""
+    start = time.time()
+    synthetic = SyntheticCell(servers_count, app_count, seed=seed)
+    phases = [{'phase': 'build', 'seconds': round(time.time() - start, 4)}]
+
+    # Cold placement of all apps.
+    phases.append(_run_phase(synthetic, 'cold'))
+
+    # Steady state - nothing changed.
+    phases.append(_run_phase(synthetic, 'steady'))
+    phases.append(_run_phase(synthetic, 'steady', incremental=True))
+
+    # Few new apps.
+    synthetic.add_apps(max(1, app_count / 100))
+    phases.append(_run_phase(synthetic, 'new-apps', incremental=True))
+
+    # Allocation change reorders the queue.
+    for alloc in synthetic.rand.sample(synthetic.allocations,
+                                       len(synthetic.allocations) / 3):
+        alloc.update(alloc.reserved * 2, alloc.rank)
+    phases.append(_run_phase(synthetic, 'alloc-change', incremental=True))
+
+    # Servers down, apps are moved as data retention timeout is 0.
+    servers = synthetic.cell.members().values()
+    for server in synthetic.rand.sample(servers, len(servers) / 20):
+        server.state = scheduler.State.down
+    phases.append(_run_phase(synthetic, 'server-down', incremental=True))
+
+    # Mass eviction - high priority apps on top of a full cell.
+    synthetic.add_apps(max(1, servers_count / 5), priority=100,
+                       demand=[24, 24, 24], prefix='prio')
+    phases.append(_run_phase(synthetic, 'mass-eviction', incremental=True))
+
+    # Steady state after eviction.
+    phases.append(_run_phase(synthetic, 'settle', incremental=True))
+
+    return phases
+
+
+def main():
+    """Run the benchmark, write results as JSON to stdout."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--servers', type=int, default=2000)
+    parser.add_argument('--apps', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategies', action='store_true',
+                        help='Compare placement strategies instead.')
+    args = parser.parse_args()
+
+    scheduler.DIMENSION_COUNT = 3
+
+    if args.strategies:
+        test_strategies(10, args.servers / 10, args.apps, seed=args.seed)
+        return
+
+    result = {
+        'servers': args.servers,
+        'apps': args.apps,
+        'seed': args.seed,
+        'phases': run_scenarios(args.servers, args.apps, seed=args.seed),
+    }
+    json.dump(result, sys.stdout, indent=4, sort_keys=True,
+              separators=(',', ': '))
+    sys.stdout.write('\n')
 
 
 if __name__ == '__main__':
-    pass
-# XXX:     test_reschedule(500, 1000, 5, affinity=lambda idx: None)
-# XXX:     test_reschedule(1000, 1000, 3, affinity=str)
-# XXX:     test_reschedule(1000, 3000, 3, affinity=lambda idx: str(idx % 5))
-# XXX:     test_affinity(500, 1000, 1)
+    main()
@@ -364,6 +364,66 @@ class NodeTest(unittest.TestCase):
         self.assertIn(apps2[2].name, a1_srv.apps)
         self.assertIn(apps2[3].name, b2_srv.apps)
 
+    def test_capacity_strategies(self):
+        """Tests best fit and worst fit strategies."""
+        bucket = scheduler.Bucket('top', features=[])
+        srv_a = scheduler.Server('a', [10, 10], features=[], valid_until=500)
+        srv_b = scheduler.Server('b', [20, 20], features=[], valid_until=500)
+        srv_c = scheduler.Server('c', [30, 30], features=[], valid_until=500)
+        bucket.add_node(srv_a)
+        bucket.add_node(srv_b)
+        bucket.add_node(srv_c)
+
+        bucket.set_affinity_strategy('best', 'bestfit')
+        bucket.set_affinity_strategy('worst', scheduler.WorstFitStrategy)
+
+        best = app_list(3, 'best', 50, [8, 8])
+        worst = app_list(2, 'worst', 50, [5, 5])
+
+        # Least free capacity that fits the app.
+        self.assertTrue(bucket.put(best[0]))
+        self.assertEquals('a', best[0].server)
+        self.assertTrue(bucket.put(best[1]))
+        self.assertEquals('b', best[1].server)
+
+        # Most free capacity.
+        self.assertTrue(bucket.put(worst[0]))
+        self.assertEquals('c', worst[0].server)
+        self.assertTrue(bucket.put(worst[1]))
+        self.assertEquals('c', worst[1].server)
+
+        # Full server is not visited, capacity of removed apps is reused.
+        srv_b.remove(best[1].name)
+        self.assertTrue(bucket.put(best[2]))
+        self.assertEquals('b', best[2].server)
+
+        # Down servers are skipped.
+        srv_c.state = scheduler.State.down
+        self.assertFalse(bucket.put(scheduler.Application(
+            'worst-x', 50, [15, 15], affinity='worst')))
+
+        bucket.remove_node('b')
+        self.assertEquals(
+            [], list(bucket.get_affinity_strategy('best').nodes(best[0])))
+
+    def test_register_strategy(self):
+        """Tests registering new strategies."""
+        bucket = scheduler.Bucket('top', features=[])
+        srv_a = scheduler.Server('a', [10, 10], features=[], valid_until=500)
+        bucket.add_node(srv_a)
+
+        class _TestStrategy(scheduler.PackStrategy):
+            """Test strategy."""
+            pass
+
+        with mock.patch.dict(scheduler.STRATEGIES):
+            scheduler.register_strategy('test', _TestStrategy)
+            bucket.set_default_strategy('test')
+            self.assertIsInstance(bucket.get_affinity_strategy('app1'),
+                                  _TestStrategy)
+
+        self.assertNotIn('test', scheduler.STRATEGIES)
+
     def test_valid_times(self):
         """Tests node valid_until calculation."""
         top = scheduler.Bucket('top', features=['top'])
@@ -553,6 +613,93 @@ class NodeTest(unittest.TestCase):
                            'y': srv_y,
                            'z': srv_z}, top.members())
 
+    def test_members_index(self):
+        """Tests that members index is maintained on all levels."""
+        top = scheduler.Bucket('top')
+        left = scheduler.Bucket('left')
+        right = scheduler.Bucket('right')
+        srv_a = scheduler.Server('a', [1, 1], valid_until=500)
+        srv_b = scheduler.Server('b', [1, 1], valid_until=500)
+        srv_y = scheduler.Server('y', [1, 1], valid_until=500)
+
+        # Servers added before the bucket is attached to the tree.
+        left.add_node(srv_a)
+        left.add_node(srv_b)
+        top.add_node(left)
+        top.add_node(right)
+        right.add_node(srv_y)
+
+        self.assertEquals({'a': srv_a, 'b': srv_b}, left.members())
+        self.assertEquals({'y': srv_y}, right.members())
+        self.assertEquals(['a', 'b', 'y'], sorted(top.members()))
+
+        left.remove_node('b')
+        right.add_node(srv_b)
+        self.assertEquals({'a': srv_a}, left.members())
+        self.assertEquals({'b': srv_b, 'y': srv_y}, right.members())
+        self.assertEquals(['a', 'b', 'y'], sorted(top.members()))
+
+        top.remove_node('right')
+        self.assertEquals({'a': srv_a}, top.members())
+        self.assertEquals({'b': srv_b, 'y': srv_y}, right.members())
+
+        left.reset_children()
+        self.assertEquals({}, left.members())
+        self.assertEquals({}, top.members())
+
+    def test_aggregate_size(self):
+        """Tests that total and free capacity aggregates are maintained."""
+        top = scheduler.Bucket('top')
+        left = scheduler.Bucket('left')
+        right = scheduler.Bucket('right')
+        srv_a = scheduler.Server('a', [10, 10], valid_until=500)
+        srv_b = scheduler.Server('b', [10, 10], valid_until=500)
+        srv_y = scheduler.Server('y', [20, 20], valid_until=500)
+
+        top.add_node(left)
+        top.add_node(right)
+        left.add_node(srv_a)
+        left.add_node(srv_b)
+        right.add_node(srv_y)
+
+        # pylint: disable=W0212
+        self.assertTrue(scheduler._all_isclose(top.size(), [40, 40]))
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [40, 40]))
+
+        app = scheduler.Application('app1', 50, [3, 2], 'app')
+        self.assertTrue(srv_a.put(app))
+        self.assertTrue(scheduler._all_isclose(left.free_size(), [17, 18]))
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [37, 38]))
+        self.assertTrue(scheduler._all_isclose(top.size(), [40, 40]))
+
+        srv_a.state = scheduler.State.down
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [30, 30]))
+        srv_a.remove('app1')
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [30, 30]))
+        srv_a.state = scheduler.State.up
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [40, 40]))
+
+        top.remove_node('right')
+        self.assertTrue(scheduler._all_isclose(top.size(), [20, 20]))
+        self.assertTrue(scheduler._all_isclose(top.free_size(), [20, 20]))
+
+        left.remove_node('a')
+        left.remove_node('b')
+        self.assertTrue(
+            scheduler._all_isclose(top.free_size(), [0, 0]))
+        self.assertTrue(
+            scheduler._all_lt(top.size(), [1, 1]))
+
+        # Empty buckets do not leave anything in the totals.
+        top.remove_node('left')
+        self.assertTrue(np.array_equal(top._size, [0, 0]))
+        empty = scheduler.Bucket('empty')
+        top.add_node(empty)
+        empty.add_node(srv_a)
+        top.remove_node('empty')
+        self.assertTrue(np.array_equal(top._size, [0, 0]))
+        self.assertTrue(np.array_equal(empty._size, [10, 10]))
+
     def test_affinity_counters(self):
         """Tests affinity counters."""
         top = scheduler.Bucket('top', features=['top'])
@@ -893,10 +1040,55 @@ class CellTest(unittest.TestCase):
 
         cell.schedule()
 
-        # TODO: need to implement serialization.
-        #
-        # data = scheduler.dumps(cell)
-        # cell1 = scheduler.loads(data)
+        left.set_affinity_strategy('app', 'pack')
+        srv_z.state = scheduler.State.frozen
+        alloc = scheduler.Allocation([5, 5], rank=10, features=['a'])
+        cell.allocation.add_sub_alloc('tenant', alloc)
+        cell.configure_identity_group('ident', 2)
+        ident_app = scheduler.Application('ident-app', 70, [2, 2], 'ident',
+                                          identity_group='ident',
+                                          data_retention_timeout=None)
+        cell.add_app(alloc, ident_app)
+        cell.schedule()
+
+        data = scheduler.dumps(cell)
+        cell1 = scheduler.loads(data)
+
+        self.assertEquals(['left', 'right'], cell1.children.keys())
+        self.assertEquals(sorted(cell.members()), sorted(cell1.members()))
+        self.assertEquals('rack', cell1.children['left'].level)
+        self.assertEquals(scheduler.State.frozen,
+                          cell1.members()['z'].state)
+        self.assertIsInstance(
+            cell1.children['left'].get_affinity_strategy('app'),
+            scheduler.PackStrategy)
+        # pylint: disable=W0212
+        self.assertTrue(scheduler._all_isclose(cell.size(), cell1.size()))
+
+        alloc1 = cell1.allocation.get_sub_alloc('tenant')
+        self.assertEquals(10, alloc1.rank)
+        self.assertEquals(set(['a']), alloc1.features)
+        self.assertTrue(scheduler._all_isclose(alloc1.reserved, [5, 5]))
+
+        self.assertEquals(
+            {name: (app.server, app.identity, app.allocation.name)
+             for name, app in cell.apps.iteritems()},
+            {name: (app.server, app.identity, app.allocation.name)
+             for name, app in cell1.apps.iteritems()})
+        self.assertEquals({'server': 1, 'rack': 1},
+                          dict(cell1.apps['app-0'].affinity.limits))
+        self.assertIsNone(cell1.apps['ident-app'].data_retention_timeout)
+        self.assertEquals(
+            cell.identity_groups['ident'].available,
+            cell1.identity_groups['ident'].available)
+        for server in cell.members().values():
+            self.assertEquals(sorted(server.apps),
+                              sorted(cell1.members()[server.name].apps))
+
+        # Loaded cell schedules the same way.
+        self.assertEquals(cell.schedule(), cell1.schedule())
+
+        self.assertRaises(ValueError, scheduler.loads, 'garbage')
 
     def test_identity(self):
         """Tests scheduling apps with identity."""
@@ -1021,6 +1213,191 @@ class CellTest(unittest.TestCase):
         self.assertEquals(len([app for app in large_apps if app.evicted]), 1)
         self.assertEquals(len([app for app in large_apps if app.server]), 9)
 
+    def test_eviction_cost(self):
+        """Tests that apps are evicted from the cheapest server."""
+        cell = scheduler.Cell('top')
+        for name in ['a', 'b']:
+            server = scheduler.Server(name, [10, 10], features=[],
+                                      valid_until=time.time() + 1000)
+            cell.add_node(server)
+
+        app_a1 = scheduler.Application('a1', 40, [5, 5], 'app')
+        app_a2 = scheduler.Application('a2', 10, [5, 5], 'app')
+        app_b1 = scheduler.Application('b1', 30, [8, 8], 'app')
+        app_b2 = scheduler.Application('b2', 20, [1, 1], 'app')
+        for app in [app_a1, app_a2, app_b1, app_b2]:
+            cell.add_app(cell.allocation, app)
+        cell.children['a'].put(app_a1)
+        cell.children['a'].put(app_a2)
+        cell.children['b'].put(app_b1)
+        cell.children['b'].put(app_b2)
+
+        # Evicting lowest priority a2 is enough, b1 and b2 are retained.
+        app_high = scheduler.Application('high', 90, [5, 5], 'app')
+        cell.add_app(cell.allocation, app_high)
+        cell.schedule()
+        self.assertEquals('a', app_high.server)
+        self.assertIsNone(app_a2.server)
+        self.assertEquals('a', app_a1.server)
+        self.assertEquals('b', app_b1.server)
+        self.assertEquals('b', app_b2.server)
+
+        # Only b1 needs to be evicted, b2 is kept in place.
+        app_higher = scheduler.Application('higher', 95, [3, 3], 'app')
+        cell.add_app(cell.allocation, app_higher)
+        cell.schedule()
+        self.assertEquals('b', app_higher.server)
+        self.assertIsNone(app_b1.server)
+        self.assertEquals('b', app_b2.server)
+        self.assertFalse(app_b2.evicted)
+
+
+class IncrementalScheduleTest(unittest.TestCase):
+    """treadmill.scheduler.Cell incremental schedule tests."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 2
+        super(IncrementalScheduleTest, self).setUp()
+
+    def test_queue_cache(self):
+        """Tests that allocation queues are invalidated on change."""
+        alloc = scheduler.Allocation([10, 10])
+        sub_alloc = alloc.get_sub_alloc('sub')
+        app1 = scheduler.Application('app1', 5, [1, 1], 'app1')
+        sub_alloc.add(app1)
+
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEquals(1, queue[0][2])
+        self.assertIs(queue[0][-1], list(alloc.utilization_queue(
+            [20., 20.]))[0][-1])
+
+        app1.server = 'abc'
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEquals(0, queue[0][2])
+
+        app2 = scheduler.Application('app2', 10, [2, 2], 'app1')
+        sub_alloc.add(app2)
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEquals(['app2', 'app1'],
+                          [item[-1].name for item in queue])
+        self.assertEquals(set(['app1', 'app2']), alloc.added)
+
+        app2.priority = 1
+        self.assertTrue(alloc.reordered)
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEquals(['app1', 'app2'],
+                          [item[-1].name for item in queue])
+
+    def test_incremental(self):
+        """Tests that only new apps are placed in incremental mode."""
+        cell = scheduler.Cell('top')
+        for idx in xrange(0, 2):
+            server = scheduler.Server(str(idx), [10, 10], features=[],
+                                      valid_until=time.time() + 1000)
+            cell.add_node(server)
+
+        large_apps = app_list(3, 'large', 50, [6, 6])
+        for app in large_apps:
+            cell.add_app(cell.allocation, app)
+
+        cell.schedule(incremental=True)
+        self.assertEquals(2, len([app for app in large_apps if app.server]))
+
+        small_apps = app_list(2, 'small', 40, [1, 1])
+        for app in small_apps:
+            cell.add_app(cell.allocation, app)
+
+        with mock.patch('treadmill.scheduler.Cell.put',
+                        side_effect=scheduler.Cell.put,
+                        autospec=True) as cell_put:
+            cell.schedule(incremental=True)
+            # Pending large app is not retried, as nothing changed and there
+            # is nothing it can evict.
+            self.assertEquals(
+                ['small-0', 'small-1'],
+                sorted(call[0][1].name for call in cell_put.call_args_list)
+            )
+
+        self.assertTrue(all(app.server for app in small_apps))
+
+        # Server going down is handled with full schedule.
+        down_server = large_apps[0].server
+        cell.children[down_server].state = scheduler.State.down
+        cell.schedule(incremental=True)
+        self.assertNotEquals(down_server, large_apps[0].server)
+
+
+class FeasibilityMatrixTest(unittest.TestCase):
+    """treadmill.scheduler.FeasibilityMatrix tests."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 2
+        super(FeasibilityMatrixTest, self).setUp()
+
+    def test_capacity_views(self):
+        """Tests that server capacity is tracked in the matrix."""
+        cell = scheduler.Cell('top', feasibility=True)
+        bucket = scheduler.Bucket('bucket')
+        cell.add_node(bucket)
+
+        # Force the matrix to grow.
+        servers = [scheduler.Server('s' + str(idx), [10, 10],
+                                    valid_until=time.time() + 1000)
+                   for idx in xrange(0, 100)]
+        for server in servers:
+            bucket.add_node(server)
+
+        matrix = cell.feasibility
+        self.assertEquals(100, len(matrix.rows))
+
+        app = scheduler.Application('app1', 50, [4, 6], 'app')
+        self.assertTrue(servers[70].put(app))
+        row = matrix.rows['s70']
+        self.assertTrue(np.array_equal(matrix.capacity[row], [6., 4.]))
+
+        large = scheduler.Application('large', 50, [8, 8], 'app')
+        self.assertFalse(matrix.feasible(large)[row])
+        self.assertEquals(99, np.count_nonzero(matrix.feasible(large)))
+
+        servers[70].remove(app.name)
+        self.assertTrue(matrix.feasible(large)[row])
+
+        servers[71].state = scheduler.State.down
+        self.assertFalse(matrix.feasible(large)[matrix.rows['s71']])
+
+        bucket.remove_node('s70')
+        self.assertNotIn('s70', matrix.rows)
+        self.assertIsNone(servers[70].feasibility)
+        self.assertTrue(np.array_equal(servers[70].free_capacity, [10., 10.]))
+
+    def test_skip_infeasible(self):
+        """Tests that bucket descends only into children that fit."""
+        cell = scheduler.Cell('top', feasibility=True)
+        left = scheduler.Bucket('left', features=[])
+        right = scheduler.Bucket('right', features=[])
+        cell.add_node(left)
+        cell.add_node(right)
+
+        # Element-wise max of left bucket capacity is [10, 10], yet neither
+        # of the servers can fit [6, 6] app.
+        srv_a = scheduler.Server('a', [10, 2], valid_until=500)
+        srv_b = scheduler.Server('b', [2, 10], valid_until=500)
+        srv_y = scheduler.Server('y', [10, 10], valid_until=500)
+        left.add_node(srv_a)
+        left.add_node(srv_b)
+        right.add_node(srv_y)
+
+        self.assertFalse(cell.feasibility.fits(left, scheduler.Application(
+            'probe', 50, [6, 6], 'app')))
+
+        with mock.patch('treadmill.scheduler.Bucket.put',
+                        side_effect=scheduler.Bucket.put,
+                        autospec=True) as bucket_put:
+            app = scheduler.Application('app1', 50, [6, 6], 'app')
+            self.assertTrue(cell.put(app))
+            self.assertEquals(app.server, 'y')
+            self.assertNotIn(mock.call(left, app), bucket_put.call_args_list)
+
 
 class IdentityGroupTest(unittest.TestCase):
     """scheduler IdentityGroup test."""
@@ -37,6 +37,16 @@ class WebSocketBaseTestCase(AsyncHTTPTestCase):
 
         zkclient_mock = mock.Mock()
         zkclient_mock.get_children = mock.MagicMock(return_value=ALL_NODES)
+
+        def children_watch(path):
+            """Invoke the watch with the current children."""
+            def _decorator(func):
+                """Register the watch."""
+                func(zkclient_mock.get_children(path))
+                return func
+            return _decorator
+
+        zkclient_mock.ChildrenWatch = children_watch
         context.ZkContext.conn = zkclient_mock
 
         AsyncHTTPTestCase.setUp(self)
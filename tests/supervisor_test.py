@@ -0,0 +1,65 @@
+"""Unit test for supervisor - s6 services control.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+from treadmill import supervisor
+
+
+class SupervisorTest(unittest.TestCase):
+    """Tests for teadmill.supervisor."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.readers = []
+
+    def tearDown(self):
+        for reader in self.readers:
+            os.close(reader)
+        if self.root and os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+    def _supervise(self, svc_dir):
+        """Create the control FIFO and read it, as s6-supervise does."""
+        os.makedirs(os.path.join(svc_dir, 'supervise'))
+        control = os.path.join(svc_dir, 'supervise', 'control')
+        os.mkfifo(control)
+        reader = os.open(control, os.O_RDONLY | os.O_NONBLOCK)
+        self.readers.append(reader)
+        return reader
+
+    def test_control_services(self):
+        """Test sending commands to the supervised services."""
+        foo = os.path.join(self.root, 'foo')
+        bar = os.path.join(self.root, 'bar')
+        os.mkdir(bar)
+        foo_reader = self._supervise(foo)
+
+        # bar is not supervised.
+        self.assertEquals(
+            set([bar]),
+            supervisor.control_services([foo, bar], 'uO', timeout=0.1)
+        )
+        self.assertEquals('uO', os.read(foo_reader, 100))
+
+        # bar is picked up by the supervisor while waiting.
+        timer = threading.Timer(0.1, self._supervise, args=(bar,))
+        timer.start()
+        self.assertEquals(
+            set(),
+            supervisor.control_services([foo, bar], 'd', timeout=5)
+        )
+        timer.join()
+        self.assertEquals('d', os.read(foo_reader, 100))
+        self.assertEquals('d', os.read(self.readers[-1], 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
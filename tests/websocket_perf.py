@@ -0,0 +1,203 @@
+"""Load test for the state websocket server.
+
+Runs the state websocket handler against a local Zookeeper stand-in, with
+thousands of concurrent websocket subscribers in the same process. Changes
+of /running are published from a separate thread, as kazoo does, and the
+time until every subscriber received its deltas is reported as JSON:
+
+    python tests/websocket_perf.py --clients 2000 --changes 20 > before.json
+
+Every client holds two sockets, raise the open files limit accordingly.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+from tornado import gen
+from tornado import httpserver
+from tornado import ioloop
+from tornado import netutil
+from tornado import web
+from tornado import websocket
+
+from treadmill import context
+from treadmill import state_wshandler
+
+
+class _AsyncResult(object):
+    """Completed kazoo async result."""
+
+    def __init__(self, value=None, exception=None):
+        self.value = value
+        self.exception = exception
+
+    def get(self, block=True, timeout=None):
+        """Returns the value or raises the exception."""
+        del block
+        del timeout
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def rawlink(self, callback):
+        """Invoke callback, the result is complete already."""
+        callback(self)
+
+
+class LocalZk(object):
+    """Zookeeper stand-in, children watches and node data in memory."""
+
+    def __init__(self):
+        self.nodes = dict()
+        self.watches = dict()
+        self.lock = threading.Lock()
+
+    def ChildrenWatch(self, path):  # pylint: disable=C0103
+        """Register the watch and invoke it with the current children."""
+        def _decorator(func):
+            """Register the watch."""
+            self.watches.setdefault(path, []).append(func)
+            func(self.get_children(path))
+            return func
+        return _decorator
+
+    def get_children(self, path, watch=None):
+        """Returns children of the node."""
+        del watch
+        with self.lock:
+            return sorted(self.nodes.get(path, {}))
+
+    def get(self, path, watch=None):
+        """Returns (data, metadata) of the node."""
+        del watch
+        parent, _sep, name = path.rpartition('/')
+        with self.lock:
+            return self.nodes.get(parent, {}).get(name), None
+
+    def get_async(self, path, watch=None):
+        """Async get."""
+        return _AsyncResult(value=self.get(path, watch))
+
+    def set_children(self, path, children):
+        """Replace children of the node and fire the watches."""
+        with self.lock:
+            self.nodes[path] = dict((child, None) for child in children)
+        for watch in self.watches.get(path, []):
+            watch(sorted(children))
+
+
+@gen.coroutine
+def _client(url, pattern, expected, ready, arrivals):
+    """Subscribe to running apps, wait for expected number of created apps.
+
+    Records (seq, time) of every delta received.
+    """
+    conn = yield websocket.websocket_connect(url)
+    conn.write_message(json.dumps({
+        'cell': 'perf',
+        'state': 'running',
+        'pattern': pattern,
+        'deltas': True,
+    }))
+    yield conn.read_message()
+    ready.append(pattern)
+
+    created = 0
+    while created < expected:
+        message = yield conn.read_message()
+        if message is None:
+            break
+        delta = json.loads(message)
+        arrivals.append((delta['seq'], time.time()))
+        created += len(delta['created'])
+
+    conn.close()
+
+
+def _publish(zkclient, apps, changes, published):
+    """Start every app once per change, from a separate thread."""
+    running = []
+    for change in xrange(0, changes):
+        running.extend('proid.app%d#%010d' % (app, change)
+                       for app in xrange(0, apps))
+        # Cell cache loads empty /running, the first change is seq 1.
+        published[change + 1] = time.time()
+        zkclient.set_children('/running', list(running))
+
+
+@gen.coroutine
+def run(clients, apps, changes):
+    """Run the load test, returns the results."""
+    zkclient = LocalZk()
+    zkclient.set_children('/running', [])
+    context.GLOBAL.cell = 'perf'
+    context.ZkContext.conn = zkclient
+
+    sockets = netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    server = httpserver.HTTPServer(web.Application([
+        (r'/state', state_wshandler.StateWebSocketHandler),
+    ]))
+    server.add_sockets(sockets)
+    url = 'ws://127.0.0.1:%d/state' % port
+
+    start = time.time()
+    ready = []
+    arrivals = []
+    subscribers = [
+        _client(url, 'proid.app%d#*' % (idx % apps), changes, ready, arrivals)
+        for idx in xrange(0, clients)
+    ]
+
+    # Wait until every client has received the SOW.
+    while len(ready) < clients:
+        yield gen.sleep(0.01)
+    connected = time.time()
+
+    published = dict()
+    publisher = threading.Thread(target=_publish,
+                                 args=(zkclient, apps, changes, published))
+    publisher.start()
+    yield subscribers
+    finished = time.time()
+    publisher.join()
+
+    server.stop()
+
+    latency = sorted(arrival - published[seq] for seq, arrival in arrivals)
+    raise gen.Return({
+        'clients': clients,
+        'apps': apps,
+        'changes': changes,
+        'connect_seconds': round(connected - start, 4),
+        'fanout_seconds': round(finished - connected, 4),
+        'messages': len(arrivals),
+        'latency_avg': round(sum(latency) / max(1, len(latency)), 4),
+        'latency_p99': round(latency[int(len(latency) * 0.99)], 4),
+        'latency_max': round(latency[-1], 4),
+    })
+
+
+def main():
+    """Run the load test, write results as JSON to stdout."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--apps', type=int, default=100)
+    parser.add_argument('--changes', type=int, default=10)
+    args = parser.parse_args()
+
+    result = ioloop.IOLoop.current().run_sync(
+        lambda: run(args.clients, args.apps, args.changes))
+    json.dump(result, sys.stdout, indent=4, sort_keys=True,
+              separators=(',', ': '))
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Unit test for treadmill.wsgiserver.
+"""
+
+import errno
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+import urllib2
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+import flask
+import mock
+from tornado import testing
+
+from treadmill import context
+from treadmill import wsgiserver
+
+
+class LatencyStatsTest(unittest.TestCase):
+    """Tests for teadmill.wsgiserver.LatencyStats."""
+
+    def test_histograms(self):
+        """Test recording latency histograms."""
+        stats = wsgiserver.LatencyStats(
+            [('/v3/state/', 'GET'), ('/v3/state/', 'POST')],
+            buckets=(0.1, 1.0)
+        )
+        stats.record(('/v3/state/', 'GET'), 0.05)
+        stats.record(('/v3/state/', 'GET'), 0.5)
+        stats.record(('/v3/state/', 'GET'), 2.0)
+        stats.record(('/unknown', 'GET'), 2.0)
+
+        histograms = stats.histograms()
+        self.assertEquals(['/v3/state/'], histograms.keys())
+        self.assertEquals(['GET'], histograms['/v3/state/'].keys())
+
+        histogram = histograms['/v3/state/']['GET']
+        self.assertEquals(3, histogram['count'])
+        self.assertAlmostEquals(2.55, histogram['sum'])
+        self.assertEquals({'0.1': 1, '1.0': 2, '+Inf': 3},
+                          histogram['buckets'])
+
+
+class ThreadedWSGIContainerTest(testing.AsyncHTTPTestCase):
+    """Tests for teadmill.wsgiserver.ThreadedWSGIContainer."""
+
+    def get_app(self):
+        self.app = flask.Flask(__name__)
+        self.slow = threading.Event()
+        self.slow_started = threading.Event()
+
+        @self.app.route('/slow')
+        def _slow():
+            """Block until the fast request is served."""
+            self.slow_started.set()
+            self.slow.wait(5)
+            return 'slow'
+
+        @self.app.route('/fast')
+        def _fast():
+            """Unblock the slow request."""
+            self.slow.set()
+            return 'fast'
+
+        @self.app.route('/error')
+        def _error():
+            """Fail."""
+            raise Exception('error')
+
+        self.stats = wsgiserver.install_stats(self.app)
+        return wsgiserver.ThreadedWSGIContainer(self.app, 2, self.io_loop)
+
+    def test_concurrent(self):
+        """Test slow requests do not block other requests."""
+        responses = []
+
+        def _done(response):
+            """Record the response."""
+            responses.append(response.body)
+            if len(responses) == 2:
+                self.stop()
+
+        def _fetch_fast():
+            """Send the fast request once the slow one is being served."""
+            if self.slow_started.is_set():
+                self.http_client.fetch(self.get_url('/fast'), _done)
+            else:
+                self.io_loop.call_later(0.01, _fetch_fast)
+
+        self.http_client.fetch(self.get_url('/slow'), _done)
+        _fetch_fast()
+        self.wait()
+        self.assertEquals(['fast', 'slow'], responses)
+
+        response = self.fetch(wsgiserver.STATS_PATH)
+        histograms = json.loads(response.body)
+        self.assertEquals(1, histograms['/slow']['GET']['count'])
+        self.assertEquals(1, histograms['/fast']['GET']['count'])
+
+    def test_error(self):
+        """Test app errors are returned as internal server error."""
+        self.assertEquals(500, self.fetch('/error').code)
+        self.assertEquals(404, self.fetch('/xxx').code)
+
+
+class ServeTest(unittest.TestCase):
+    """Tests for teadmill.wsgiserver.serve."""
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.worker_state = dict()
+
+        @self.app.route('/pid')
+        def _pid():
+            """Returns pid of the worker and of its initialization."""
+            return flask.jsonify({
+                'pid': os.getpid(),
+                'init_pid': self.worker_state.get('pid'),
+            })
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+
+    def _get(self, path, timeout=5):
+        """GET the path, retry until the server is up."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return json.load(urllib2.urlopen(
+                    'http://127.0.0.1:%d%s' % (self.port, path), timeout=1
+                ))
+            except urllib2.URLError as err:
+                if (getattr(err.reason, 'errno', None) != errno.ECONNREFUSED
+                        or time.time() > deadline):
+                    raise
+                time.sleep(0.05)
+
+    def _worker_init(self):
+        """Record the process which initialized the worker."""
+        self.worker_state['pid'] = os.getpid()
+
+    def test_serve(self):
+        """Test serving by the forked workers."""
+        master_pid = os.fork()
+        if not master_pid:
+            exit_code = 0
+            try:
+                wsgiserver.serve(self.app, self.port, host='127.0.0.1',
+                                 workers=2, threads=2,
+                                 worker_init=self._worker_init)
+            except Exception:  # pylint: disable=W0703
+                exit_code = 1
+            finally:
+                os._exit(exit_code)  # pylint: disable=W0212
+
+        try:
+            response = self._get('/pid')
+            self.assertNotIn(response['pid'], (os.getpid(), master_pid))
+            # Worker is initialized after fork.
+            self.assertEquals(response['pid'], response['init_pid'])
+            self.assertNotIn('pid', self.worker_state)
+        finally:
+            os.kill(master_pid, signal.SIGTERM)
+            _pid, status = os.waitpid(master_pid, 0)
+
+        self.assertEquals(0, status)
+
+    def test_serve_connected(self):
+        """Test that Zookeeper must not be connected before fork."""
+        with mock.patch.object(context.GLOBAL.zk, '_conn', mock.Mock()):
+            with self.assertRaises(AssertionError):
+                wsgiserver.serve(self.app, self.port)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit test for treadmill.zkioloop.
+"""
+
+import threading
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_deps  # pylint: disable=W0611
+
+import kazoo
+import kazoo.client
+import mock
+from tornado import testing
+
+from treadmill import zkioloop
+
+
+class _ThreadAsyncResult(object):
+    """Async result completed on a separate thread, as kazoo does."""
+
+    def __init__(self, value=None, exception=None):
+        self.value = value
+        self.exception = exception
+
+    def get(self):
+        """Returns the value or raises the exception."""
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def rawlink(self, callback):
+        """Invoke callback on a separate thread."""
+        threading.Thread(target=callback, args=(self,)).start()
+
+
+class IOLoopZkTest(testing.AsyncTestCase):
+    """Tests for teadmill.zkioloop."""
+
+    def setUp(self):
+        super(IOLoopZkTest, self).setUp()
+        self.zkclient = mock.Mock()
+        self.zk = zkioloop.IOLoopZk(self.zkclient, self.io_loop)
+
+    @testing.gen_test
+    def test_get(self):
+        """Test results are delivered on the IOLoop."""
+        self.zkclient.get_async.return_value = _ThreadAsyncResult(
+            value=('xxx:123', None))
+        data, _metadata = yield self.zk.get('/endpoints/foo/bar')
+        self.assertEquals('xxx:123', data)
+
+        self.zkclient.get_children_async.return_value = _ThreadAsyncResult(
+            exception=kazoo.client.NoNodeError())
+        with self.assertRaises(kazoo.client.NoNodeError):
+            yield self.zk.get_children('/endpoints/foo')
+
+    def test_callback(self):
+        """Test watch events are delivered on the IOLoop thread."""
+        ioloop_thread = threading.current_thread()
+        calls = []
+
+        def _watch(event):
+            """Record the event and the thread."""
+            calls.append((event, threading.current_thread()))
+            self.stop()
+
+        self.zkclient.exists_async.return_value = _ThreadAsyncResult()
+        self.zk.exists('/running', watch=_watch)
+        watch = self.zkclient.exists_async.call_args[1]['watch']
+
+        threading.Thread(target=watch, args=('event',)).start()
+        self.wait()
+        self.assertEquals([('event', ioloop_thread)], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -161,6 +161,121 @@ class ZkTest(unittest.TestCase):
         kazoo.client.KazooClient.get.return_value = (None, None)
         self.assertIsNone(zkutils.get(client, '/foo'))
 
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    def test_get_many(self):
+        """Test pipelined read of many nodes."""
+        in_flight = []
+        max_in_flight = []
+
+        def get_async(path):
+            """zk.get_async side effect, tracking outstanding requests."""
+            in_flight.append(path)
+            max_in_flight.append(len(in_flight))
+            result = mock.Mock()
+
+            def _get():
+                """Complete the request."""
+                in_flight.remove(path)
+                if path == '/foo/missing':
+                    raise kazoo.client.NoNodeError()
+                return ('{name: %s}' % path, None)
+
+            result.get.side_effect = _get
+            return result
+
+        client = kazoo.client.KazooClient()
+        kazoo.client.KazooClient.get_async.side_effect = get_async
+        paths = ['/foo/%s' % idx for idx in xrange(10)] + ['/foo/missing']
+
+        result = zkutils.get_many(client, paths, max_in_flight=3)
+        self.assertEquals(10, len(result))
+        self.assertEquals({'name': '/foo/7'}, result['/foo/7'])
+        self.assertNotIn('/foo/missing', result)
+        self.assertEquals(3, max(max_in_flight))
+        self.assertEquals([], in_flight)
+
+    @mock.patch('kazoo.client.KazooClient.create_async', mock.Mock())
+    def test_ensure_many_exist(self):
+        """Test pipelined create of many nodes."""
+        def create_async(path, *_args, **_kwargs):
+            """zk.create_async side effect, some nodes exist."""
+            result = mock.Mock()
+            if path == '/foo/1':
+                result.get.side_effect = kazoo.client.NodeExistsError()
+            return result
+
+        client = kazoo.client.KazooClient()
+        kazoo.client.KazooClient.create_async.side_effect = create_async
+        zkutils.ensure_many_exist(client, ['/foo/0', '/foo/1', '/foo/2'],
+                                  max_in_flight=2)
+        kazoo.client.KazooClient.create_async.assert_has_calls([
+            mock.call('/foo/0', '', acl=mock.ANY, makepath=True),
+            mock.call('/foo/1', '', acl=mock.ANY, makepath=True),
+            mock.call('/foo/2', '', acl=mock.ANY, makepath=True),
+        ])
+
+    @mock.patch('kazoo.client.KazooClient.transaction', mock.Mock())
+    def test_batch_writer(self):
+        """Test batching of writes into transactions."""
+        exists = set(['/foo/2'])
+        transactions = []
+
+        def transaction():
+            """zk.transaction side effect, recording the operations."""
+            txn = mock.Mock()
+            txn.ops = []
+            txn.create.side_effect = (
+                lambda path, value, acl: txn.ops.append(('create', path)))
+            txn.set_data.side_effect = (
+                lambda path, value: txn.ops.append(('set', path)))
+            txn.delete.side_effect = (
+                lambda path: txn.ops.append(('delete', path)))
+
+            def commit_async():
+                """Fail the transaction if create/delete fail."""
+                results = []
+                for kind, path in txn.ops:
+                    if kind == 'create' and path in exists:
+                        results.append(kazoo.client.NodeExistsError())
+                    elif kind == 'delete' and path not in exists:
+                        results.append(kazoo.client.NoNodeError())
+                    else:
+                        results.append(True)
+                if any(isinstance(res, Exception) for res in results):
+                    results = [
+                        res if isinstance(res, Exception)
+                        else kazoo.exceptions.RolledBackError()
+                        for res in results
+                    ]
+                result = mock.Mock()
+                result.get.return_value = results
+                return result
+
+            txn.commit_async.side_effect = commit_async
+            transactions.append(txn)
+            return txn
+
+        client = kazoo.client.KazooClient()
+        kazoo.client.KazooClient.transaction.side_effect = transaction
+
+        writer = zkutils.BatchWriter(client, batch_size=2)
+        writer.put('/foo/1', {'x': 1})
+        writer.put('/foo/2')
+        writer.delete('/foo/3')
+        writer.commit()
+
+        self.assertEquals(
+            [
+                [('create', '/foo/1'), ('create', '/foo/2')],
+                [('delete', '/foo/3')],
+                # Batches are pipelined, first batch retried after the
+                # second is sent. Existing node is updated, missing node
+                # delete is dropped.
+                [('create', '/foo/1'), ('set', '/foo/2')],
+            ],
+            [txn.ops for txn in transactions]
+        )
+
     @mock.patch('kazoo.client.KazooClient.create', mock.Mock())
     def test_ensure_exists(self):
         """Tests updating/creating node content."""